@@ -21,10 +21,13 @@ c	Parameters:
 	real	rw(lenrw)	! [1..iw[1]] Non-zero elements of a
 
 c	Local variables:
+	integer b
+	integer i
 	integer i1
 	integer j1
 	integer k
 	integer kk
+	real	yi
 
 c	set the ranges the indices in vector iw
 
@@ -32,6 +35,35 @@ c	set the ranges the indices in vector iw
 	i1=1
 	j1=kk+1
 
+c	lsfit_lsqr stores the 8 non-zero elements of row i at
+c	i, m+i, ..., 7*m+i. With that layout the products are formed row by
+c	row (rows shared among the OpenMP threads; the sum of each row in
+c	the same order as below, so y is the same for any number of
+c	threads) and a(transpose)*y with a reduction over the threads.
+
+	if (kk.eq.8*m .and. m.gt.0 .and. iw(i1+1).eq.1 .and.
+     &	    iw(i1+kk).eq.m) then
+	   if (mode.eq.1) then
+!$omp parallel do default(shared) private(i, b, k, yi)
+	      do i = 1,m
+	         yi = y(i)
+	         do b = 0,7
+	            k = b*m+i
+	            yi = yi + rw(k)*x(iw(j1+k))
+	         enddo
+	         y(i) = yi
+	      enddo
+!$omp end parallel do
+	   else
+!$omp parallel do default(shared) private(k) reduction(+:x)
+	      do k = 1,kk
+	         x(iw(j1+k)) = x(iw(j1+k)) + rw(k)*y(iw(i1+k))
+	      enddo
+!$omp end parallel do
+	   endif
+	   return
+	endif
+
 c	main iteration loop
 
 	do 100 k = 1,kk
@@ -0,0 +1,190 @@
+c Binary differential time files (written by dt_binary.py)
+c
+c Layout (stream access, little endian):
+c   bytes  1- 4  'HDDB'
+c   bytes  5-20  version, kind (1=cc, 2=ct), no. of records, no. of stations
+c   then nrec records of 28 bytes:
+c          ic1, ic2, station index (integer*4), dt1, dt2, weight (real*4),
+c          phase (integer*4, 1=P, 2=S)
+c   then nsta station labels of 7 characters.
+c For cc files dt1 is the delay time and dt2 the origin time correction
+c of the pair, for ct files the two travel times; dt = dt1 - dt2 as in
+c the text files. Records of one event pair follow each other.
+
+	logical function dtbin(fn)
+
+	implicit none
+
+c	Parameters:
+	character	fn*(*)
+
+c	Local variables:
+	integer		ios
+	integer		iunit
+	character	magic*4
+
+      dtbin = .false.
+      call freeunit(iunit)
+      open (iunit,file=fn,status='old',access='stream',
+     &      form='unformatted',iostat=ios)
+      if (ios.ne.0) return
+      read (iunit,iostat=ios) magic
+      close(iunit)
+      if (ios.eq.0 .and. magic.eq.'HDDB') dtbin = .true.
+      return
+      end ! of logical function dtbin
+
+
+c Read a binary cc or ct file. Pairs, stations and phases are selected
+c and stored exactly as getdata does it for the text files, so both
+c formats give identical data arrays.
+
+	subroutine getdtbin(log, fn, kind, nev, icusp, iicusp,
+     &	ev_lat, ev_lon, ev_dep, maxsep, nsta, sta_lab, iphase,
+     &	dt_sta, dt_dt, dt_qual, dt_c1, dt_c2, dt_idx, dt_offs,
+     &	i, np, ns, notc)
+
+	implicit none
+
+	include 'hypoDD.inc'
+
+c	Parameters:
+	integer		log
+	character	fn*(*)
+	integer		kind		! 1 = cross corr, 2 = catalog
+	integer		nev
+	integer		icusp(MAXEVE)	! [1..nev] Sorted event keys
+	integer		iicusp(MAXEVE)	! [1..nev] Sort index
+	real		ev_lat(MAXEVE)
+	real		ev_lon(MAXEVE)
+	real		ev_dep(MAXEVE)
+	real		maxsep
+	integer		nsta
+	character	sta_lab(MAXSTA)*7
+	integer		iphase
+	character	dt_sta(MAXDATA)*7
+	real		dt_dt(MAXDATA)
+	real		dt_qual(MAXDATA)
+	integer		dt_c1(MAXDATA)
+	integer		dt_c2(MAXDATA)
+	integer		dt_idx(MAXDATA)
+	real		dt_offs(MAXDATA)
+	integer		i		! Next free data index
+	integer		np		! No. of P dtimes
+	integer		ns		! No. of S dtimes
+	integer		notc		! No. of pairs without OTC
+
+c	Local variables:
+	integer		bkind
+	real		dlat
+	real		dlon
+	real		dt1, dt2
+	integer		ic1, ic2
+	integer		ifindi
+	integer		ipha
+	integer		irec
+	integer		iskip
+	integer		ista
+	integer		iunit
+	integer		iversion
+	integer		j
+	integer		k1, k2
+	integer		l
+	character	magic*4
+	integer		nrec
+	integer		nbsta
+	real		offs
+	integer		pc1, pc2
+	integer*8	pos
+	real		qual
+	integer		MAXBSTA
+	parameter	(MAXBSTA=20000)
+	character	bsta(MAXBSTA)*7	! Station labels of the file
+	logical		bsta_ok(MAXBSTA)
+	real 		PI
+	parameter	(PI=3.141593)
+	save		bsta, bsta_ok
+
+      call freeunit(iunit)
+      open (iunit,file=fn,status='old',access='stream',
+     &      form='unformatted')
+      read (iunit) magic, iversion, bkind, nrec, nbsta
+      if (iversion.ne.1) stop '>>> Unknown binary dtime file version.'
+      if (bkind.ne.kind) stop '>>> Binary dtime file of wrong type.'
+      if (nbsta.gt.MAXBSTA) stop '>>> Increase MAXBSTA in dtbin.f.'
+
+c--Station table after the records; keep only the stations in sta_lab
+      pos = 21 + 28*int(nrec,8)
+      read (iunit,pos=pos) (bsta(l),l=1,nbsta)
+      do l=1,nbsta
+         bsta_ok(l) = .false.
+         do j=1,nsta
+            if (bsta(l).eq.sta_lab(j)) bsta_ok(l) = .true.
+         enddo
+      enddo
+
+      pc1 = 0
+      pc2 = 0
+      iskip = 1
+      pos = 21
+      do irec=1,nrec
+         if (irec.eq.1) then
+            read (iunit,pos=pos) ic1, ic2, ista, dt1, dt2, qual, ipha
+         else
+            read (iunit) ic1, ic2, ista, dt1, dt2, qual, ipha
+         endif
+         if (irec.eq.1 .or. ic1.ne.pc1 .or. ic2.ne.pc2) then
+c           New event pair, checked like a '#' line
+            pc1 = ic1
+            pc2 = ic2
+            iskip = 0
+            if (kind.eq.1 .and. abs(dt2 + 999).lt.0.001) then
+               write (log,*)'No OTC for ', ic1, ic2, '. Pair skiped'
+               notc = notc+1
+               iskip = 1
+               goto 50
+            endif
+            k1= ifindi(nev,icusp,ic1)
+            k2= ifindi(nev,icusp,ic2)
+            if(k1.eq.0.or.k2.eq.0) then
+               iskip=1
+               goto 50
+            endif
+            dlat= ev_lat(iicusp(k1)) - ev_lat(iicusp(k2))
+            dlon= ev_lon(iicusp(k1)) - ev_lon(iicusp(k2))
+            offs= sqrt( (dlat*111)**2 +
+     &            (dlon*(cos(ev_lat(iicusp(k1))*PI/180)*111))**2 +
+     &            (ev_dep(iicusp(k1))-ev_dep(iicusp(k2)))**2)
+            if(maxsep.gt.0 .and. offs.gt.maxsep) iskip= 1
+         endif
+         if (iskip.eq.1) goto 50
+
+c--Skip far-away stations
+         if (.not.bsta_ok(ista)) goto 50
+
+c--Only accept P or S phase codes
+         if (ipha.eq.1) then
+            if (iphase.eq.2) goto 50
+            dt_idx(i) = 2*kind - 1
+            np = np+1
+         elseif (ipha.eq.2) then
+            if (iphase.eq.1) goto 50
+            dt_idx(i) = 2*kind
+            ns = ns+1
+         else
+            stop '>>> Phase identifier format error.'
+         endif
+         dt_sta(i) = bsta(ista)
+         dt_dt(i) = dt1 - dt2
+         dt_qual(i) = qual
+         dt_c1(i) = ic1
+         dt_c2(i) = ic2
+         dt_offs(i)= offs
+
+         i = i+1
+         if (i.gt.MAXDATA) stop'>>> Increase MAXDATA in hypoDD.inc.'
+50       continue
+      enddo
+      close(iunit)
+      return
+      end ! of subroutine getdtbin
@@ -40,6 +40,7 @@ c        Single source
 c        Mulitple sources
 	 tt1 = 0.0
 	 tt2 = 0.0
+!$omp parallel do default(shared) private(i) firstprivate(tt1, tt2)
          do i=1,ndt
             if (dt_idx(i).eq.1 .or. dt_idx(i).eq.3) then
 c              P phase
@@ -62,6 +63,7 @@ c              S phase
             dt_cal(i) = tt1 - tt2
             dt_res(i) = dt_dt(i) - dt_cal(i)
          enddo
+!$omp end parallel do
       endif
 
       end !of subroutine dtres
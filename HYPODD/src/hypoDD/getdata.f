@@ -79,6 +79,7 @@ c	Local variables:
 	real		clon
 	integer		cusperr(34000)	! [1..nerr] Event keys to not locate
 	character	dattim*25
+	logical		dtbin		! Binary dtime file?
 	doubleprecision	elon(20), elat(20)
 	integer		nerr
 	real		del
@@ -276,6 +277,13 @@ c--Read cross-correlation dtimes
       iiotc = 0
       if ((idata.eq.1.or.idata.eq.3).and.trimlen(fn_cc).gt.1) then
          call freeunit(iunit)
+         if (dtbin(fn_cc)) then
+            call getdtbin(log, fn_cc, 1, nev, icusp, iicusp,
+     &      ev_lat, ev_lon, ev_dep, maxsep_cc, nsta, sta_lab, iphase,
+     &      dt_sta, dt_dt, dt_qual, dt_c1, dt_c2, dt_idx, dt_offs,
+     &      i, nccp, nccs, iiotc)
+            goto 60
+         endif
          open (iunit,file=fn_cc,status='unknown')
 50       read (iunit,'(a)',end=60) line
          if (line(1:1).eq.'#') then
@@ -357,6 +365,13 @@ c--Read catalog P and S absolute times
       if ((idata.eq.2.or.idata.eq.3) .and.
      &   trimlen(fn_ct).gt.1) then
          call freeunit(iunit)
+         if (dtbin(fn_ct)) then
+            call getdtbin(log, fn_ct, 2, nev, icusp, iicusp,
+     &      ev_lat, ev_lon, ev_dep, maxsep_ct, nsta, sta_lab, iphase,
+     &      dt_sta, dt_dt, dt_qual, dt_c1, dt_c2, dt_idx, dt_offs,
+     &      i, nctp, ncts, iiotc)
+            goto 100
+         endif
          open (iunit,file=fn_ct,status='unknown')
 
 90       read (iunit,'(a)',end=100) line
@@ -35,6 +35,9 @@ c	Local variables:
 	real		az
 	real		del
 	real		dist
+	real		sta_ain(MAXEVE)	! [1..nsrc] ain of station i
+	real		sta_az(MAXEVE)	! [1..nsrc] az of station i
+	real		sta_dist(MAXEVE)! [1..nsrc] dist of station i
 	integer		i, j, k
 	integer		iunit		! Output unit number
 	real		pi
@@ -64,8 +67,12 @@ c     Get S velocity model
       enddo
 
 c     Compute epicentral distances, azimuths, angles of incidence,
-c     and P/S-travel times from sources to stations
+c     and P/S-travel times from sources to stations.
+c     With OpenMP the events of a station are shared among the threads;
+c     the source-parameter file is written afterwards in the serial order.
       do i=1,nsta
+!$omp parallel do default(shared) private(j, k, del, dist, az, ain)
+!$omp& schedule(dynamic, 16)
          do j=1,nsrc
             call delaz2(src_lat(j), src_lon(j), sta_lat(i), sta_lon(i), 
      &                 del, dist, az)
@@ -90,14 +97,21 @@ c           Epicentral derivatives
 	    tmp_yp(i,j) = (sin((ain * pi)/180.0) *
      &               cos((az * pi)/180.0))/mod_v(k-1)
 
-c           Write to source-parameter file
-            if (iunit .ne. 0)
-     &         write(iunit,'(i9,2x,f9.4,2x,f9.4,2x,a7,2x,f9.4,
+            sta_dist(j) = dist
+            sta_az(j) = az
+            sta_ain(j) = ain
+         enddo
+!$omp end parallel do
+
+c        Write to source-parameter file
+         if (iunit .ne. 0) then
+            do j=1,nsrc
+               write(iunit,'(i9,2x,f9.4,2x,f9.4,2x,a7,2x,f9.4,
      &         2x,f9.4,2x,f9.4)')
      &         src_cusp(j), src_lat(j), src_lon(j), sta_lab(i), 
-     &         dist, az, ain
-
-         enddo
+     &         sta_dist(j), sta_az(j), sta_ain(j)
+            enddo
+         endif
       enddo
 
       if (iunit .ne. 0) close(iunit)	! Source-parameter file
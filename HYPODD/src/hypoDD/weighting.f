@@ -38,6 +38,8 @@ c	Parameters:
 c	Local variables:
 	character	dattim*25
 	real	dt_tmp(MAXDATA)
+c	static like in the serial build, not on the stack of an OpenMP build
+	save	dt_tmp
 	integer	i, j, k
 	real	mad_cc
 	real	mad_ct
@@ -67,6 +69,7 @@ c s=linspace(0.0,2.0,101); ss= (1./(2.^s)); plot(s,ss); % pick qual
 c all the quality transf is done in getdata. old format listed qualities,
 c new format list weights directly.
       ineg= 0  		!flag, =1 if neg weights exist
+!$omp parallel do default(shared) private(i, j) reduction(max:ineg)
       do i=1,ndt
           if(dt_idx(i).eq.1)
      & dt_wt(i)= wt_ccp * dt_qual(i)	! compat. with new format
@@ -84,6 +87,7 @@ c new format list weights directly.
              endif
           enddo
       enddo
+!$omp end parallel do
 
 c--- re-weighting: :
       if(((idata.eq.1.or.idata.eq.3).and.
@@ -153,6 +157,8 @@ c--- apply residual/offset dependent weights to a priori weights
          nnct= 0
          ncc= 0
          nct= 0
+!$omp parallel do default(shared) private(i)
+!$omp& reduction(+:ncc, nct, nncc, nnct)
          do i=1,ndt
             if(dt_idx(i).le.2) then
 c--- cross data:
@@ -194,6 +200,7 @@ c plot(abs(s),ss);  axis([0 0.11 -0.1 1]);
                if(dt_wt(i).lt.minwght) nnct= nnct+1
             endif
          enddo
+!$omp end parallel do
 
 c--- check if neg residuals exist
          ineg= 0
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
 import json
+import os
+
+from cc_store import CCResultStore, DEFAULT_STORE, import_cc_results, threshold_summary
 
 # Load the cross-correlation results
 with open('hypodd_cross_correlation_results.json', 'r') as f:
@@ -37,4 +40,16 @@ print("Only 2 events were relocated, which means:")
 print("1. Most event pairs had correlation coefficients below 0.5 (your threshold)")
 print("2. Events may be too far apart or not well-connected")
 print("3. Waveform quality may be poor for cross-correlation")
-print("4. Your HypoDD parameters may be too restrictive") 
\ No newline at end of file
+print("4. Your HypoDD parameters may be too restrictive")
+
+# Threshold sweep from the stored results, no need to re-run the correlation.
+# dt.cc for the chosen threshold: python cc_store.py --threshold 0.3
+if not os.path.exists(DEFAULT_STORE):
+    with CCResultStore() as store:
+        import_cc_results('hypodd_cross_correlation_results.json',
+                          'hypodd_working/working_files/events.json',
+                          'hypodd_working/input_files/dt.ct', store)
+print("\nThreshold sweep (pairs/events with at least 4 cc links, MINLNK):")
+print("Threshold | dt lines | pairs | events")
+for t, row in threshold_summary([0.2, 0.3, 0.4, 0.5, 0.6, 0.7], min_links=4).items():
+    print(f"{t:9.2f} | {row['dt']:8d} | {row['pairs']:5d} | {row['events']:6d}")
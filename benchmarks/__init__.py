@@ -0,0 +1,7 @@
+"""
+Reproducible performance benchmarks for the relocation pipeline.
+
+synthetic.py writes a synthetic catalog (Nordic hyp.out, STATION0.hyp,
+StationXML and MiniSEED) and run_benchmarks.py times every pipeline stage
+on it and stores the results as JSON.
+"""
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Time and memory of writing the relocated catalog (relocated_catalog.py)
+for a large synthetic catalog.
+
+Writes a QuakeML input with N events (one origin, one magnitude and
+--picks picks each), the matching events.json and a hypoDD.reloc
+relocating every event, then writes the relocated catalog in each
+format. Every format runs in its own process so the peak resident
+memory it reports is its own. As a baseline the same QuakeML is
+written the ObsPy way (read_events, add an origin per event, write) for
+--baseline-events events, since that holds the whole catalog in memory.
+Run from the repository root:
+
+    python -m benchmarks.catalog_output --events 100000
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from benchmarks.run_benchmarks import _max_rss_mb, resource
+import relocated_catalog
+
+CENTER_LAT = 72.3
+CENTER_LON = 126.0
+START = datetime(2016, 1, 1)
+
+
+def make_inputs(work_dir, n_events, n_picks=10, seed=42):
+    """
+    Write input.xml, events.json and hypoDD.reloc for n_events events to
+    work_dir
+    """
+    rng = np.random.default_rng(seed)
+    lat = CENTER_LAT + rng.uniform(-0.5, 0.5, n_events)
+    lon = CENTER_LON + rng.uniform(-1.0, 1.0, n_events)
+    depth = rng.uniform(2.0, 30.0, n_events)
+    mag = rng.uniform(0.5, 4.0, n_events)
+    times = [START + timedelta(seconds=60.0 * i + rng.uniform(0, 59)) for i in range(n_events)]
+    ids = [f"smi:local/event/{t.strftime('%Y%m%d%H%M%S%f')[:16]}{i}" for i, t in enumerate(times)]
+
+    with open(os.path.join(work_dir, "input.xml"), "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<quakeml xmlns="http://quakeml.org/xmlns/quakeml/1.2">\n'
+                '<eventParameters publicID="smi:local/eventParameters">\n')
+        for i in range(n_events):
+            key = ids[i].rsplit("/", 1)[1]
+            picks = "".join(
+                f'<pick publicID="smi:local/pick/{key}_{k}"><time><value>'
+                f'{(times[i] + timedelta(seconds=2.0 + k)).isoformat()}Z</value></time>'
+                f'<waveformID networkCode="XX" stationCode="S{k:03d}" channelCode="HHZ"/>'
+                f'<phaseHint>{"P" if k % 2 == 0 else "S"}</phaseHint></pick>'
+                for k in range(n_picks))
+            f.write(f'<event publicID="{ids[i]}">'
+                    f'<preferredOriginID>smi:local/origin/{key}</preferredOriginID>'
+                    f'<origin publicID="smi:local/origin/{key}">'
+                    f'<time><value>{times[i].isoformat()}Z</value></time>'
+                    f'<latitude><value>{lat[i]:.4f}</value></latitude>'
+                    f'<longitude><value>{lon[i]:.4f}</value></longitude>'
+                    f'<depth><value>{depth[i] * 1000:.0f}</value></depth></origin>'
+                    f'<magnitude publicID="smi:local/magnitude/{key}">'
+                    f'<mag><value>{mag[i]:.1f}</value></mag></magnitude>'
+                    f'{picks}</event>\n')
+        f.write("</eventParameters>\n</quakeml>\n")
+
+    with open(os.path.join(work_dir, "events.json"), "w") as f:
+        json.dump([{"event_id": ids[i], "origin_time": times[i].isoformat(),
+                    "origin_latitude": float(lat[i]), "origin_longitude": float(lon[i]),
+                    "origin_depth": float(depth[i] * 1000), "magnitude": float(mag[i]),
+                    "picks": []} for i in range(n_events)], f)
+
+    # Relocations a few hundred metres off the catalog, SVD-like errors
+    shift = rng.normal(0.0, 0.3, (n_events, 3))
+    with open(os.path.join(work_dir, "hypoDD.reloc"), "w") as f:
+        for i in range(n_events):
+            t = times[i] + timedelta(seconds=rng.normal(0.0, 0.05))
+            f.write(f"{i + 1:9d} {lat[i] + shift[i, 1] / 111.19:10.6f} "
+                    f"{lon[i] + shift[i, 0] / 111.19 / 0.3:11.6f} {depth[i] + shift[i, 2]:9.3f} "
+                    f"{shift[i, 0] * 1000:10.1f} {shift[i, 1] * 1000:10.1f} "
+                    f"{shift[i, 2] * 1000:10.1f} {40.0:8.1f} {40.0:8.1f} {80.0:8.1f} "
+                    f"{t.year:4d} {t.month:2d} {t.day:2d} {t.hour:2d} {t.minute:2d} "
+                    f"{t.second + t.microsecond / 1e6:6.2f} {mag[i]:4.1f} "
+                    f"{20:5d} {12:5d} {30:5d} {18:5d} {12.3:6.1f} {25.1:6.1f} {1:3d}\n")
+    return n_events
+
+
+def obspy_catalog(input_quakeml, reloc_file, events_file, output):
+    """
+    The in-memory way: read the whole catalog, add the origins, write it
+    """
+    from obspy import read_events, UTCDateTime
+    from obspy.core.event import Origin
+
+    catalog = read_events(input_quakeml, format="QUAKEML")
+    ids = relocated_catalog.event_ids(events_file)
+    by_id = {e.resource_id.id: e for e in catalog}
+    for row in relocated_catalog.iter_reloc(reloc_file):
+        event = by_id.get(ids[row["id"]])
+        if event is None:
+            continue
+        origin = Origin(time=UTCDateTime(row["time"]), latitude=row["lat"],
+                        longitude=row["lon"], depth=row["depth"] * 1000.0)
+        event.origins.append(origin)
+        event.preferred_origin_id = origin.resource_id
+    catalog.write(output, format="QUAKEML")
+    return len(catalog)
+
+
+def _child(conn, func, args):
+    t0 = time.perf_counter()
+    n = func(*args)
+    conn.send((time.perf_counter() - t0, _max_rss_mb(resource.RUSAGE_SELF) if resource else None, n))
+    conn.close()
+
+
+def measure(func, *args):
+    """
+    (seconds, peak RSS in MB, return value) of func run in a fresh process
+    """
+    context = multiprocessing.get_context("fork")
+    parent, child = context.Pipe()
+    process = context.Process(target=_child, args=(child, func, args))
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time and memory of the streaming relocated-catalog writer")
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--picks", type=int, default=10, help="picks per event")
+    parser.add_argument("--baseline-events", type=int, default=10000,
+                        help="events for the ObsPy baseline (0 to skip)")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="catalog_output_")
+    try:
+        t0 = time.perf_counter()
+        make_inputs(work_dir, args.events, args.picks)
+        input_mb = os.path.getsize(os.path.join(work_dir, "input.xml")) / 2**20
+        print(f"Synthetic catalog: {args.events} events, {args.picks} picks each, "
+              f"QuakeML {input_mb:.0f} MB ({time.perf_counter() - t0:.1f} s)")
+        reloc = os.path.join(work_dir, "hypoDD.reloc")
+        events = os.path.join(work_dir, "events.json")
+        quakeml = os.path.join(work_dir, "input.xml")
+
+        formats = ["quakeml", "csv", "geojson"]
+        try:
+            import pyarrow  # noqa: F401
+            formats.append("parquet")
+        except ImportError:
+            print("pyarrow not installed, Parquet skipped")
+
+        print(f"{'writer':>17} | {'events':>7} | {'seconds':>8} | {'events/s':>9} | "
+              f"{'peak RSS MB':>11} | {'output MB':>9}")
+        rows = [(fmt, args.events, fmt) for fmt in formats]
+        if args.baseline_events:
+            rows.append(("obspy", args.baseline_events, "quakeml"))
+        for name, n_events, fmt in rows:
+            input_file = quakeml
+            if name == "obspy" and n_events != args.events:
+                sub_dir = os.path.join(work_dir, "baseline")
+                os.makedirs(sub_dir)
+                make_inputs(sub_dir, n_events, args.picks)
+                input_file = os.path.join(sub_dir, "input.xml")
+                reloc_file = os.path.join(sub_dir, "hypoDD.reloc")
+                events_file = os.path.join(sub_dir, "events.json")
+            else:
+                reloc_file, events_file = reloc, events
+            output = os.path.join(work_dir, f"out_{name}.{fmt}")
+            if name == "obspy":
+                seconds, rss, _ = measure(obspy_catalog, input_file, reloc_file,
+                                          events_file, output)
+                label = "obspy Catalog"
+            else:
+                seconds, rss, _ = measure(relocated_catalog.write_relocated_catalog, work_dir,
+                                          output, fmt, input_file, reloc_file, events_file)
+                label = f"streaming {fmt}"
+            print(f"{label:>17} | {n_events:7d} | {seconds:8.2f} | {n_events / seconds:9.0f} | "
+                  f"{rss if rss is not None else float('nan'):11.0f} | "
+                  f"{os.path.getsize(output) / 2**20:9.1f}")
+        return 0
+    finally:
+        if args.keep:
+            print(f"Work directory kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+The cross-correlation work queue (cc_workqueue.py) on one machine, with
+local worker processes standing in for nodes.
+
+Writes a synthetic working directory (benchmarks/synthetic.py catalog
+and waveforms, events.json, dt.ct linking every event to its next
+--neighbours events), then:
+
+    reference  run_cc_pipeline(schedule="station") in one process
+    queue      export the pairs in --unit-size units, start one worker
+               and kill it (SIGKILL) as soon as it holds a lease, then
+               coordinate with --workers local workers, which must
+               requeue the dead worker's lease to finish
+
+and checks that both dt.cc files hold the same pairs and differential
+times (the station-major reference writes the pairs in the order it
+finishes them, the queue in dt.ct order). Run from the repository root:
+
+    python -m benchmarks.cc_workqueue_local --events 40 --workers 3
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import subprocess
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   "hypodd_cli.py")
+
+
+def make_working_dir(data_dir, working_dir, n_events, n_stations=6, neighbours=4):
+    """
+    Synthetic catalog with waveforms and the working_files/events.json
+    and input_files/dt.ct the correlation needs; returns the waveform
+    directory
+    """
+    from obspy import read_events
+    from benchmarks.synthetic import generate_catalog
+    import nordic2quakeml
+    from fix_quakeml import fix_quakeml
+
+    paths = generate_catalog(data_dir, n_events, n_stations, waveforms=True)
+    raw = os.path.join(data_dir, "catalog.xml")
+    fixed = os.path.join(data_dir, "catalog_fixed.xml")
+    nordic2quakeml.main(paths["hyp_out"], raw)
+    fix_quakeml(raw, fixed)
+    events = []
+    for event in read_events(fixed):
+        origin = event.origins[0]
+        events.append({
+            "event_id": str(event.resource_id),
+            "origin_time": str(origin.time),
+            "origin_latitude": origin.latitude,
+            "origin_longitude": origin.longitude,
+            "origin_depth": origin.depth,
+            "magnitude": event.magnitudes[0].mag if event.magnitudes else None,
+            "picks": [{"id": str(p.resource_id), "pick_time": str(p.time),
+                       "pick_time_error": None, "phase": p.phase_hint,
+                       "station_id": f"{p.waveform_id.network_code}.{p.waveform_id.station_code}"}
+                      for p in event.picks],
+        })
+    os.makedirs(os.path.join(working_dir, "working_files"))
+    os.makedirs(os.path.join(working_dir, "input_files"))
+    with open(os.path.join(working_dir, "working_files", "events.json"), "w") as f:
+        json.dump(events, f)
+    with open(os.path.join(working_dir, "input_files", "dt.ct"), "w") as f:
+        for ev1 in range(1, len(events) + 1):
+            for ev2 in range(ev1 + 1, min(ev1 + neighbours, len(events)) + 1):
+                f.write(f"#{ev1:10d}{ev2:10d}\n")
+    return paths["wav_dir"]
+
+
+def read_dt_cc(filename):
+    """
+    dt.cc as {header line: observation lines}
+    """
+    pairs = {}
+    with open(filename, "r") as f:
+        for line in f:
+            if line.startswith("#"):
+                lines = pairs[line] = []
+            else:
+                lines.append(line)
+    return pairs
+
+
+def kill_first_worker(queue_dir, heartbeat, timeout=300.0):
+    """
+    Start a worker and SIGKILL it once it holds a lease; returns the unit
+    it left leased
+    """
+    leases = os.path.join(queue_dir, "leases")
+    worker = subprocess.Popen([sys.executable, CLI, "cc-worker", queue_dir,
+                               "--worker-id", "doomed", "--heartbeat", str(heartbeat),
+                               "--poll", "0.2"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    t0 = time.monotonic()
+    while not os.listdir(leases):
+        if worker.poll() is not None or time.monotonic() - t0 > timeout:
+            raise RuntimeError("The first worker never claimed a unit")
+        time.sleep(0.05)
+    os.kill(worker.pid, signal.SIGKILL)
+    worker.wait()
+    return os.listdir(leases)[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Work queue correlation with local workers against one process")
+    parser.add_argument("--events", type=int, default=40)
+    parser.add_argument("--neighbours", type=int, default=4)
+    parser.add_argument("--unit-size", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--heartbeat", type=float, default=1.0)
+    parser.add_argument("--lease-timeout", type=float, default=5.0)
+    parser.add_argument("--keep", action="store_true", help="keep the work directory")
+    args = parser.parse_args(argv)
+
+    from cc_pipeline import run_cc_pipeline
+    from cc_workqueue import export_units, coordinate
+    from waveform_index import WaveformIndex
+
+    work_dir = tempfile.mkdtemp(prefix="cc_workqueue_")
+    try:
+        reference = os.path.join(work_dir, "reference")
+        wav_dir = make_working_dir(os.path.join(work_dir, "data"), reference,
+                                   args.events, neighbours=args.neighbours)
+        sharded = os.path.join(work_dir, "sharded")
+        shutil.copytree(reference, sharded)
+
+        waveform_index = WaveformIndex()
+        waveform_index.add_directory(wav_dir)
+        t0 = time.perf_counter()
+        run_cc_pipeline(reference, waveform_index, schedule="station")
+        reference_seconds = time.perf_counter() - t0
+
+        queue = export_units(sharded, unit_size=args.unit_size, waveform_dirs=[wav_dir])
+        t0 = time.perf_counter()
+        killed = kill_first_worker(queue.queue_dir, args.heartbeat)
+        print(f"Killed a worker holding {killed}")
+        coordinate(sharded, lease_timeout=args.lease_timeout, poll=0.5,
+                   local_workers=args.workers, heartbeat=args.heartbeat)
+        queue_seconds = time.perf_counter() - t0
+
+        expected = read_dt_cc(os.path.join(reference, "input_files", "dt.cc"))
+        got = read_dt_cc(os.path.join(sharded, "input_files", "dt.cc"))
+        print(f"one process: {reference_seconds:.1f} s, queue with {args.workers} workers "
+              f"(one killed worker, {args.lease_timeout:.0f} s lease timeout): "
+              f"{queue_seconds:.1f} s on {os.cpu_count()} CPUs")
+        if got != expected:
+            print("DIFFERENT: dt.cc of the queue differs from the one-process run")
+            return 1
+        print(f"Same {len(expected)} pairs and differential times in both dt.cc")
+        return 0
+    finally:
+        if args.keep:
+            print(f"Work directory kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Check that the binary dt.cc/dt.ct format relocates bit-identically to
+the text files, and time both.
+
+Builds hypoDD from HYPODD/src/hypoDD with the relocator's compile flags
+(gfortran, no optimisation), relocates the input_files of a working
+directory once from the text files and once from their binary form
+(dt_binary.py), compares the output files both runs write (hypoDD.reloc,
+.loc, .sta, and .res/.src if enabled) byte for byte and reports the best
+wall time of each. Without a working directory the input is a synthetic
+cluster with dt.ct and dt.cc (benchmarks/openmp_scaling.py).
+
+hypoDD ends with a Fortran STOP, exit status 0, when it cannot relocate
+(e.g. "Event ID must be unique"), so a run whose hypoDD.out has a STOP
+or whose hypoDD.reloc is empty fails the check. Run from the repository
+root:
+
+    python -m benchmarks.check_dt_binary --events 200 --repeats 3
+    python -m benchmarks.check_dt_binary hypodd_working
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+import tempfile
+
+from dt_binary import convert_dt_file, set_dt_files, KIND_CC, KIND_CT
+from velocity_sweep import input_file_names
+
+HYPODD_SRC = "HYPODD"
+OUTPUTS = ("hypoDD.reloc", "hypoDD.loc", "hypoDD.res", "hypoDD.sta", "hypoDD.src")
+
+
+def build_hypodd(build_dir, src_root=HYPODD_SRC, inc_file=None, fflags="",
+                 fc="gfortran", openmp=False):
+    """
+    Compile the bundled hypoDD in build_dir and return the executable.
+    inc_file replaces include/hypoDD.inc (e.g. the array sizes the
+    relocator used, bin/hypoDD.inc of a working directory); openmp
+    builds the OpenMP version (make OPENMP=1).
+    """
+    shutil.copytree(os.path.join(src_root, "include"), os.path.join(build_dir, "include"))
+    src = os.path.join(build_dir, "src", "hypoDD")
+    shutil.copytree(os.path.join(src_root, "src", "hypoDD"), src)
+    if inc_file:
+        shutil.copy(inc_file, os.path.join(build_dir, "include", "hypoDD.inc"))
+    command = ["make", f"FC={fc}", f"FFLAGS=-I../../include {fflags}".strip()]
+    if openmp:
+        command.append("OPENMP=1")
+    result = subprocess.run(command, cwd=src, capture_output=True, text=True)
+    if result.returncode:
+        sys.stderr.write(result.stdout[-2000:] + result.stderr[-2000:])
+        raise RuntimeError("hypoDD build failed")
+    return os.path.join(src, "hypoDD")
+
+
+def prepare_runs(working_dir, run_root):
+    """
+    Two run directories with the same inputs, one with text and one with
+    binary dt files
+    """
+    input_dir = os.path.join(working_dir, "input_files")
+    with open(os.path.join(input_dir, "hypoDD.inp"), "r") as f:
+        lines = f.read().splitlines()
+    names = input_file_names(lines)
+    text_dir = os.path.join(run_root, "text")
+    binary_dir = os.path.join(run_root, "binary")
+    for run_dir in (text_dir, binary_dir):
+        os.makedirs(run_dir)
+        for name in names[2:4]:
+            shutil.copy(os.path.join(input_dir, name), run_dir)
+    for name in names[:2]:
+        shutil.copy(os.path.join(input_dir, name), text_dir)
+    shutil.copy(os.path.join(input_dir, "hypoDD.inp"), text_dir)
+    convert_dt_file(os.path.join(input_dir, names[0]),
+                    os.path.join(binary_dir, "dt.cc.bin"), KIND_CC)
+    convert_dt_file(os.path.join(input_dir, names[1]),
+                    os.path.join(binary_dir, "dt.ct.bin"), KIND_CT)
+    with open(os.path.join(binary_dir, "hypoDD.inp"), "w") as f:
+        f.write("\n".join(set_dt_files(lines, "dt.cc.bin", "dt.ct.bin")) + "\n")
+    return text_dir, binary_dir
+
+
+def run_timed(hypodd, run_dir, repeats):
+    best = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        with open(os.path.join(run_dir, "hypoDD.out"), "w") as out:
+            subprocess.run([hypodd, "hypoDD.inp"], cwd=run_dir, stdout=out,
+                           stderr=subprocess.STDOUT, check=True)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_failure(run_dir):
+    """
+    Why a hypoDD run did not relocate anything, or None if it did
+    """
+    out_file = os.path.join(run_dir, "hypoDD.out")
+    if os.path.exists(out_file):
+        with open(out_file, "r", errors="replace") as f:
+            for line in f:
+                if line.strip().startswith("STOP"):
+                    return f"hypoDD stopped: {line.strip()}"
+    reloc = os.path.join(run_dir, "hypoDD.reloc")
+    if not os.path.exists(reloc) or not os.path.getsize(reloc):
+        return "hypoDD.reloc is missing or empty"
+    return None
+
+
+def compare_outputs(dir_a, dir_b):
+    """
+    Names of the output files that differ (or exist in only one run)
+    """
+    differ = []
+    for name in OUTPUTS:
+        a, b = os.path.join(dir_a, name), os.path.join(dir_b, name)
+        if os.path.exists(a) != os.path.exists(b):
+            differ.append(name)
+        elif os.path.exists(a):
+            with open(a, "rb") as fa, open(b, "rb") as fb:
+                if fa.read() != fb.read():
+                    differ.append(name)
+    return differ
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare text and binary dt input of the bundled hypoDD")
+    parser.add_argument("working_dir", nargs="?",
+                        help="relocate this working directory instead of a synthetic cluster")
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--keep", action="store_true", help="keep the build directory")
+    args = parser.parse_args(argv)
+
+    build_dir = tempfile.mkdtemp(prefix="hypodd_dtbin_")
+    try:
+        working_dir = args.working_dir
+        inc_file = None
+        if working_dir:
+            inc_file = os.path.join(working_dir, "bin", "hypoDD.inc")
+            if not os.path.exists(inc_file):
+                inc_file = None
+        else:
+            from benchmarks.openmp_scaling import make_cluster
+            working_dir = os.path.join(build_dir, "synthetic")
+            n_dt = make_cluster(os.path.join(working_dir, "input_files"), args.events,
+                                cc=True)
+            print(f"Synthetic cluster: {args.events} events, {n_dt} differential times "
+                  "in dt.ct and dt.cc")
+        hypodd = build_hypodd(build_dir, inc_file=inc_file)
+        text_dir, binary_dir = prepare_runs(working_dir, os.path.join(build_dir, "runs"))
+        text_seconds = run_timed(hypodd, text_dir, args.repeats)
+        binary_seconds = run_timed(hypodd, binary_dir, args.repeats)
+        differ = compare_outputs(text_dir, binary_dir)
+        print(f"text   {text_seconds:7.2f} s")
+        print(f"binary {binary_seconds:7.2f} s")
+        failures = [f"{name}: {reason}" for name, reason in
+                    (("text", run_failure(text_dir)), ("binary", run_failure(binary_dir)))
+                    if reason]
+        if failures:
+            print("FAILED, nothing relocated to compare: " + "; ".join(failures))
+            return 1
+        if differ:
+            print("DIFFERENT: " + ", ".join(differ))
+            return 1
+        with open(os.path.join(text_dir, "hypoDD.reloc"), "r") as f:
+            n_relocated = sum(1 for line in f if line.strip())
+        print(f"{n_relocated} events relocated; outputs identical: " + ", ".join(
+            n for n in OUTPUTS if os.path.exists(os.path.join(text_dir, n))))
+        return 0
+    finally:
+        if args.keep:
+            print(f"Build and runs kept in {build_dir}")
+        else:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
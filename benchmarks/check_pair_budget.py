@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Check the units of pair_budget.event_distance_km.
+
+events.json stores origin_depth in m, event.dat in km. The check
+computes the distance of two events of the checked-in hypodd_working
+(records copied from its events.json, events 1 and 70 of event.dat:
+10.800 and 4.200 km deep) and, if a working directory is given, of
+every consecutive event pair of its events.json against the distance
+from its event.dat. Run from the repository root:
+
+    python -m benchmarks.check_pair_budget [hypodd_working]
+"""
+import os
+import sys
+import json
+import math
+import argparse
+
+from pair_budget import KM_PER_DEGREE, event_distance_km
+
+# From hypodd_working/working_files/events.json (picks left out)
+EVENT_1 = {"event_id": "smi:local/event/2016080307365450", "magnitude": 0.0,
+           "origin_time": "2016-08-03T07:36:05.500000Z", "origin_latitude": 72.79,
+           "origin_longitude": 127.098, "origin_depth": 10800.0}
+EVENT_70 = {"event_id": "smi:local/event/2016090304015579", "magnitude": 0.0,
+            "origin_time": "2016-09-03T04:01:05.800000Z", "origin_latitude": 71.728,
+            "origin_longitude": 129.286, "origin_depth": 4200.0}
+
+
+def km_distance(lat_1, lon_1, depth_1, lat_2, lon_2, depth_2):
+    """
+    The same flat-earth distance, depths in km as in event.dat
+    """
+    dx = (lon_2 - lon_1) * KM_PER_DEGREE * math.cos(math.radians((lat_1 + lat_2) / 2.0))
+    dy = (lat_2 - lat_1) * KM_PER_DEGREE
+    return math.sqrt(dx * dx + dy * dy + (depth_2 - depth_1) ** 2)
+
+
+def read_event_dat(filename):
+    """
+    [(lat, lon, depth in km)] of an event.dat, in file order
+    """
+    rows = []
+    with open(filename, "r") as f:
+        for line in f:
+            v = line.split()
+            if len(v) >= 5:
+                rows.append((float(v[2]), float(v[3]), float(v[4])))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the depth units of pair_budget")
+    parser.add_argument("working_dir", nargs="?")
+    args = parser.parse_args(argv)
+
+    failures = 0
+    expected = km_distance(72.79, 127.098, 10.8, 71.728, 129.286, 4.2)
+    got = event_distance_km(EVENT_1, EVENT_70)
+    print(f"events 1 and 70: {got:.3f} km, expected {expected:.3f} km")
+    if abs(got - expected) > 1e-6:
+        failures += 1
+
+    if args.working_dir:
+        with open(os.path.join(args.working_dir, "working_files", "events.json"), "r") as f:
+            events = json.load(f)
+        rows = read_event_dat(os.path.join(args.working_dir, "input_files", "event.dat"))
+        if len(rows) != len(events):
+            print(f"event.dat has {len(rows)} events, events.json {len(events)}")
+            return 1
+        worst = 0.0
+        for i in range(len(events) - 1):
+            worst = max(worst, abs(event_distance_km(events[i], events[i + 1]) -
+                                   km_distance(*rows[i], *rows[i + 1])))
+        # event.dat rounds the coordinates to 4 decimals and the depth to m
+        print(f"{len(events) - 1} consecutive pairs: largest difference "
+              f"{worst * 1000.0:.1f} m against event.dat")
+        if worst > 0.05:
+            failures += 1
+
+    if failures:
+        print("FAILED: event_distance_km does not take origin_depth in m")
+        return 1
+    print("event_distance_km takes origin_depth in m")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Check that a daemon cycle keeps the cross-correlation data of its base.
+
+Starts a RelocationDaemon from a finished relocator working directory
+(by default the checked-in hypodd_working, which has cc_files but no
+result store), drops a copy of the first event of --hyp-file, 0.1 s
+later, into its drop directory and runs one cycle with an empty
+waveform directory. The cycle correlates the new pairs and rewrites
+dt.cc from the result store; every pair and line of the base dt.cc
+must still be in it. Run from the repository root:
+
+    python -m benchmarks.check_relocation_daemon [hypodd_working]
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+
+from relocation_daemon import RelocationDaemon, split_blocks
+
+
+def read_dt_cc(filename):
+    """
+    dt.cc as {(id_1, id_2): [observation lines]}
+    """
+    pairs = {}
+    with open(filename, "r") as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0].startswith("#"):
+                ids = [parts[0][1:]] + parts[1:] if parts[0] != "#" else parts[1:]
+                lines = pairs[(int(ids[0]), int(ids[1]))] = []
+            else:
+                lines.append((parts[0], round(float(parts[1]), 6),
+                              round(float(parts[2]), 4), parts[3]))
+    return pairs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check that a daemon cycle keeps the base dt.cc pairs")
+    parser.add_argument("base_dir", nargs="?", default="hypodd_working")
+    parser.add_argument("--hyp-file", default="hyp.out")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="daemon_check_")
+    try:
+        drop_dir = os.path.join(work_dir, "drop")
+        waveforms = os.path.join(work_dir, "waveforms")
+        os.makedirs(drop_dir)
+        os.makedirs(waveforms)
+        block = split_blocks(args.hyp_file)[0]
+        # The same event 0.1 s later (the event id is built from the
+        # origin time) links to the original
+        header = block[0]
+        seconds = float(header[15:20]) + 0.1
+        block[0] = f"{header[:15]}{seconds:5.1f}{header[20:]}"
+        with open(os.path.join(drop_dir, "new_event.nor"), "w") as f:
+            f.write("\n".join(block) + "\n\n")
+
+        live_dir = os.path.join(work_dir, "live")
+        daemon = RelocationDaemon(live_dir, args.base_dir, drop_dir=drop_dir,
+                                  waveform_dirs=[waveforms], settle=0.0)
+        summary = daemon.cycle()
+        print(f"cycle: {summary['new_events']} new events, {summary['new_pairs']} new "
+              f"pairs, relocation {summary['status']}")
+
+        expected = read_dt_cc(os.path.join(args.base_dir, "input_files", "dt.cc"))
+        got = read_dt_cc(os.path.join(live_dir, "input_files", "dt.cc"))
+        lost = [pair for pair, lines in expected.items() if got.get(pair) != lines]
+        print(f"base dt.cc {len(expected)} pairs, live dt.cc {len(got)} pairs")
+        if not summary["new_pairs"]:
+            print("FAILED: the new event was not linked, nothing was correlated")
+            return 1
+        if lost:
+            print(f"FAILED: {len(lost)} base pairs lost or changed, e.g. {lost[:3]}")
+            return 1
+        print("All base dt.cc pairs kept")
+        return 0
+    finally:
+        if args.keep:
+            print(f"Work directory kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
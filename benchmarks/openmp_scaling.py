@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Iteration time of the OpenMP build of the bundled hypoDD against the
+number of threads, and its agreement with the serial build.
+
+Builds hypoDD twice from HYPODD/src/hypoDD with the relocator's compile
+flags (gfortran, no optimisation), once serial and once with
+make OPENMP=1, relocates the same input with the serial build and with
+the OpenMP build for every OMP_NUM_THREADS, and reports the wall time
+per hypoDD iteration and the largest difference of the relocated
+positions from the serial run.
+
+The OpenMP build forms a(transpose)*y in LSQR as a sum over threads, so
+its solutions differ from the serial one by rounding and are compared
+within a tolerance (--tolerance, default 2 m). hypoDD.reloc gives the
+positions to 0.1 m and the rounding grows over the iterations; on the
+default synthetic cluster the OpenMP runs differ from the serial one by
+0.3 to 0.9 m depending on the thread count. Everything else gives the
+same values as the serial build.
+
+A run that relocates nothing (hypoDD.out has a STOP, e.g. "Event ID must
+be unique", or hypoDD.reloc is empty) fails instead of comparing empty
+files.
+
+The input is a synthetic cluster (dt.ct only, straight rays in a
+constant velocity crust) unless a working directory is given. Run from
+the repository root:
+
+    python -m benchmarks.openmp_scaling --events 2000 --threads 1 2 4 8
+    python -m benchmarks.openmp_scaling --working-dir hypodd_working
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+import tempfile
+
+import numpy as np
+
+from benchmarks.check_dt_binary import build_hypodd, run_failure
+from velocity_sweep import input_file_names
+
+CENTER_LAT = 72.3
+CENTER_LON = 126.0
+KM_PER_DEGREE = 111.19
+VP = 6.0
+VP_VS_RATIO = 1.73
+
+
+def _write_inp(filename, niter, damp, cc=False):
+    # With dt.cc (IDAT 3) the cross-correlation data are weighted too
+    idat, wtcc = (3, "1.0 0.5") if cc else (2, "-9 -9")
+    with open(filename, "w") as f:
+        f.write("* synthetic cluster for benchmarks/openmp_scaling.py\n"
+                "dt.cc\ndt.ct\nevent.sel\nstation.sel\n"
+                "hypoDD.loc\nhypoDD.reloc\nhypoDD.sta\nhypoDD.res\nhypoDD.src\n"
+                f"{idat} 3 200.0\n"
+                "0 8\n"
+                "1 2 2\n"
+                f"{niter} {wtcc} -9 -9 1.0 0.5 -9 -9 {damp}\n"
+                f"{niter} {wtcc} -9 -9 1.0 0.5 6 -9 {damp}\n"
+                f"2 {VP_VS_RATIO}\n"
+                "0.0 40.0\n"
+                f"{VP} 8.0\n"
+                "0\n")
+
+
+def make_cluster(run_dir, n_events, n_stations=20, n_neighbours=10, seed=42,
+                 niter=3, damp=70.0, cc=False):
+    """
+    Write a synthetic hypoDD input (event.sel, station.sel, dt.ct, dt.cc
+    and hypoDD.inp) to run_dir; returns the number of differential
+    times. dt.cc is empty unless cc is True, then it holds P and S
+    differential times with 1 ms noise for every pair.
+    """
+    from scipy.spatial import cKDTree
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(run_dir, exist_ok=True)
+    cos_lat = np.cos(np.radians(CENTER_LAT))
+
+    # Stations between 5 and 60 km around the cluster, at sea level
+    radius = rng.uniform(5.0, 60.0, n_stations)
+    angle = rng.uniform(0.0, 2 * np.pi, n_stations)
+    sta_xy = np.column_stack([radius * np.sin(angle), radius * np.cos(angle)])
+    names = [f"SY{i:03d}" for i in range(n_stations)]
+    with open(os.path.join(run_dir, "station.sel"), "w") as f:
+        for name, (x, y) in zip(names, sta_xy):
+            f.write(f"{name} {CENTER_LAT + y / KM_PER_DEGREE:10.5f} "
+                    f"{CENTER_LON + x / (KM_PER_DEGREE * cos_lat):10.5f} 0\n")
+
+    # True hypocentres in a 4 x 4 x 4 km cluster, catalog ones 300 m off
+    true = np.column_stack([rng.uniform(-2.0, 2.0, (n_events, 2)),
+                            rng.uniform(8.0, 12.0, n_events)])
+    catalog = true + rng.normal(0.0, 0.3, true.shape)
+    with open(os.path.join(run_dir, "event.sel"), "w") as f:
+        for i, (x, y, z) in enumerate(catalog):
+            f.write(f"20200101 {i // 3600 % 24:02d}{i // 60 % 60:02d}{i % 60:02d}00 "
+                    f"{CENTER_LAT + y / KM_PER_DEGREE:10.5f} "
+                    f"{CENTER_LON + x / (KM_PER_DEGREE * cos_lat):11.5f} "
+                    f"{z:8.3f}  1.0  0.00  0.00  0.00 {i + 1:10d}\n")
+
+    # Straight-ray P and S travel times with 5 ms picking noise
+    offset = np.sqrt(((true[:, None, :2] - sta_xy[None, :, :]) ** 2).sum(axis=2) +
+                     true[:, None, 2] ** 2)
+    tt_p = offset / VP
+    tt_s = tt_p * VP_VS_RATIO
+
+    _, neighbours = cKDTree(true).query(true, k=min(n_neighbours + 1, n_events))
+    pairs = sorted({(min(i, j), max(i, j)) for i, row in enumerate(neighbours)
+                    for j in row if i != j})
+    n_dt = 0
+    with open(os.path.join(run_dir, "dt.ct"), "w") as f:
+        for i, j in pairs:
+            lines = [f"#  {i + 1}  {j + 1}\n"]
+            for phase, tt in (("P", tt_p), ("S", tt_s)):
+                noise = rng.normal(0.0, 0.005, (2, n_stations))
+                for k, name in enumerate(names):
+                    lines.append(f"{name} {tt[i, k] + noise[0, k]:8.4f} "
+                                 f"{tt[j, k] + noise[1, k]:8.4f} 1.0 {phase}\n")
+            f.write("".join(lines))
+            n_dt += 2 * n_stations
+    with open(os.path.join(run_dir, "dt.cc"), "w") as f:
+        for i, j in pairs if cc else ():
+            lines = [f"#  {i + 1}  {j + 1} 0.0\n"]
+            for phase, tt in (("P", tt_p), ("S", tt_s)):
+                noise = rng.normal(0.0, 0.001, n_stations)
+                coeff = rng.uniform(0.7, 1.0, n_stations)
+                for k, name in enumerate(names):
+                    lines.append(f"{name} {tt[i, k] - tt[j, k] + noise[k]:9.5f} "
+                                 f"{coeff[k]:6.4f} {phase}\n")
+            f.write("".join(lines))
+            n_dt += 2 * n_stations
+    _write_inp(os.path.join(run_dir, "hypoDD.inp"), niter, damp, cc)
+    return n_dt
+
+
+def copy_working_dir(working_dir, run_dir):
+    """
+    Copy the input files of a working directory to run_dir
+    """
+    input_dir = os.path.join(working_dir, "input_files")
+    with open(os.path.join(input_dir, "hypoDD.inp"), "r") as f:
+        names = input_file_names(f.read().splitlines())
+    os.makedirs(run_dir)
+    for name in names[:4] + ["hypoDD.inp"]:
+        if os.path.exists(os.path.join(input_dir, name)):
+            shutil.copy(os.path.join(input_dir, name), run_dir)
+
+
+def count_iterations(inp_file):
+    """
+    Total number of hypoDD iterations set in a hypoDD.inp
+    """
+    from velocity_sweep import data_line_indices
+    with open(inp_file, "r") as f:
+        lines = f.read().splitlines()
+    data = data_line_indices(lines)
+    niter = int(lines[data[11]].split()[2])
+    return sum(int(lines[data[12 + i]].split()[0]) for i in range(niter))
+
+
+def run_timed(hypodd, input_dir, run_dir, threads=None):
+    shutil.copytree(input_dir, run_dir)
+    env = dict(os.environ)
+    if threads:
+        env["OMP_NUM_THREADS"] = str(threads)
+    t0 = time.perf_counter()
+    with open(os.path.join(run_dir, "hypoDD.out"), "w") as out:
+        subprocess.run([hypodd, "hypoDD.inp"], cwd=run_dir, stdout=out,
+                       stderr=subprocess.STDOUT, env=env, check=True)
+    return time.perf_counter() - t0
+
+
+def max_shift(reloc_a, reloc_b):
+    """
+    Largest difference (m) of the relocated X, Y, Z of two non-empty
+    hypoDD.reloc files, None if they relocate different events
+    """
+    a = np.loadtxt(reloc_a, ndmin=2)
+    b = np.loadtxt(reloc_b, ndmin=2)
+    if a.shape != b.shape or (a[:, 0] != b[:, 0]).any():
+        return None
+    return float(np.abs(a[:, 4:7] - b[:, 4:7]).max())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Thread scaling and accuracy of the OpenMP build of hypoDD")
+    parser.add_argument("--working-dir",
+                        help="relocate this working directory instead of a synthetic cluster")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--stations", type=int, default=20)
+    parser.add_argument("--neighbours", type=int, default=10)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--tolerance", type=float, default=2.0,
+                        help="largest accepted difference from the serial build (m)")
+    parser.add_argument("--keep", action="store_true", help="keep the build directory")
+    args = parser.parse_args(argv)
+
+    build_dir = tempfile.mkdtemp(prefix="hypodd_omp_")
+    try:
+        input_dir = os.path.join(build_dir, "input")
+        inc_file = None
+        if args.working_dir:
+            copy_working_dir(args.working_dir, input_dir)
+            inc_file = os.path.join(args.working_dir, "bin", "hypoDD.inc")
+            if not os.path.exists(inc_file):
+                inc_file = None
+        else:
+            n_dt = make_cluster(input_dir, args.events, args.stations, args.neighbours)
+            print(f"Synthetic cluster: {args.events} events, {args.stations} stations, "
+                  f"{n_dt} differential times")
+        serial = build_hypodd(os.path.join(build_dir, "serial"), inc_file=inc_file)
+        parallel = build_hypodd(os.path.join(build_dir, "openmp"), inc_file=inc_file,
+                                openmp=True)
+        iterations = count_iterations(os.path.join(input_dir, "hypoDD.inp"))
+
+        runs = os.path.join(build_dir, "runs")
+        serial_dir = os.path.join(runs, "serial")
+        serial_seconds = run_timed(serial, input_dir, serial_dir)
+        serial_reloc = os.path.join(serial_dir, "hypoDD.reloc")
+        failure = run_failure(serial_dir)
+        if failure:
+            print(f"FAILED, the serial build relocated nothing: {failure}")
+            return 1
+        print(f"{'build':>8} | {'threads':>7} | {'total s':>8} | {'s/iter':>7} | "
+              f"{'speedup':>7} | {'max diff m':>10}")
+        print(f"{'serial':>8} | {'-':>7} | {serial_seconds:8.2f} | "
+              f"{serial_seconds / iterations:7.3f} | {1.0:7.2f} | {'-':>10}")
+        failed = False
+        for threads in args.threads:
+            run_dir = os.path.join(runs, f"openmp_{threads}")
+            seconds = run_timed(parallel, input_dir, run_dir, threads)
+            failure = run_failure(run_dir)
+            shift = None
+            if not failure:
+                shift = max_shift(serial_reloc, os.path.join(run_dir, "hypoDD.reloc"))
+            if shift is None or shift > args.tolerance:
+                failed = True
+            print(f"{'openmp':>8} | {threads:7d} | {seconds:8.2f} | "
+                  f"{seconds / iterations:7.3f} | {serial_seconds / seconds:7.2f} | "
+                  + (failure or "different events" if shift is None else f"{shift:10.1f}"))
+        if failed:
+            print(f"DIFFERENT: OpenMP relocations more than {args.tolerance} m "
+                  "from the serial build")
+            return 1
+        print(f"OpenMP relocations within {args.tolerance} m of the serial build "
+              f"({os.cpu_count()} CPUs)")
+        return 0
+    finally:
+        if args.keep:
+            print(f"Build and runs kept in {build_dir}")
+        else:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Peak memory of planning the correlation of all dt.ct pairs, materialized
+against streamed (pair_stream.py).
+
+For every --pairs count a synthetic events.json (--events events with
+--stations stations, a P and an S pick each) and a dt.ct linking events
+close in the catalog order are written, and each path runs in a fresh
+process:
+
+    materialized  json.load of events.json, the list of all pairs and
+                  their pick-pair jobs grouped by station (group_jobs)
+    streamed      EventIndex, and group_jobs on one chunk of --chunk-size
+                  pairs at a time, each pair marked done in a CCResultStore
+
+No waveforms are read; only the planning is measured, which is what grows
+with the number of pairs. Run from the repository root:
+
+    python -m benchmarks.pair_stream --pairs 500000 2000000
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+
+def make_working_dir(working_dir, n_events, n_pairs, n_stations=3, seed=42):
+    """
+    working_files/events.json and input_files/dt.ct with n_pairs pairs
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(working_dir, "working_files"))
+    os.makedirs(os.path.join(working_dir, "input_files"))
+    with open(os.path.join(working_dir, "working_files", "events.json"), "w") as f:
+        f.write("[")
+        for i in range(n_events):
+            picks = [{"id": f"smi:local/pick/{i}/{s}/{phase}",
+                      "pick_time": f"2020-01-01T00:00:{s + (2.0 if phase == 'S' else 1.0):06.3f}Z",
+                      "pick_time_error": None, "station_id": f"SI.ST{s:02d}",
+                      "phase": phase}
+                     for s in range(n_stations) for phase in "PS"]
+            f.write(("," if i else "") + json.dumps({
+                "event_id": f"smi:local/event/{i}", "origin_time": "2020-01-01T00:00:00Z",
+                "origin_latitude": 72.3, "origin_longitude": 126.0, "origin_depth": 5000.0,
+                "magnitude": 1.0, "picks": picks}))
+        f.write("]")
+    per_event = -(-n_pairs // n_events)
+    first = np.repeat(np.arange(1, n_events + 1), per_event)[:n_pairs]
+    second = (first + rng.integers(1, 50, len(first)) - 1) % n_events + 1
+    with open(os.path.join(working_dir, "input_files", "dt.ct"), "w") as f:
+        for i in range(0, len(first), 100000):
+            f.write("".join(f"#{a:10d}{b:10d}\nST00 1.000 1.000 1.000 P\n"
+                            for a, b in zip(first[i:i + 100000].tolist(),
+                                            second[i:i + 100000].tolist())))
+
+
+def plan(working_dir, mode, chunk_size):
+    """
+    Plan the correlation of all pairs; returns (peak RSS in MB, seconds,
+    pick-pair jobs)
+    """
+    from cc_pipeline import DEFAULT_CC_PARAMS
+    from cc_scheduler import group_jobs
+    from cc_store import CCResultStore, iter_event_pairs
+    from pair_stream import EventIndex, iter_pair_chunks
+
+    events_file = os.path.join(working_dir, "working_files", "events.json")
+    dt_ct = os.path.join(working_dir, "input_files", "dt.ct")
+    store_file = os.path.join(working_dir, "working_files", f"cc_results_{mode}.txt")
+    t0 = time.perf_counter()
+    n_jobs = 0
+    with CCResultStore(store_file) as store:
+        if mode == "materialized":
+            with open(events_file, "r") as f:
+                events = json.load(f)
+            groups, _ = group_jobs(events, list(iter_event_pairs(dt_ct)), store,
+                                   DEFAULT_CC_PARAMS)
+            n_jobs = sum(len(jobs) for jobs in groups.values())
+        else:
+            events = EventIndex(events_file, save=False)
+            for chunk in iter_pair_chunks(dt_ct, chunk_size, store):
+                groups, pending = group_jobs(events, chunk, store, DEFAULT_CC_PARAMS)
+                n_jobs += sum(len(jobs) for jobs in groups.values())
+                for ev1, ev2 in pending:
+                    store.add_pair(ev1, ev2, [])
+    seconds = time.perf_counter() - t0
+    os.remove(store_file)
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, seconds, n_jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Peak memory of the materialized and streamed pair planning")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--pairs", type=int, nargs="+", default=[500000, 2000000])
+    parser.add_argument("--stations", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context("spawn")
+    work_dir = tempfile.mkdtemp(prefix="pair_stream_")
+    results = []
+    try:
+        for n_pairs in args.pairs:
+            working_dir = os.path.join(work_dir, str(n_pairs))
+            make_working_dir(working_dir, args.events, n_pairs, args.stations)
+            row = {"pairs": n_pairs}
+            for mode in ("materialized", "streamed"):
+                with context.Pool(1) as pool:
+                    row[mode] = pool.apply(plan, (working_dir, mode, args.chunk_size))
+            if row["materialized"][2] != row["streamed"][2]:
+                print(f"WARNING: {n_pairs} pairs planned into different job counts")
+            results.append(row)
+            shutil.rmtree(working_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{args.events} events, chunks of {args.chunk_size} pairs")
+    print(f"{'pairs':>9} | {'jobs':>9} | {'materialized MB':>15} | {'s':>6} | "
+          f"{'streamed MB':>11} | {'s':>6}")
+    for row in results:
+        rss_m, sec_m, n_jobs = row["materialized"]
+        rss_s, sec_s, _ = row["streamed"]
+        print(f"{row['pairs']:9d} | {n_jobs:9d} | {rss_m:15.0f} | {sec_m:6.1f} | "
+              f"{rss_s:11.0f} | {sec_s:6.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Rendering time of hypodd_plots.py against the catalog size.
+
+For every --events size a synthetic working directory is written
+(hypoDD.loc, hypoDD.reloc, dt.ct with --pairs-per-event pairs per event
+and a dt.cc with coefficients) and all figures are drawn three times:
+
+    markers   one marker per event and every pair link (no limits)
+    density   the defaults (2-D histograms, at most --max-links links)
+    cached    density again with unchanged inputs (all figures skipped)
+
+Run from the repository root:
+
+    python -m benchmarks.plot_scaling --events 1000 10000 100000
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+import hypodd_plots
+
+CENTER_LAT = 72.3
+CENTER_LON = 126.0
+
+
+def _write_locations(filename, lat, lon, depth):
+    with open(filename, "w") as f:
+        for i in range(len(lat)):
+            f.write(f"{i + 1:9d} {lat[i]:10.6f} {lon[i]:11.6f} {depth[i]:9.3f} "
+                    f"{0.0:10.1f} {0.0:10.1f} {0.0:10.1f} {0.0:8.1f} {0.0:8.1f} {0.0:8.1f} "
+                    f"2020  1  1  0  0 {0.0:6.2f} {1.0:4.1f} {10:5d} {10:5d} "
+                    f"{10:5d} {10:5d} {10.0:6.1f} {10.0:6.1f} {1:3d}\n")
+
+
+def make_working_dir(working_dir, n_events, pairs_per_event=10, seed=42):
+    """
+    Synthetic hypoDD_temp_dir and input_files for the plots
+    """
+    rng = np.random.default_rng(seed)
+    temp_dir = os.path.join(working_dir, "hypodd_temp_dir")
+    input_dir = os.path.join(working_dir, "input_files")
+    os.makedirs(temp_dir)
+    os.makedirs(input_dir)
+    lat = CENTER_LAT + rng.normal(0.0, 0.2, n_events)
+    lon = CENTER_LON + rng.normal(0.0, 0.6, n_events)
+    depth = rng.uniform(2.0, 30.0, n_events)
+    _write_locations(os.path.join(temp_dir, "hypoDD.loc"), lat, lon, depth)
+    _write_locations(os.path.join(temp_dir, "hypoDD.reloc"),
+                     lat + rng.normal(0.0, 0.01, n_events),
+                     lon + rng.normal(0.0, 0.03, n_events),
+                     depth + rng.normal(0.0, 0.5, n_events))
+    # Pairs of events close in the catalog order, like a time-sorted cluster
+    first = np.repeat(np.arange(1, n_events + 1), pairs_per_event)
+    second = np.clip(first + rng.integers(1, 50, len(first)), 1, n_events)
+    keep = first != second
+    with open(os.path.join(input_dir, "dt.ct"), "w") as f:
+        f.write("".join(f"# {a} {b}\nSTA 1.0 1.0 1.0 P\n"
+                        for a, b in zip(first[keep], second[keep])))
+    with open(os.path.join(input_dir, "dt.cc"), "w") as f:
+        coeffs = rng.uniform(0.3, 1.0, (keep.sum(), 3))
+        f.write("".join(f"# {a} {b} 0.0\n" + "".join(f"STA 0.01 {c:.4f} P\n" for c in cc)
+                        for a, b, cc in zip(first[keep][::3], second[keep][::3], coeffs[::3])))
+    return int(keep.sum())
+
+
+def timed(**kwargs):
+    t0 = time.perf_counter()
+    drawn = hypodd_plots.create_plots(**kwargs)
+    return time.perf_counter() - t0, len(drawn)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="hypodd_plots.py rendering time by catalog size")
+    parser.add_argument("--events", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--pairs-per-event", type=int, default=10)
+    parser.add_argument("--max-links", type=int, default=20000)
+    parser.add_argument("--skip-markers", type=int, default=200000,
+                        help="skip the markers run above this many events")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="plot_scaling_")
+    results = []
+    try:
+        for n_events in args.events:
+            working_dir = os.path.join(work_dir, str(n_events))
+            n_pairs = make_working_dir(working_dir, n_events, args.pairs_per_event)
+            row = {"events": n_events, "pairs": n_pairs}
+            if n_events <= args.skip_markers:
+                row["markers"] = timed(working_dir=working_dir,
+                                       plot_dir=os.path.join(working_dir, "markers"),
+                                       scatter_limit=sys.maxsize, max_links=sys.maxsize)[0]
+            row["density"] = timed(working_dir=working_dir, max_links=args.max_links)[0]
+            row["cached"], drawn = timed(working_dir=working_dir, max_links=args.max_links)
+            if drawn:
+                print(f"WARNING: {drawn} figures redrawn with unchanged inputs")
+            results.append(row)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'events':>8} | {'pairs':>8} | {'markers s':>9} | {'density s':>9} | {'cached s':>8}")
+    for row in results:
+        markers = f"{row['markers']:9.2f}" if "markers" in row else f"{'-':>9}"
+        print(f"{row['events']:8d} | {row['pairs']:8d} | {markers} | "
+              f"{row['density']:9.2f} | {row['cached']:8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Time every stage of the relocation pipeline on a synthetic catalog.
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.run_benchmarks --scales 100 1000 --stations 13
+
+Each run writes one JSON file to benchmarks/results/ with wall time,
+throughput (events/s, picks/s or pairs/s) and memory per stage, tagged
+with the git commit, so results can be compared across versions.
+The stages share one process (and the relocator object). On Linux the
+resident set high-water mark is reset before every stage through
+/proc/self/clear_refs, and the stage's own peak is recorded as
+max_rss_mb. Where that is not possible, ru_maxrss is the peak of all
+stages so far and is recorded as cumulative_max_rss_mb instead.
+Stages that need the hypoddpy relocator or ObsPy are recorded as
+"skipped" when those are not installed.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.synthetic import generate_catalog
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+WORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'work')
+
+# Same settings as run_hypodd.py
+CC_PARAMS = dict(
+    cc_time_before=2.0,
+    cc_time_after=2.0,
+    cc_maxlag=0.8,
+    cc_filter_min_freq=6.0,
+    cc_filter_max_freq=16.0,
+    cc_p_phase_weighting={"Z": 1.0},
+    cc_s_phase_weighting={"Z": 1.0},
+    cc_min_allowed_cross_corr_coeff=0.5,
+)
+
+
+class SkipStage(Exception):
+    pass
+
+
+def _max_rss_mb(who):
+    if resource is None:
+        return None
+    rss = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / 1024.0 / (1024.0 if sys.platform == 'darwin' else 1.0)
+
+
+def _reset_peak_rss():
+    """
+    Reset the resident set high-water mark (VmHWM) of this process;
+    False where that is not possible (not Linux, or before 4.0)
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    with open('/proc/self/status', 'r') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024.0
+    return None
+
+
+def _git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _count_pairs(dt_file):
+    """
+    Number of event pairs (header lines) in a dt.ct or dt.cc file
+    """
+    if not os.path.exists(dt_file):
+        return 0
+    with open(dt_file, 'r') as f:
+        return sum(1 for line in f if line.startswith('#'))
+
+
+def _relocator(ctx):
+    if ctx.get('relocator') is None:
+        raise SkipStage(ctx.get('relocator_error', 'relocator not set up'))
+    return ctx['relocator']
+
+
+# --- stages -------------------------------------------------------------
+# Every stage takes the shared context dict and returns (items, unit).
+
+def stage_nordic2quakeml(ctx):
+    import nordic2quakeml
+    from fix_quakeml import fix_quakeml
+    quakeml = os.path.join(ctx['work_dir'], 'quakeml.xml')
+    ctx['quakeml'] = os.path.join(ctx['work_dir'], 'quakeml_fixed.xml')
+    nordic2quakeml.main(ctx['paths']['hyp_out'], quakeml)
+    fix_quakeml(quakeml, ctx['quakeml'])
+    return ctx['paths']['n_events'], 'events'
+
+
+def stage_cli_startup(ctx, repeats=5):
+    """
+    Start hypodd_cli.py for cheap subcommands and check that importing it
+    does not pull in ObsPy, SciPy, Matplotlib or NumPy
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cli = os.path.join(root, 'hypodd_cli.py')
+    check = subprocess.run(
+        [sys.executable, '-c',
+         'import sys, hypodd_cli; '
+         'print(" ".join(m for m in hypodd_cli.HEAVY_MODULES if m in sys.modules))'],
+        cwd=root, capture_output=True, text=True, check=True)
+    if check.stdout.strip():
+        raise RuntimeError(f"hypodd_cli imports {check.stdout.strip()} at start-up")
+    commands = [[cli, '--help'], [cli, 'stats', ctx['quakeml']],
+                [cli, 'velocity', ctx['paths']['station0']]]
+    for _ in range(repeats):
+        for command in commands:
+            subprocess.run([sys.executable] + command, cwd=root,
+                           stdout=subprocess.DEVNULL, check=True)
+    return repeats * len(commands), 'invocations'
+
+
+def stage_setup_relocator(ctx):
+    try:
+        from hypoddpy.hypodd_relocator import HypoDDRelocator
+    except ImportError as e:
+        ctx['relocator_error'] = f"hypoddpy not available: {e}"
+        raise SkipStage(ctx['relocator_error'])
+    from setup_velocity_model import setup_hypodd_velocity_model
+
+    relocator = HypoDDRelocator(
+        working_dir=os.path.join(ctx['work_dir'], 'hypodd_working'),
+        shift_stations=True, **CC_PARAMS)
+    relocator.add_event_files(ctx['quakeml'])
+    relocator.add_station_files(ctx['paths']['stationxml'])
+    setup_hypodd_velocity_model(relocator, ctx['paths']['station0'], 1.73)
+    for key, value in (("MINWGHT", 0.0), ("MAXDIST", 200.0), ("MAXSEP", 20.0),
+                       ("MAXNGH", 15), ("MINLNK", 4), ("MINOBS", 4),
+                       ("MAXOBS", 100)):
+        relocator.set_forced_configuration_value(key, value)
+    ctx['relocator'] = relocator
+    relocator._parse_station_files()
+    relocator._write_station_input_file()
+    return ctx['paths']['n_stations'], 'stations'
+
+
+def stage_read_events(ctx):
+    _relocator(ctx)._read_event_information()
+    return ctx['paths']['n_events'], 'events'
+
+
+def stage_write_phase_dat(ctx):
+    relocator = _relocator(ctx)
+    relocator._write_ph2dt_inp_file()
+    relocator._create_event_id_map()
+    relocator._write_phase_input_file()
+    return ctx['paths']['n_events'], 'events'
+
+
+def stage_compile(ctx):
+    _relocator(ctx)._compile_hypodd()
+    return 1, 'builds'
+
+
+def stage_ph2dt(ctx):
+    relocator = _relocator(ctx)
+    relocator._run_ph2dt()
+    ctx['dt_ct'] = os.path.join(ctx['work_dir'], 'hypodd_working',
+                                'input_files', 'dt.ct')
+    return _count_pairs(ctx['dt_ct']), 'pairs'
+
+
+def stage_waveform_index(ctx):
+    from waveform_index import WaveformIndex
+    index = WaveformIndex()
+    index.add_directory(ctx['paths']['wav_dir'])
+    ctx['waveform_index'] = index
+    return len(index), 'files'
+
+
+def stage_parse_waveforms(ctx):
+    relocator = _relocator(ctx)
+    if not ctx['paths']['waveform_files']:
+        raise SkipStage("no waveforms generated")
+    relocator.add_waveform_files(ctx['paths']['waveform_files'])
+    relocator._parse_waveform_files()
+    return len(ctx['paths']['waveform_files']), 'files'
+
+
+def stage_find_data(ctx):
+    relocator = _relocator(ctx)
+    duration = CC_PARAMS['cc_time_before'] + CC_PARAMS['cc_time_after']
+    n_picks = 0
+    for event in relocator.events:
+        for pick in event["picks"]:
+            relocator._find_data(pick["station_id"],
+                                 pick["pick_time"] - CC_PARAMS['cc_time_before'],
+                                 duration)
+            n_picks += 1
+    return n_picks, 'picks'
+
+
+def stage_cross_correlation(ctx):
+    relocator = _relocator(ctx)
+    if not ctx['paths']['waveform_files']:
+        raise SkipStage("no waveforms generated")
+    outfile = os.path.join(ctx['work_dir'], 'cross_correlation_results.json')
+    relocator._cross_correlate_picks(outfile=outfile)
+    return _count_pairs(ctx.get('dt_ct', '')), 'pairs'
+
+
+def stage_hypodd(ctx):
+    relocator = _relocator(ctx)
+    relocator._write_hypoDD_inp_file()
+    relocator._run_hypodd()
+    return ctx['paths']['n_events'], 'events'
+
+
+STAGES = [
+    ('nordic2quakeml', stage_nordic2quakeml),
+    ('cli_startup', stage_cli_startup),
+    ('setup_relocator', stage_setup_relocator),
+    ('read_events', stage_read_events),
+    ('write_phase_dat', stage_write_phase_dat),
+    ('compile', stage_compile),
+    ('ph2dt', stage_ph2dt),
+    ('waveform_index', stage_waveform_index),
+    ('parse_waveforms', stage_parse_waveforms),
+    ('find_data', stage_find_data),
+    ('cross_correlation', stage_cross_correlation),
+    ('hypodd', stage_hypodd),
+]
+
+
+def _run_stage(func, ctx, trace_memory):
+    result = {'status': 'ok'}
+    if trace_memory:
+        tracemalloc.start()
+    peak_reset = _reset_peak_rss()
+    t0 = time.perf_counter()
+    try:
+        items, unit = func(ctx)
+    except SkipStage as e:
+        result = {'status': 'skipped', 'reason': str(e)}
+        items, unit = None, None
+    except Exception as e:
+        result = {'status': 'error', 'reason': f"{type(e).__name__}: {e}"}
+        items, unit = None, None
+    elapsed = time.perf_counter() - t0
+    if trace_memory:
+        result['python_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    result['seconds'] = elapsed
+    if items is not None:
+        result['items'] = items
+        result['unit'] = unit
+        result['throughput'] = items / elapsed if elapsed > 0 else None
+    if peak_reset:
+        result['max_rss_mb'] = _peak_rss_mb()
+    elif resource is not None:
+        result['cumulative_max_rss_mb'] = _max_rss_mb(resource.RUSAGE_SELF)
+    if resource is not None:
+        # Largest child process of the whole run so far
+        result['children_cumulative_max_rss_mb'] = _max_rss_mb(resource.RUSAGE_CHILDREN)
+    return result
+
+
+def run_benchmark(n_events, n_stations, stages=None, waveforms=True,
+                  max_waveform_events=None, trace_memory=False, seed=42,
+                  keep_work_dir=False):
+    """
+    Generate a synthetic catalog and time all (or the selected) stages
+    """
+    work_dir = os.path.join(WORK_DIR, f"{n_events}x{n_stations}")
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+
+    t0 = time.perf_counter()
+    paths = generate_catalog(os.path.join(work_dir, 'data'), n_events,
+                             n_stations, seed=seed, waveforms=waveforms,
+                             max_waveform_events=max_waveform_events)
+    generate_seconds = time.perf_counter() - t0
+
+    ctx = {'work_dir': work_dir, 'paths': paths}
+    results = {}
+    for name, func in STAGES:
+        if stages and name not in stages:
+            continue
+        print(f">>> {name} ({n_events} events x {n_stations} stations)")
+        results[name] = _run_stage(func, ctx, trace_memory)
+        r = results[name]
+        if r['status'] == 'ok':
+            print(f"    {r['seconds']:.2f} s, {r['items']} {r['unit']}")
+        else:
+            print(f"    {r['status']}: {r['reason']}")
+
+    if not keep_work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'version': _git_version(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'n_events': n_events,
+        'n_stations': n_stations,
+        'n_picks': paths['n_picks'],
+        'n_waveform_files': len(paths['waveform_files']),
+        'generate_seconds': generate_seconds,
+        'stages': results,
+    }
+
+
+def save_results(result, results_dir=RESULTS_DIR):
+    os.makedirs(results_dir, exist_ok=True)
+    name = "{}_{}_{}x{}.json".format(
+        datetime.now().strftime('%Y%m%dT%H%M%S'), result['version'] or 'unknown',
+        result['n_events'], result['n_stations'])
+    filename = os.path.join(results_dir, name)
+    with open(filename, 'w') as f:
+        json.dump(result, f, indent=2)
+    return filename
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the relocation pipeline")
+    parser.add_argument('--scales', type=int, nargs='+', default=[100],
+                        help="numbers of events to benchmark (e.g. 100 1000 100000)")
+    parser.add_argument('--stations', type=int, default=13)
+    parser.add_argument('--stages', nargs='+', choices=[n for n, _ in STAGES],
+                        help="only run these stages (later stages need earlier ones)")
+    parser.add_argument('--no-waveforms', action='store_true',
+                        help="skip MiniSEED generation and waveform stages")
+    parser.add_argument('--max-waveform-events', type=int,
+                        help="only write waveforms for the first N events")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="record the Python heap peak per stage (slower)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--keep-work-dir', action='store_true')
+    args = parser.parse_args(argv)
+
+    for n_events in args.scales:
+        result = run_benchmark(n_events, args.stations, stages=args.stages,
+                               waveforms=not args.no_waveforms,
+                               max_waveform_events=args.max_waveform_events,
+                               trace_memory=args.trace_memory, seed=args.seed,
+                               keep_work_dir=args.keep_work_dir)
+        print(f"Results saved to {save_results(result)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+MAXDIST pick filtering with the station_geometry.py matrix against a
+geodesic per pick.
+
+A synthetic working directory with --events events, each with a P and an
+S pick at every one of --stations stations, and a StationXML file are
+written, then the out-of-range picks are found
+
+    per pick   obspy gps2dist_azimuth for every pick
+    computed   load_geometry without a cache, then out_of_range_picks
+    cached     load_geometry from the cache, then out_of_range_picks
+
+and the three must reject the same picks (up to picks within 1 km of
+MAXDIST, where the spherical and ellipsoidal distances may disagree).
+Run from the repository root:
+
+    python -m benchmarks.station_geometry --events 20000 --stations 40
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+CENTER_LAT = 72.3
+CENTER_LON = 126.0
+
+
+def make_working_dir(working_dir, n_events, n_stations, seed=42):
+    """
+    events.json and stations.xml; returns the StationXML file name
+    """
+    rng = np.random.default_rng(seed)
+    s_lat = CENTER_LAT + rng.uniform(-1.5, 1.5, n_stations)
+    s_lon = CENTER_LON + rng.uniform(-4.0, 4.0, n_stations)
+    s_elev = rng.uniform(0.0, 300.0, n_stations)
+    station_file = os.path.join(working_dir, "stations.xml")
+    os.makedirs(os.path.join(working_dir, "working_files"))
+    with open(station_file, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<FDSNStationXML xmlns="http://www.fdsn.org/xml/station/1" '
+                'schemaVersion="1.2">\n<Network code="SI">\n')
+        for i in range(n_stations):
+            f.write(f'<Station code="S{i:03d}"><Latitude>{s_lat[i]}</Latitude>'
+                    f'<Longitude>{s_lon[i]}</Longitude>'
+                    f'<Elevation>{s_elev[i]}</Elevation></Station>\n')
+        f.write("</Network>\n</FDSNStationXML>\n")
+    lat = CENTER_LAT + rng.normal(0.0, 0.3, n_events)
+    lon = CENTER_LON + rng.normal(0.0, 1.0, n_events)
+    depth = rng.uniform(2000.0, 30000.0, n_events)
+    events = [{"event_id": f"smi:local/event/{i}", "origin_time": "2020-01-01T00:00:00Z",
+               "origin_latitude": float(lat[i]), "origin_longitude": float(lon[i]),
+               "origin_depth": float(depth[i]), "magnitude": 1.0,
+               "picks": [{"id": f"e{i}p{s}{phase}", "pick_time": "2020-01-01T00:00:10Z",
+                          "pick_time_error": None, "station_id": f"SI.S{s:03d}",
+                          "phase": phase}
+                         for s in range(n_stations) for phase in "PS"]}
+              for i in range(n_events)]
+    with open(os.path.join(working_dir, "working_files", "events.json"), "w") as f:
+        json.dump(events, f)
+    return station_file
+
+
+def per_pick(events_file, station_file, maxdist):
+    """
+    Rejected pick ids and the picks within 1 km of maxdist, with a
+    geodesic per pick
+    """
+    from obspy.geodetics import gps2dist_azimuth
+    from station_geometry import read_station_coordinates
+
+    coordinates = read_station_coordinates([station_file])
+    with open(events_file, "r") as f:
+        events = json.load(f)
+    rejected = set()
+    borderline = set()
+    for event in events:
+        for pick in event["picks"]:
+            lat, lon, _ = coordinates[pick["station_id"]]
+            distance = gps2dist_azimuth(event["origin_latitude"], event["origin_longitude"],
+                                        lat, lon)[0] / 1000.0
+            if distance > maxdist:
+                rejected.add(pick["id"])
+            if abs(distance - maxdist) < 1.0:
+                borderline.add(pick["id"])
+    return rejected, borderline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="MAXDIST filtering with the geometry matrix against per-pick geodesics")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--stations", type=int, default=40)
+    parser.add_argument("--maxdist", type=float, default=100.0)
+    args = parser.parse_args(argv)
+
+    from relocated_catalog import iter_events
+    from station_geometry import load_geometry, out_of_range_picks
+
+    work_dir = tempfile.mkdtemp(prefix="station_geometry_")
+    try:
+        station_file = make_working_dir(work_dir, args.events, args.stations)
+        events_file = os.path.join(work_dir, "working_files", "events.json")
+        timings = {}
+        results = {}
+
+        t0 = time.perf_counter()
+        results["per pick"], borderline = per_pick(events_file, station_file, args.maxdist)
+        timings["per pick"] = time.perf_counter() - t0
+        for name in ("computed", "cached"):
+            t0 = time.perf_counter()
+            geometry = load_geometry(work_dir, [station_file])
+            t_geometry = time.perf_counter() - t0
+            results[name], _ = out_of_range_picks(iter_events(events_file), geometry,
+                                                  args.maxdist)
+            timings[name] = (time.perf_counter() - t0, t_geometry)
+
+        n_picks = args.events * args.stations * 2
+        print(f"{args.events} events x {args.stations} stations, {n_picks} picks, "
+              f"MAXDIST {args.maxdist:g} km")
+        print(f"  per pick  {timings['per pick']:7.2f} s")
+        for name in ("computed", "cached"):
+            total, t_geometry = timings[name]
+            print(f"  {name:9s} {total:7.2f} s (geometry {t_geometry:.3f} s)")
+        differ = (results["per pick"] ^ results["computed"]) - borderline
+        if differ or results["computed"] != results["cached"]:
+            print(f"DIFFERENT: {len(differ)} picks rejected by one method only")
+            return 1
+        print(f"Same {len(results['computed'])} picks rejected by all three")
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
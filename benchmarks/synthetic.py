@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Synthetic catalog generator for the benchmarks.
+
+Writes, for N events x M stations:
+  hyp.out       Nordic file in the layout nordic2quakeml.py reads
+  STATION0.hyp  SEISAN station file with a 1-D velocity model
+  stations.xml  StationXML (through seisan2stationxml.py, needs ObsPy)
+  WAV/          one SEISAN-named MiniSEED file per event with simulated
+                P and S arrivals on HHZ/HHN/HHE (needs ObsPy)
+
+Travel times use straight rays in a constant-velocity half space, which is
+all the benchmarks need. Every station has its own source wavelet, so picks
+of nearby events at the same station correlate well.
+"""
+import os
+import math
+import random
+from datetime import datetime, timedelta
+
+CENTER_LAT = 72.3
+CENTER_LON = 126.0
+VP = 6.2
+VP_VS_RATIO = 1.73
+SAMPLING_RATE = 100.0
+KM_PER_DEGREE = 111.19
+
+VELOCITY_MODEL = [(5.6, 0.0), (6.2, 5.0), (6.7, 25.0), (7.3, 30.0), (8.0, 46.0)]
+
+
+def _distance_km(lat1, lon1, lat2, lon2):
+    dx = (lon2 - lon1) * KM_PER_DEGREE * math.cos(math.radians((lat1 + lat2) / 2))
+    dy = (lat2 - lat1) * KM_PER_DEGREE
+    return math.hypot(dx, dy)
+
+
+def make_stations(n_stations, rng, radius_km=120.0):
+    """
+    Return a list of station dicts on a jittered ring around the cluster
+    """
+    if n_stations > 900:
+        raise ValueError("Nordic station codes limit the generator to 900 stations")
+    stations = []
+    for j in range(n_stations):
+        azimuth = 2 * math.pi * j / n_stations
+        dist = radius_km * (0.3 + 0.7 * rng.random())
+        lat = CENTER_LAT + dist * math.cos(azimuth) / KM_PER_DEGREE
+        lon = CENTER_LON + dist * math.sin(azimuth) / (
+            KM_PER_DEGREE * math.cos(math.radians(CENTER_LAT)))
+        stations.append({
+            'code': str(100 + j),
+            'lat': lat,
+            'lon': lon,
+            'elevation': rng.randint(0, 300),
+        })
+    return stations
+
+
+def make_events(n_events, stations, rng, start=datetime(2016, 1, 1),
+                radius_km=20.0):
+    """
+    Return a list of event dicts with P and S arrivals at every station
+    """
+    events = []
+    origin = start
+    vs = VP / VP_VS_RATIO
+    for i in range(n_events):
+        # Keep origins away from midnight; Nordic phase lines only carry
+        # hour and minute and nordic2quakeml takes the date from the event.
+        origin += timedelta(seconds=rng.uniform(600, 3600))
+        if origin.hour >= 23:
+            origin = datetime(origin.year, origin.month, origin.day) + timedelta(days=1, hours=1)
+        # Whole seconds: nordic2quakeml.py mangles fractional origin seconds
+        origin = origin.replace(microsecond=0)
+        dist = radius_km * math.sqrt(rng.random())
+        azimuth = 2 * math.pi * rng.random()
+        lat = CENTER_LAT + dist * math.cos(azimuth) / KM_PER_DEGREE
+        lon = CENTER_LON + dist * math.sin(azimuth) / (
+            KM_PER_DEGREE * math.cos(math.radians(CENTER_LAT)))
+        depth = rng.uniform(2.0, 15.0)
+        arrivals = []
+        for sta in stations:
+            hypo = math.hypot(_distance_km(lat, lon, sta['lat'], sta['lon']), depth)
+            arrivals.append((sta, 'P', origin + timedelta(seconds=hypo / VP)))
+            arrivals.append((sta, 'S', origin + timedelta(seconds=hypo / vs)))
+        events.append({
+            'origin_time': origin,
+            'lat': lat,
+            'lon': lon,
+            'depth': depth,
+            'ml': round(rng.uniform(0.2, 3.0), 1),
+            'arrivals': arrivals,
+        })
+    return events
+
+
+def _nordic_event_lines(event):
+    """
+    Nordic lines of one event, laid out as in the BER hyp.out files
+    """
+    o = event['origin_time']
+    sec = o.second + o.microsecond / 1e6
+    n_sta = len(event['arrivals']) // 2
+    lines = [
+        f" {o.year:4d} {o.month:2d}{o.day:2d} {o.hour:2d}{o.minute:02d} {sec:4.1f} L "
+        f"{event['lat']:7.3f}{event['lon']:8.3f}{event['depth']:5.1f}  BER{n_sta:3d}"
+        f" 0.3 {event['ml']:3.1f}LBER {event['ml']:3.1f}CBER        1",
+        f" ACTION:SYN {o:%y-%m-%d %H:%M} OP:bm   STATUS:               "
+        f"ID:{o:%Y%m%d%H%M%S}     I",
+        f" {o:%Y-%m-%d-%H%M-%S}M.SYNTH_{3 * n_sta:03d}".ljust(79) + "6",
+        " STAT SP IPHASW D HRMM SECON CODA AMPLIT PERI AZIMU VELO AIN AR TRES W  DIS CAZ7",
+    ]
+    for sta, phase, t in event['arrivals']:
+        channel, nordic_phase = ('0Z', 'IP') if phase == 'P' else ('0E', 'ES')
+        t_sec = t.second + t.microsecond / 1e6
+        lines.append(f" {sta['code']:<4s} {channel:2s} {nordic_phase:<6s}   "
+                     f"{t.hour:2d}{t.minute:02d} {t_sec:5.2f}".ljust(80))
+    lines.append(" " * 80)
+    return lines
+
+
+def write_nordic(events, filename):
+    with open(filename, 'w', encoding='utf-8') as f:
+        for event in events:
+            f.write("\n".join(_nordic_event_lines(event)) + "\n")
+
+
+def write_station0(stations, filename):
+    """
+    Write a SEISAN STATION0.hyp readable by seisan2stationxml.py and
+    setup_velocity_model.py
+    """
+    with open(filename, 'w') as f:
+        f.write("RESET TEST(07)= -3.84\n \n")
+        for sta in stations:
+            lat_deg, lat_min = divmod(abs(sta['lat']) * 60.0, 60.0)
+            lon_deg, lon_min = divmod(abs(sta['lon']) * 60.0, 60.0)
+            f.write(f"  {sta['code']:4s}{int(lat_deg):02d}{lat_min:05.2f}N"
+                    f"{int(lon_deg):03d}{lon_min:05.2f}E {sta['elevation']}\n")
+        f.write(" \n")
+        for vp, depth in VELOCITY_MODEL:
+            f.write(f"  {vp:.1f}      {depth:.1f}\n")
+        f.write("\n15. 600. 1300. 1.76\n")
+
+
+def _station_wavelets(stations, rng, n_samples=64):
+    """
+    One short random wavelet per station, band limited by a moving average
+    """
+    import numpy as np
+    wavelets = {}
+    for sta in stations:
+        w = np.array([rng.gauss(0.0, 1.0) for _ in range(n_samples)])
+        w = np.convolve(w, np.ones(3) / 3.0, mode='same') * np.hanning(n_samples)
+        wavelets[sta['code']] = w / np.abs(w).max()
+    return wavelets
+
+
+def write_waveforms(events, stations, wav_dir, rng, before=10.0, after=20.0,
+                    noise_level=0.05):
+    """
+    Write one SEISAN-named MiniSEED file per event
+    """
+    import numpy as np
+    from obspy import Stream, Trace, UTCDateTime
+
+    os.makedirs(wav_dir, exist_ok=True)
+    wavelets = _station_wavelets(stations, rng)
+    np_rng = np.random.default_rng(rng.randrange(2**32))
+    filenames = []
+    for event in events:
+        o = event['origin_time']
+        last = max(t for _, _, t in event['arrivals'])
+        start = o - timedelta(seconds=before)
+        n = int(((last - start).total_seconds() + after) * SAMPLING_RATE)
+        traces = {}
+        for sta in stations:
+            for comp in 'ZNE':
+                traces[(sta['code'], comp)] = np_rng.normal(
+                    0.0, noise_level, n).astype(np.float32)
+        for sta, phase, t in event['arrivals']:
+            i0 = int((t - start).total_seconds() * SAMPLING_RATE)
+            w = wavelets[sta['code']]
+            comps = 'Z' if phase == 'P' else 'NE'
+            for comp in comps:
+                data = traces[(sta['code'], comp)]
+                j = min(len(w), n - i0)
+                if j > 0:
+                    data[i0:i0 + j] += w[:j].astype(np.float32)
+        st = Stream()
+        for (code, comp), data in traces.items():
+            st.append(Trace(data=data, header={
+                'network': 'SI', 'station': code, 'channel': f'HH{comp}',
+                'starttime': UTCDateTime(start), 'sampling_rate': SAMPLING_RATE}))
+        filename = os.path.join(
+            wav_dir, f"{start:%Y-%m-%d-%H%M-%S}M.SYNTH_{len(st):03d}")
+        st.write(filename, format='MSEED')
+        filenames.append(filename)
+    return filenames
+
+
+def generate_catalog(output_dir, n_events, n_stations, seed=42,
+                     waveforms=True, max_waveform_events=None):
+    """
+    Write a complete synthetic data set to output_dir and return a dict
+    with the paths of the generated files
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    stations = make_stations(n_stations, rng)
+    events = make_events(n_events, stations, rng)
+
+    paths = {
+        'hyp_out': os.path.join(output_dir, 'hyp.out'),
+        'station0': os.path.join(output_dir, 'STATION0.hyp'),
+        'stationxml': os.path.join(output_dir, 'stations.xml'),
+        'wav_dir': os.path.join(output_dir, 'WAV'),
+        'waveform_files': [],
+        'n_events': n_events,
+        'n_stations': n_stations,
+        'n_picks': sum(len(e['arrivals']) for e in events),
+    }
+    write_nordic(events, paths['hyp_out'])
+    write_station0(stations, paths['station0'])
+
+    try:
+        from seisan2stationxml import convert_seisan_to_stationxml
+        convert_seisan_to_stationxml(paths['station0'], paths['stationxml'])
+    except ImportError:
+        paths['stationxml'] = None
+
+    if waveforms:
+        subset = events[:max_waveform_events] if max_waveform_events else events
+        paths['waveform_files'] = write_waveforms(subset, stations,
+                                                  paths['wav_dir'], rng)
+    return paths
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Write a synthetic catalog")
+    parser.add_argument('output_dir')
+    parser.add_argument('--events', type=int, default=100)
+    parser.add_argument('--stations', type=int, default=13)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-waveforms', action='store_true')
+    args = parser.parse_args()
+    paths = generate_catalog(args.output_dir, args.events, args.stations,
+                             seed=args.seed, waveforms=not args.no_waveforms)
+    print(f"Wrote {paths['n_events']} events, {paths['n_stations']} stations, "
+          f"{paths['n_picks']} picks to {args.output_dir}")
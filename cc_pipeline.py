@@ -0,0 +1,729 @@
+#!/usr/bin/env python3
+"""
+Pipelined cross-correlation of the picks of all ph2dt event pairs.
+
+The relocator reads, filters and correlates every pick pair strictly one
+after the other, so the disk waits for the CPU and the CPU for the disk.
+Here the work is split into three stages connected by bounded queues:
+
+    read      threads walk the upcoming event pairs and load the pick
+              windows from the waveform files (found through WaveformIndex)
+    filter    demean, taper and bandpass the windows
+    correlate all weighted channels of every pick pair of an event pair
+              in one batched FFT (correlate_pick_pair)
+
+Windows are cached per pick, so a pick shared by many event pairs is only
+read and filtered once. Results go to a CCResultStore (all coefficients
+kept); queue depths, stall times and throughput are reported as metrics.
+
+Works on a relocator working directory after ph2dt has run, i.e. it needs
+working_files/events.json and input_files/dt.ct.
+"""
+import os
+import json
+import time
+import queue
+import threading
+from itertools import islice
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from obspy import read, UTCDateTime
+from obspy.core.compatibility import round_away
+from obspy.signal.invsim import cosine_taper
+from scipy.fft import next_fast_len, rfft, irfft
+
+from cc_store import CCResultStore, iter_event_pairs
+from waveform_index import WaveformIndex
+
+# Same defaults as run_hypodd.py
+DEFAULT_CC_PARAMS = {
+    "cc_time_before": 2.0,
+    "cc_time_after": 2.0,
+    "cc_maxlag": 0.8,
+    "cc_filter_min_freq": 6.0,
+    "cc_filter_max_freq": 16.0,
+    "cc_p_phase_weighting": {"Z": 1.0},
+    "cc_s_phase_weighting": {"Z": 1.0},
+    "cc_min_allowed_cross_corr_coeff": 0.5,
+}
+
+_DONE = object()
+
+
+class MeteredQueue(queue.Queue):
+    """
+    Bounded queue that records how long producers and consumers were
+    blocked and how full it was
+    """
+
+    def __init__(self, name, maxsize):
+        super().__init__(maxsize)
+        self.name = name
+        self.put_stall = 0.0
+        self.get_stall = 0.0
+        self.max_depth = 0
+        self._depth_sum = 0
+        self._depth_samples = 0
+
+    def put(self, item, block=True, timeout=None):
+        t0 = time.perf_counter()
+        super().put(item, block, timeout)
+        self.put_stall += time.perf_counter() - t0
+        depth = self.qsize()
+        self.max_depth = max(self.max_depth, depth)
+        self._depth_sum += depth
+        self._depth_samples += 1
+
+    def get(self, block=True, timeout=None):
+        t0 = time.perf_counter()
+        item = super().get(block, timeout)
+        self.get_stall += time.perf_counter() - t0
+        return item
+
+    def metrics(self):
+        return {
+            "maxsize": self.maxsize,
+            "max_depth": self.max_depth,
+            "mean_depth": self._depth_sum / max(self._depth_samples, 1),
+            "put_stall_seconds": self.put_stall,
+            "get_stall_seconds": self.get_stall,
+        }
+
+
+class WindowCache:
+    """
+    Thread-safe LRU cache of pick windows keyed by pick id
+    """
+
+    def __init__(self, maxsize=5000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+def phase_weighting(phase, cc_params):
+    """
+    Channel weights for a phase, e.g. {"Z": 1.0}; None for other phases
+    """
+    if phase == "P":
+        return cc_params["cc_p_phase_weighting"]
+    if phase == "S":
+        return cc_params["cc_s_phase_weighting"]
+    return None
+
+
+def window_bounds(pick_time, cc_params):
+    """
+    Start and end of the raw window read around a pick. It is padded by
+    one window length on each side so filter artifacts stay outside the
+    part that is correlated.
+    """
+    before = cc_params["cc_time_before"] + cc_params["cc_maxlag"] / 2.0
+    after = cc_params["cc_time_after"] + cc_params["cc_maxlag"] / 2.0
+    pad = before + after
+    return pick_time - before - pad, pick_time + after + pad
+
+
+def pair_jobs(event_1, event_2, cc_params):
+    """
+    The (pick_1, pick_2, weighting) jobs of one event pair: every P or S
+    pick of event_1 with the first pick of event_2 at the same station and
+    of the same phase, as the relocator matches them
+    """
+    jobs = []
+    for pick_1 in event_1["picks"]:
+        weighting = phase_weighting(pick_1["phase"], cc_params)
+        if not weighting:
+            continue
+        for pick_2 in event_2["picks"]:
+            if (pick_1["station_id"] == pick_2["station_id"] and
+                    pick_1["phase"] == pick_2["phase"]):
+                jobs.append((pick_1, pick_2, weighting))
+                break
+    return jobs
+
+
+def load_pick_window(pick, components, waveform_index, cc_params):
+    """
+    Read the raw window around a pick for the given components.
+    Returns {component: Trace}; components without data are left out.
+    """
+    pick_time = UTCDateTime(pick["pick_time"])
+    start, end = window_bounds(pick_time, cc_params)
+    network, station = pick["station_id"].split(".")
+    window = {}
+    for filename in waveform_index.files_between(start.datetime, end.datetime):
+        try:
+            st = read(filename, starttime=start - 1.0, endtime=end + 1.0)
+        except Exception:
+            continue
+        st = st.select(network=network, station=station)
+        for component in components:
+            if component in window:
+                continue
+            for tr in st.select(component=component):
+                if tr.stats.starttime <= start and tr.stats.endtime >= end:
+                    tr.trim(start, end, nearest_sample=False)
+                    window[component] = tr
+                    break
+        if len(window) == len(components):
+            break
+    return window
+
+
+def filter_window(window, cc_params):
+    """
+    Demean, taper and bandpass all traces of a window, the same
+    processing xcorr_pick_correction applies
+    """
+    filtered = {}
+    for component, tr in window.items():
+        tr = tr.copy()
+        try:
+            tr.data = tr.data.astype(np.float64)
+            tr.detrend(type="demean")
+            tr.data *= cosine_taper(len(tr), 0.1)
+            tr.filter("bandpass", freqmin=cc_params["cc_filter_min_freq"],
+                      freqmax=cc_params["cc_filter_max_freq"])
+        except Exception:
+            continue
+        filtered[component] = tr
+    return filtered
+
+
+def load_windows(picks, waveform_index, cc_params, io_threads=4, loaded_windows=None):
+    """
+    Read and filter the windows of all picks once, with a thread pool
+    for the reads. Picks in loaded_windows ({pick id: filtered window},
+    e.g. from pick_prescreen) are not read again.
+    """
+    loaded_windows = loaded_windows or {}
+
+    def load(pick):
+        weighting = phase_weighting(pick["phase"], cc_params) or {}
+        components = [c for c, w in weighting.items() if w]
+        window = load_pick_window(pick, components, waveform_index, cc_params)
+        return pick["id"], filter_window(window, cc_params)
+
+    with ThreadPoolExecutor(max_workers=io_threads) as executor:
+        windows = dict(executor.map(load, [p for p in picks
+                                           if p["id"] not in loaded_windows]))
+    for pick in picks:
+        if pick["id"] in loaded_windows:
+            windows[pick["id"]] = loaded_windows[pick["id"]]
+    return windows
+
+
+def channel_slices(pick_time, window, weighting, cc_params):
+    """
+    The correlated parts of the weighted channels of a pick window, cut
+    like xcorr_pick_correction does. Returns {component: (data,
+    sampling rate)}; channels not covering the slice are left out.
+    """
+    start = pick_time - cc_params["cc_time_before"] - cc_params["cc_maxlag"] / 2.0
+    end = pick_time + cc_params["cc_time_after"] + cc_params["cc_maxlag"] / 2.0
+    slices = {}
+    for component, weight in weighting.items():
+        tr = window.get(component)
+        if not weight or tr is None:
+            continue
+        stats = tr.stats
+        if stats.starttime > start or stats.endtime < end:
+            continue
+        # The samples Trace.slice(start, end) keeps, without copying the trace
+        first = int(round_away((start - stats.starttime) * stats.sampling_rate))
+        n = int(round_away((end - (stats.starttime + first * stats.delta)) *
+                           stats.sampling_rate)) + 1
+        slices[component] = (tr.data[first:first + n], stats.sampling_rate)
+    return slices
+
+
+def batched_correlation(a, b, shift):
+    """
+    Normalised cross-correlation of the rows of a (channels x na) with
+    the rows of b (channels x nb) in one FFT. The lags and normalisation
+    are those of obspy's correlate(a, b, shift, method="direct").
+    """
+    a = a - a.mean(axis=1, keepdims=True)
+    b = b - b.mean(axis=1, keepdims=True)
+    na, nb = a.shape[1], b.shape[1]
+    n = next_fast_len(na + nb - 1)
+    full = irfft(rfft(a, n, axis=1) * np.conj(rfft(b, n, axis=1)), n, axis=1)
+    # obspy pads the shorter input with zeros and keeps the "valid" part
+    dif = na - nb - 2 * shift
+    pad_a, pad_b = (0, dif // 2) if dif > 0 else (-dif // 2, 0)
+    first = pad_b - pad_a
+    lags = np.arange(first, first + na + 2 * pad_a - nb - 2 * pad_b + 1)
+    cc = full[:, lags % n]
+    norm = np.sqrt((a ** 2).sum(axis=1) * (b ** 2).sum(axis=1))
+    zero = norm <= np.finfo(float).eps
+    cc[zero] = 0.0
+    cc[~zero] /= norm[~zero, None]
+    return cc
+
+
+def fit_correlation_peak(cc, cc_maxlag, shift):
+    """
+    Subsample (pick_2 correction, coeff) of a correlation function by a
+    parabola through the concave part around its maximum, as in
+    xcorr_pick_correction. None if fewer than 3 samples can be fitted
+    or the parabola has no maximum (xcorr_pick_correction raises).
+    """
+    curvature = np.concatenate((np.zeros(1), np.diff(cc, 2), np.zeros(1)))
+    cc_t = np.linspace(-cc_maxlag, cc_maxlag, shift * 2 + 1)
+    peak = cc.argmax()
+    first = peak
+    while first > 0 and curvature[first - 1] <= 0:
+        first -= 1
+    last = peak
+    while last < len(cc) - 1 and curvature[last + 1] <= 0:
+        last += 1
+    if last - first + 1 < 3:
+        return None
+    coeffs = np.polyfit(cc_t[first:last + 1], cc[first:last + 1], deg=2)
+    if coeffs[0] >= 0:
+        return None
+    dt = -coeffs[1] / 2.0 / coeffs[0]
+    coeff = (4 * coeffs[0] * coeffs[2] - coeffs[1] ** 2) / (4 * coeffs[0])
+    return -dt, coeff
+
+
+def correlate_pick_pair(pick_1, window_1, pick_2, window_2, weighting, cc_params):
+    """
+    Weighted correlation over the channels of a pick pair. Returns
+    (pick_2 correction, coeff) or None if no channel could be correlated.
+
+    All weighted channels are correlated in one batched FFT and their
+    correlation functions are stacked by weight before the peak is
+    picked, so N/E weights for S cost little more than Z alone. With one
+    channel this is xcorr_pick_correction.
+    """
+    slices_1 = channel_slices(UTCDateTime(pick_1["pick_time"]), window_1, weighting, cc_params)
+    slices_2 = channel_slices(UTCDateTime(pick_2["pick_time"]), window_2, weighting, cc_params)
+    components = [c for c in slices_1 if c in slices_2]
+    if not components:
+        return None
+    # One lag axis: channels at the sampling rate of the first one
+    rate = slices_1[components[0]][1]
+    components = [c for c in components
+                  if slices_1[c][1] == rate and slices_2[c][1] == rate]
+    if not components:
+        return None
+    shift = int(cc_params["cc_maxlag"] * rate)
+
+    # Channels are batched by slice lengths, which differ by a sample at most
+    groups = {}
+    for c in components:
+        groups.setdefault((len(slices_1[c][0]), len(slices_2[c][0])), []).append(c)
+    stack = None
+    total_weight = 0.0
+    for group in groups.values():
+        cc = batched_correlation(np.array([slices_1[c][0] for c in group], dtype=np.float64),
+                                 np.array([slices_2[c][0] for c in group], dtype=np.float64),
+                                 shift)
+        weights = np.array([weighting[c] for c in group], dtype=np.float64)
+        stacked = weights @ cc
+        if stack is None:
+            stack = stacked
+        else:
+            n = min(len(stack), len(stacked))
+            stack = stack[:n] + stacked[:n]
+        total_weight += weights.sum()
+    return fit_correlation_peak(stack / total_weight, cc_params["cc_maxlag"], shift)
+
+
+def differential_time(event_1, pick_1, event_2, pick_2, correction):
+    """
+    Corrected differential travel time, as written to dt.cc
+    """
+    return ((UTCDateTime(pick_1["pick_time"]) - UTCDateTime(event_1["origin_time"])) -
+            (UTCDateTime(pick_2["pick_time"]) + correction -
+             UTCDateTime(event_2["origin_time"])))
+
+
+class CrossCorrelationPipeline:
+    """
+    Read, filter and correlate stages connected by bounded queues.
+    loaded_windows ({pick id: filtered window}) fill the filtered window
+    cache up to its size, in their order.
+    """
+
+    def __init__(self, events, waveform_index, cc_params=None, io_threads=4,
+                 filter_threads=1, cc_threads=2, queue_depth=32,
+                 cache_size=5000, loaded_windows=None):
+        self.events = events
+        self.waveform_index = waveform_index
+        self.cc_params = dict(DEFAULT_CC_PARAMS, **(cc_params or {}))
+        self.threads = {"read": io_threads, "filter": filter_threads,
+                        "correlate": cc_threads}
+        self.pairs_queue = MeteredQueue("pairs", queue_depth)
+        self.raw_queue = MeteredQueue("raw", queue_depth)
+        self.filtered_queue = MeteredQueue("filtered", queue_depth)
+        self.results_queue = MeteredQueue("results", queue_depth)
+        self.raw_cache = WindowCache(cache_size)
+        self.filtered_cache = WindowCache(cache_size)
+        for pick_id, window in islice((loaded_windows or {}).items(), cache_size):
+            self.filtered_cache.put(pick_id, window)
+        self.busy = {name: 0.0 for name in self.threads}
+        self.counts = {"pairs": 0, "pick_pairs": 0, "failed_pick_pairs": 0}
+        self._lock = threading.Lock()
+        self._running = {}
+        self.error = None
+
+    def _add_busy(self, stage, seconds):
+        with self._lock:
+            self.busy[stage] += seconds
+
+    def _stage_finished(self, stage, out_queue, n_downstream):
+        """
+        The last thread of a stage to finish tells the next stage
+        """
+        with self._lock:
+            self._running[stage] -= 1
+            last = self._running[stage] == 0
+        if last:
+            for _ in range(n_downstream):
+                out_queue.put(_DONE)
+
+    def _components(self, pick):
+        weighting = phase_weighting(pick["phase"], self.cc_params) or {}
+        return [c for c, w in weighting.items() if w]
+
+    def _fail(self, error):
+        with self._lock:
+            if self.error is None:
+                self.error = error
+
+    def _worker(self, stage, in_queue, process, out_queue, n_downstream):
+        """
+        Run process on every item of in_queue. After an error anywhere in
+        the pipeline the items are only drained, so no stage blocks, and
+        the next stage is always told when this one is finished.
+        """
+        try:
+            while True:
+                item = in_queue.get()
+                if item is _DONE:
+                    break
+                if self.error is not None:
+                    continue
+                t0 = time.perf_counter()
+                try:
+                    result = process(item)
+                except BaseException as e:
+                    self._fail(e)
+                    continue
+                self._add_busy(stage, time.perf_counter() - t0)
+                out_queue.put(result)
+        finally:
+            self._stage_finished(stage, out_queue, n_downstream)
+
+    def _read_worker(self):
+        self._worker("read", self.pairs_queue, self._read, self.raw_queue,
+                     self.threads["filter"])
+
+    def _filter_worker(self):
+        self._worker("filter", self.raw_queue, self._filter, self.filtered_queue,
+                     self.threads["correlate"])
+
+    def _correlate_worker(self):
+        self._worker("correlate", self.filtered_queue, self._correlate,
+                     self.results_queue, 1)
+
+    def _read(self, item):
+        ev1, ev2, jobs = item
+        windows = {}
+        for pick_1, pick_2, _ in jobs:
+            for pick in (pick_1, pick_2):
+                if pick["id"] in windows or self.filtered_cache.get(pick["id"]) is not None:
+                    continue
+                window = self.raw_cache.get(pick["id"])
+                if window is None:
+                    window = load_pick_window(pick, self._components(pick),
+                                              self.waveform_index, self.cc_params)
+                    self.raw_cache.put(pick["id"], window)
+                windows[pick["id"]] = window
+        return ev1, ev2, jobs, windows
+
+    def _filter(self, item):
+        ev1, ev2, jobs, raw_windows = item
+        for pick_id, window in raw_windows.items():
+            if self.filtered_cache.get(pick_id) is None:
+                self.filtered_cache.put(pick_id, filter_window(window, self.cc_params))
+        windows = {}
+        for pick_1, pick_2, _ in jobs:
+            for pick in (pick_1, pick_2):
+                window = self.filtered_cache.get(pick["id"])
+                if window is None:
+                    # evicted between stages; redo it here
+                    window = filter_window(
+                        load_pick_window(pick, self._components(pick),
+                                         self.waveform_index, self.cc_params),
+                        self.cc_params)
+                    self.filtered_cache.put(pick["id"], window)
+                windows[pick["id"]] = window
+        return ev1, ev2, jobs, windows
+
+    def _correlate(self, item):
+        ev1, ev2, jobs, windows = item
+        event_1 = self.events[ev1 - 1]
+        event_2 = self.events[ev2 - 1]
+        records = []
+        failed = 0
+        for pick_1, pick_2, weighting in jobs:
+            result = correlate_pick_pair(pick_1, windows[pick_1["id"]],
+                                         pick_2, windows[pick_2["id"]],
+                                         weighting, self.cc_params)
+            if result is None:
+                failed += 1
+                continue
+            correction, coeff = result
+            dt = differential_time(event_1, pick_1, event_2, pick_2, correction)
+            records.append((pick_1["station_id"], dt, coeff, pick_1["phase"]))
+        return ev1, ev2, records, len(jobs), failed
+
+    def run(self, event_pairs, store, progress_every=500):
+        """
+        Correlate all event pairs not yet in the store and return metrics.
+        The first exception of any stage is raised once all threads have
+        stopped; the pairs finished before it are kept in the store.
+        """
+        t_start = time.perf_counter()
+        workers = []
+        for stage, target in (("read", self._read_worker),
+                              ("filter", self._filter_worker),
+                              ("correlate", self._correlate_worker)):
+            self._running[stage] = self.threads[stage]
+            for _ in range(self.threads[stage]):
+                t = threading.Thread(target=target, daemon=True)
+                t.start()
+                workers.append(t)
+
+        def feed():
+            try:
+                for ev1, ev2 in event_pairs:
+                    if self.error is not None:
+                        break
+                    if store.is_done(ev1, ev2):
+                        continue
+                    jobs = pair_jobs(self.events[ev1 - 1], self.events[ev2 - 1],
+                                     self.cc_params)
+                    self.pairs_queue.put((ev1, ev2, jobs))
+            except BaseException as e:
+                self._fail(e)
+            finally:
+                for _ in range(self.threads["read"]):
+                    self.pairs_queue.put(_DONE)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+        # The store is only written from this thread
+        while True:
+            item = self.results_queue.get()
+            if item is _DONE:
+                break
+            if self.error is not None:
+                continue
+            ev1, ev2, records, n_jobs, failed = item
+            try:
+                store.add_pair(ev1, ev2, records)
+            except BaseException as e:
+                self._fail(e)
+                continue
+            self.counts["pairs"] += 1
+            self.counts["pick_pairs"] += n_jobs
+            self.counts["failed_pick_pairs"] += failed
+            if progress_every and self.counts["pairs"] % progress_every == 0:
+                print(f"  {self.counts['pairs']} event pairs correlated")
+        feeder.join()
+        for t in workers:
+            t.join()
+        store.checkpoint()
+        if self.error is not None:
+            raise self.error
+        return self.metrics(time.perf_counter() - t_start)
+
+    def metrics(self, elapsed):
+        return {
+            "elapsed_seconds": elapsed,
+            "pairs_per_second": self.counts["pairs"] / elapsed if elapsed else None,
+            "counts": dict(self.counts),
+            "threads": dict(self.threads),
+            "busy_seconds": dict(self.busy),
+            "queues": {q.name: q.metrics() for q in (
+                self.pairs_queue, self.raw_queue, self.filtered_queue,
+                self.results_queue)},
+            "cache": {"raw_hits": self.raw_cache.hits,
+                      "raw_misses": self.raw_cache.misses,
+                      "filtered_hits": self.filtered_cache.hits,
+                      "filtered_misses": self.filtered_cache.misses},
+        }
+
+
+def _add_chunk_metrics(total, metrics):
+    """
+    Sum the metrics of one chunk of pairs into total
+    """
+    if not total:
+        total.update(metrics, chunks=0)
+    else:
+        for key in ("elapsed_seconds", "load_seconds"):
+            if key in metrics:
+                total[key] = total.get(key, 0.0) + metrics[key]
+        for key, value in metrics["counts"].items():
+            total["counts"][key] = total["counts"].get(key, 0) + value
+    total["chunks"] += 1
+    elapsed = total["elapsed_seconds"]
+    total["pairs_per_second"] = total["counts"]["pairs"] / elapsed if elapsed else None
+
+
+def run_cc_pipeline(working_dir="hypodd_working", waveform_index=None,
+                    cc_params=None, metrics_file=None, processes=None,
+                    schedule="pair", prescreen=None, event_pairs=None,
+                    chunk_size=None, maxdist=None, station_files=("stations.xml",),
+                    **pipeline_options):
+    """
+    Correlate all dt.ct event pairs of a relocator working directory,
+    write the results to the store and dt.cc, and return the metrics.
+
+    With processes > 1 the windows are loaded once into a shared memory
+    WaveformArena and correlated by a process pool instead of threads.
+    With schedule="station" the work is regrouped by station and phase so
+    that every pick window is read only once (see cc_scheduler.py).
+    prescreen (a dict of pick_prescreen thresholds, or True for the
+    defaults) drops noisy, gapped and clipped picks from all pairs first;
+    the filtered windows of the picks it keeps are handed on to the
+    correlation instead of being read again (not with chunk_size).
+    event_pairs restricts the work to a subset of the dt.ct pairs.
+    With chunk_size the events are read from events.json on demand
+    (pair_stream.EventIndex) and the pairs are streamed from dt.ct and
+    scheduled chunk_size at a time, so the memory does not grow with the
+    number of pairs.
+    maxdist drops the picks beyond maxdist km of their event, looked up in
+    the cached event-station geometry of station_files (station_geometry.py).
+    """
+    if waveform_index is None:
+        waveform_index = WaveformIndex()
+        waveform_index.add_directory("waveforms")
+    cc_params = dict(DEFAULT_CC_PARAMS, **(cc_params or {}))
+    events_file = os.path.join(working_dir, "working_files", "events.json")
+    if chunk_size:
+        from pair_stream import EventIndex
+        events = EventIndex(events_file)
+    else:
+        with open(events_file, "r") as f:
+            events = json.load(f)
+    dt_ct = os.path.join(working_dir, "input_files", "dt.ct")
+    store_file = os.path.join(working_dir, "working_files", "cc_results.txt")
+    if event_pairs is not None:
+        event_pairs = list(event_pairs)
+
+    def pairs():
+        return iter(event_pairs) if event_pairs is not None else iter_event_pairs(dt_ct)
+
+    def drop(events, rejected):
+        from pick_prescreen import apply_prescreen
+        if chunk_size:
+            events.drop_picks = (events.drop_picks or set()) | rejected
+            return events
+        return apply_prescreen(events, rejected)
+
+    distance_report = None
+    if maxdist is not None:
+        from station_geometry import load_geometry, out_of_range_picks
+        geometry = load_geometry(working_dir, list(station_files))
+        rejected, distance_report = out_of_range_picks(events, geometry, maxdist)
+        print(f"Dropped {len(rejected)} picks beyond {maxdist:g} km or at "
+              f"stations without coordinates")
+        events = drop(events, rejected)
+
+    report = None
+    # Kept for the whole run, so not when streaming in chunks
+    loaded_windows = None if chunk_size else {}
+    if prescreen:
+        from pick_prescreen import prescreen_picks, print_report
+        rejected, report = prescreen_picks(
+            events, pairs(), waveform_index, cc_params,
+            thresholds=prescreen if isinstance(prescreen, dict) else None,
+            io_threads=pipeline_options.get("io_threads", 4),
+            windows=loaded_windows)
+        print_report(report)
+        events = drop(events, rejected)
+
+    def correlate(event_pairs, store):
+        if processes and processes > 1:
+            from waveform_arena import correlate_with_processes
+            return correlate_with_processes(
+                events, event_pairs, waveform_index, store,
+                cc_params, processes=processes,
+                io_threads=pipeline_options.get("io_threads", 4),
+                loaded_windows=loaded_windows)
+        if schedule == "station":
+            from cc_scheduler import correlate_station_major
+            return correlate_station_major(
+                events, event_pairs, waveform_index, store,
+                cc_params, io_threads=pipeline_options.get("io_threads", 4),
+                loaded_windows=loaded_windows)
+        pipeline = CrossCorrelationPipeline(events, waveform_index, cc_params,
+                                            loaded_windows=loaded_windows,
+                                            **pipeline_options)
+        return pipeline.run(event_pairs, store)
+
+    with CCResultStore(store_file) as store:
+        if chunk_size and ((processes and processes > 1) or schedule == "station"):
+            # Both schedulers plan all the pairs they are given up front
+            from pair_stream import iter_pair_chunks
+            metrics = {}
+            for chunk in iter_pair_chunks(dt_ct, chunk_size, store, event_pairs):
+                _add_chunk_metrics(metrics, correlate(chunk, store))
+            if not metrics:
+                metrics = {"elapsed_seconds": 0.0, "pairs_per_second": None, "chunks": 0,
+                           "counts": {"pairs": 0, "pick_pairs": 0, "failed_pick_pairs": 0}}
+        else:
+            # The pair pipeline streams through its bounded queues anyway
+            metrics = correlate(pairs(), store)
+        n_pairs, n_lines = store.write_dt_cc(
+            os.path.join(working_dir, "input_files", "dt.cc"),
+            min_coeff=cc_params["cc_min_allowed_cross_corr_coeff"])
+    metrics["dt_cc_pairs"] = n_pairs
+    metrics["dt_cc_lines"] = n_lines
+    if report:
+        metrics["prescreen"] = report
+    if distance_report:
+        metrics["maxdist"] = distance_report
+
+    print(f"Correlated {metrics['counts']['pairs']} event pairs in "
+          f"{metrics['elapsed_seconds']:.1f} s")
+    for name, q in metrics.get("queues", {}).items():
+        print(f"  queue {name:9s} max depth {q['max_depth']:3d}, "
+              f"put stall {q['put_stall_seconds']:.1f} s, "
+              f"get stall {q['get_stall_seconds']:.1f} s")
+    if metrics_file:
+        with open(metrics_file, "w") as f:
+            json.dump(metrics, f, indent=2)
+    return metrics
+
+
+if __name__ == "__main__":
+    run_cc_pipeline(metrics_file=os.path.join("hypodd_working", "cc_metrics.json"))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Station-major scheduling of the cross-correlation work.
+
+Going through the event pairs in ph2dt order jumps between stations and
+waveform files for every pair, so a window cache keeps evicting windows it
+will need again soon. This scheduler first expands all event pairs into
+(pick_1, pick_2) jobs and regroups them by (station, phase, channels).
+Each group is then handled on its own: its windows are read once, in time
+order, every job of the group is correlated, and the windows are dropped
+before the next group. Results are collected per event pair and written to
+the CCResultStore in the usual per-pair layout once all jobs of a pair are
+done.
+"""
+import time
+from collections import defaultdict
+
+from obspy import UTCDateTime
+
+from cc_pipeline import (DEFAULT_CC_PARAMS, pair_jobs, load_windows,
+                         correlate_pick_pair, differential_time)
+
+
+def group_jobs(events, event_pairs, store, cc_params):
+    """
+    Expand event pairs into pick-pair jobs grouped by station, phase and
+    channels. Returns (groups, pending) where groups maps the group key to
+    a list of (ev1, ev2, job_index, pick_1, pick_2, weighting) and pending
+    maps every event pair to its number of jobs.
+    """
+    groups = defaultdict(list)
+    pending = {}
+    for ev1, ev2 in event_pairs:
+        if store.is_done(ev1, ev2):
+            continue
+        jobs = pair_jobs(events[ev1 - 1], events[ev2 - 1], cc_params)
+        pending[(ev1, ev2)] = len(jobs)
+        for job_index, (pick_1, pick_2, weighting) in enumerate(jobs):
+            channels = tuple(sorted(c for c, w in weighting.items() if w))
+            key = (pick_1["station_id"], pick_1["phase"], channels)
+            groups[key].append((ev1, ev2, job_index, pick_1, pick_2, weighting))
+    return groups, pending
+
+
+def order_group(jobs):
+    """
+    Order the jobs of a group so that the picks with most partners come
+    first and each pick's partners follow it
+    """
+    degree = defaultdict(int)
+    for _, _, _, pick_1, pick_2, _ in jobs:
+        degree[pick_1["id"]] += 1
+        degree[pick_2["id"]] += 1
+    return sorted(jobs, key=lambda job: (-degree[job[3]["id"]], job[3]["id"],
+                                         job[4]["pick_time"]))
+
+
+def correlate_station_major(events, event_pairs, waveform_index, store,
+                            cc_params=None, io_threads=4, loaded_windows=None):
+    """
+    Correlate all event pairs not yet in the store group by group and
+    return metrics. Windows in loaded_windows are not read again.
+    """
+    loaded_windows = loaded_windows or {}
+    cc_params = dict(DEFAULT_CC_PARAMS, **(cc_params or {}))
+    t_start = time.perf_counter()
+    groups, pending = group_jobs(events, event_pairs, store, cc_params)
+
+    # Pairs without a single common station/phase are done right away
+    for pair, n_jobs in list(pending.items()):
+        if n_jobs == 0:
+            store.add_pair(pair[0], pair[1], [])
+            del pending[pair]
+
+    results = defaultdict(list)
+    counts = {"groups": len(groups), "pairs": 0, "pick_pairs": 0,
+              "failed_pick_pairs": 0, "window_loads": 0}
+    load_seconds = 0.0
+    for key in sorted(groups):
+        jobs = order_group(groups[key])
+        picks = {}
+        for _, _, _, pick_1, pick_2, _ in jobs:
+            picks[pick_1["id"]] = pick_1
+            picks[pick_2["id"]] = pick_2
+
+        # Read the windows of the group once, in time order
+        t0 = time.perf_counter()
+        ordered = sorted(picks.values(), key=lambda p: UTCDateTime(p["pick_time"]))
+        windows = load_windows(ordered, waveform_index, cc_params, io_threads,
+                               loaded_windows)
+        load_seconds += time.perf_counter() - t0
+        counts["window_loads"] += sum(1 for p in ordered if p["id"] not in loaded_windows)
+
+        for ev1, ev2, job_index, pick_1, pick_2, weighting in jobs:
+            counts["pick_pairs"] += 1
+            result = correlate_pick_pair(pick_1, windows[pick_1["id"]],
+                                         pick_2, windows[pick_2["id"]],
+                                         weighting, cc_params)
+            if result is None:
+                counts["failed_pick_pairs"] += 1
+            else:
+                correction, coeff = result
+                dt = differential_time(events[ev1 - 1], pick_1,
+                                       events[ev2 - 1], pick_2, correction)
+                results[(ev1, ev2)].append(
+                    (job_index, (pick_1["station_id"], dt, coeff, pick_1["phase"])))
+            pending[(ev1, ev2)] -= 1
+            if pending[(ev1, ev2)] == 0:
+                # Back to the per-pair layout, in the original pick order
+                records = [r for _, r in sorted(results.pop((ev1, ev2), []))]
+                store.add_pair(ev1, ev2, records)
+                del pending[(ev1, ev2)]
+                counts["pairs"] += 1
+        del windows
+    store.checkpoint()
+
+    elapsed = time.perf_counter() - t_start
+    n_picks = sum(len({j[3]["id"] for j in g} | {j[4]["id"] for j in g})
+                  for g in groups.values())
+    return {
+        "elapsed_seconds": elapsed,
+        "load_seconds": load_seconds,
+        "pairs_per_second": counts["pairs"] / elapsed if elapsed else None,
+        "loads_per_window": counts["window_loads"] / max(n_picks, 1),
+        "counts": counts,
+    }
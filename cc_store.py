@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Append-only store for cross-correlation results.
+
+Instead of one small text file per event pair (working_files/cc_files/),
+all results go into a single buffered file:
+
+    R <ev1> <ev2> <station_id> <dt> <coeff> <phase>   one correlated pick pair
+    D <ev1> <ev2>                                      event pair finished
+
+A checkpoint file next to the store records the byte offset up to which
+the store has been flushed and fsynced. After a crash the store is cut
+back to that offset (or, without a checkpoint file, to the last finished
+pair) and every pair finished before it is skipped on resume. dt.cc is then written in one sequential pass.
+
+Every computed pick pair is kept, whatever its coefficient. The
+cc_min_allowed_cross_corr_coeff threshold is only applied when dt.cc is
+written, so rebuild_dt_cc can try another threshold without touching a
+single waveform.
+"""
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+from waveform_index import parse_time
+
+WORKING_DIR = "hypodd_working"
+DEFAULT_STORE = os.path.join(WORKING_DIR, "working_files", "cc_results.txt")
+DEFAULT_DT_CC = os.path.join(WORKING_DIR, "input_files", "dt.cc")
+
+
+def format_pair(event_1, event_2, records):
+    """
+    The store lines of one finished event pair
+    """
+    lines = [f"R {event_1} {event_2} {sta} {dt:.6f} {coeff:.4f} {phase}\n"
+             for sta, dt, coeff, phase in records]
+    lines.append(f"D {event_1} {event_2}\n")
+    return "".join(lines)
+
+
+def parse_pairs(lines):
+    """
+    Yield (event_1, event_2, records) for every finished pair of store
+    lines; records of an unfinished last pair are dropped
+    """
+    records = []
+    for line in lines:
+        if line.startswith("R "):
+            _, ev1, ev2, sta, dt, coeff, phase = line.split()
+            records.append((sta, float(dt), float(coeff), phase))
+        elif line.startswith("D "):
+            _, ev1, ev2 = line.split()
+            yield int(ev1), int(ev2), records
+            records = []
+
+
+class CCResultStore:
+    """
+    Buffered, append-only result store with periodic checkpoints
+    """
+
+    def __init__(self, filename=DEFAULT_STORE, checkpoint_every=500,
+                 checkpoint_seconds=60.0, buffer_size=1 << 20):
+        self.filename = filename
+        self.checkpoint_file = filename + ".ckpt"
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_seconds = checkpoint_seconds
+        # Finished pairs as ev1 << 32 | ev2: a sorted array plus a set of
+        # the recent ones, merged into the array now and then (8 bytes
+        # per pair instead of a tuple in a set)
+        self._done = np.zeros(0, dtype=np.int64)
+        self._recent = set()
+        self._pending = 0
+        self._last_checkpoint = time.monotonic()
+
+        directory = os.path.dirname(filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._recover()
+        self._file = open(filename, "a", buffering=buffer_size)
+
+    def _recover(self):
+        """
+        Cut the store back to the last checkpoint and load finished pairs
+        """
+        if not os.path.exists(self.filename):
+            open(self.filename, "w").close()
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file, "r") as f:
+                offset = json.load(f)["offset"]
+        else:
+            offset = self._last_pair_end()
+        if os.path.getsize(self.filename) != offset:
+            with open(self.filename, "r+") as f:
+                f.truncate(offset)
+        for line in self._iter_lines():
+            if line.startswith("D "):
+                _, ev1, ev2 = line.split()
+                self._mark_done(int(ev1), int(ev2))
+
+    def _last_pair_end(self):
+        """
+        Byte offset after the last complete "D ev1 ev2" line, for a store
+        without a checkpoint file (copied, or written by an older version)
+        """
+        offset = 0
+        position = 0
+        with open(self.filename, "rb") as f:
+            for line in f:
+                position += len(line)
+                if line.startswith(b"D ") and line.endswith(b"\n") and len(line.split()) == 3:
+                    offset = position
+        return offset
+
+    def _iter_lines(self):
+        with open(self.filename, "r") as f:
+            for line in f:
+                yield line
+
+    def _compact(self):
+        if self._recent:
+            recent = np.fromiter(self._recent, dtype=np.int64, count=len(self._recent))
+            self._done = np.sort(np.concatenate((self._done, recent)))
+            self._recent = set()
+
+    def _mark_done(self, event_1, event_2):
+        # The recent set never holds a pair already in the array
+        if not self.is_done(event_1, event_2):
+            self._recent.add(event_1 << 32 | event_2)
+            if len(self._recent) >= 100000:
+                self._compact()
+
+    def is_done(self, event_1, event_2):
+        key = event_1 << 32 | event_2
+        if key in self._recent:
+            return True
+        i = self._done.searchsorted(key)
+        return bool(i < len(self._done) and self._done[i] == key)
+
+    @property
+    def n_completed(self):
+        return len(self._done) + len(self._recent)
+
+    def add_pair(self, event_1, event_2, records):
+        """
+        Append the results of one event pair.
+
+        records is a list of (station_id, dt, coeff, phase) tuples and
+        should include the pick pairs below the correlation threshold.
+        The pair is only considered done once it has been checkpointed.
+        """
+        self._file.write(format_pair(event_1, event_2, records))
+        self._mark_done(event_1, event_2)
+        self._pending += 1
+        if (self._pending >= self.checkpoint_every or
+                time.monotonic() - self._last_checkpoint > self.checkpoint_seconds):
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Flush and fsync the store, then atomically record its size
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        tmp = self.checkpoint_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"offset": self._file.tell(),
+                       "pairs": self.n_completed}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_file)
+        self._pending = 0
+        self._last_checkpoint = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.checkpoint()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def iter_pairs(self):
+        """
+        Yield (event_1, event_2, records) for every finished pair in
+        store order
+        """
+        self._file.flush()
+        return parse_pairs(self._iter_lines())
+
+    def write_dt_cc(self, filename, min_coeff=0.0, binary=False):
+        """
+        Write all stored pairs to a HypoDD dt.cc file in one pass; with
+        binary=True in the binary format of dt_binary.py
+        """
+        n_pairs = 0
+        n_lines = 0
+        if binary:
+            from dt_binary import DtBinaryWriter, KIND_CC
+            with DtBinaryWriter(filename, KIND_CC) as writer:
+                for ev1, ev2, records in self.iter_pairs():
+                    n_pairs += 1
+                    for sta, dt, coeff, phase in records:
+                        if coeff < min_coeff:
+                            continue
+                        # The values the text file would carry
+                        writer.add(ev1, ev2, sta, float(f"{dt:.6f}"), 0.0,
+                                   float(f"{coeff:.4f}"), phase)
+                        n_lines += 1
+            return n_pairs, n_lines
+        with open(filename, "w", buffering=1 << 20) as f:
+            for ev1, ev2, records in self.iter_pairs():
+                f.write(f"# {ev1}  {ev2} 0.0\n")
+                n_pairs += 1
+                for sta, dt, coeff, phase in records:
+                    if coeff < min_coeff:
+                        continue
+                    f.write(f"{sta} {dt:.6f} {coeff:.4f} {phase}\n")
+                    n_lines += 1
+        return n_pairs, n_lines
+
+
+def import_cc_files(cc_dir, store):
+    """
+    Move the per-pair files written by the relocator (cc_files/*.txt)
+    into a store
+    """
+    n_imported = 0
+    for name in sorted(os.listdir(cc_dir)):
+        if not name.endswith(".txt"):
+            continue
+        ev1, ev2 = map(int, name[:-4].split("_"))
+        if store.is_done(ev1, ev2):
+            continue
+        records = []
+        with open(os.path.join(cc_dir, name), "r") as f:
+            for line in f:
+                parts = line.split()
+                if not parts or parts[0] == "#":
+                    continue
+                sta, dt, coeff, phase = parts
+                records.append((sta, float(dt), float(coeff), phase))
+        store.add_pair(ev1, ev2, records)
+        n_imported += 1
+    store.checkpoint()
+    return n_imported
+
+
+def import_dt_cc(dt_cc, store):
+    """
+    Fill a store from a HypoDD dt.cc file, for working directories that
+    have neither a store nor cc_files
+    """
+    n_imported = 0
+
+    def add(pair, records):
+        if pair and not store.is_done(*pair):
+            store.add_pair(pair[0], pair[1], records)
+            return 1
+        return 0
+
+    pair, records = None, []
+    with open(dt_cc, "r") as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == "#":
+                n_imported += add(pair, records)
+                pair, records = (int(parts[1]), int(parts[2])), []
+            elif parts[0].startswith("#"):
+                n_imported += add(pair, records)
+                pair, records = (int(parts[0][1:]), int(parts[1])), []
+            else:
+                sta, dt, coeff, phase = parts[:4]
+                records.append((sta, float(dt), float(coeff), phase))
+    n_imported += add(pair, records)
+    store.checkpoint()
+    return n_imported
+
+
+def iter_event_pairs(dt_ct):
+    """
+    Yield the (event_1, event_2) pairs of a ph2dt dt.ct file
+    """
+    with open(dt_ct, "r") as f:
+        for line in f:
+            if line.startswith("#"):
+                ev1, ev2 = line[1:].split()[:2]
+                yield int(ev1), int(ev2)
+
+
+def import_cc_results(cc_results_file, events_file, dt_ct, store):
+    """
+    Fill a store from the relocator's output_cross_correlation_file.
+
+    That JSON maps pick_1 id -> pick_2 id -> [pick_2 correction, coeff]
+    for every correlated pick pair, including the discarded ones. The
+    differential times are rebuilt as in the relocator:
+    (pick_1 - origin_1) - (pick_2 + correction - origin_2).
+    """
+    with open(cc_results_file, "r") as f:
+        cc_results = json.load(f)
+    with open(events_file, "r") as f:
+        events = json.load(f)
+
+    n_imported = 0
+    for ev1, ev2 in iter_event_pairs(dt_ct):
+        if store.is_done(ev1, ev2):
+            continue
+        # HypoDD event ids are 1-based positions in events.json
+        event_1 = events[ev1 - 1]
+        event_2 = events[ev2 - 1]
+        origin_1 = parse_time(event_1["origin_time"])
+        origin_2 = parse_time(event_2["origin_time"])
+        records = []
+        for pick_1 in event_1["picks"]:
+            if pick_1["phase"] not in ("P", "S"):
+                continue
+            for pick_2 in event_2["picks"]:
+                if (pick_1["station_id"] == pick_2["station_id"] and
+                        pick_1["phase"] == pick_2["phase"]):
+                    break
+            else:
+                continue
+            result = cc_results.get(pick_1["id"], {}).get(pick_2["id"])
+            if not result:
+                continue
+            correction, coeff = result
+            dt = ((parse_time(pick_1["pick_time"]) - origin_1).total_seconds() -
+                  ((parse_time(pick_2["pick_time"]) - origin_2).total_seconds() +
+                   correction))
+            records.append((pick_1["station_id"], dt, coeff, pick_1["phase"]))
+        store.add_pair(ev1, ev2, records)
+        n_imported += 1
+    store.checkpoint()
+    return n_imported
+
+
+def rebuild_dt_cc(threshold, store_file=DEFAULT_STORE, output=DEFAULT_DT_CC):
+    """
+    Regenerate dt.cc for a new correlation threshold from stored results
+    """
+    with CCResultStore(store_file) as store:
+        n_pairs, n_lines = store.write_dt_cc(output, min_coeff=threshold)
+    print(f"Wrote {n_pairs} pairs ({n_lines} differential times with "
+          f"coeff >= {threshold}) to {output}")
+    return n_pairs, n_lines
+
+
+def threshold_summary(thresholds, store_file=DEFAULT_STORE, min_links=1):
+    """
+    For each threshold count the differential times, the event pairs
+    with at least min_links of them and the events in such pairs
+    """
+    thresholds = sorted(thresholds)
+    summary = {t: {"dt": 0, "pairs": 0, "events": set()} for t in thresholds}
+    with CCResultStore(store_file) as store:
+        for ev1, ev2, records in store.iter_pairs():
+            coeffs = [coeff for _, _, coeff, _ in records]
+            for t in thresholds:
+                n = sum(1 for c in coeffs if c >= t)
+                summary[t]["dt"] += n
+                if n >= min_links:
+                    summary[t]["pairs"] += 1
+                    summary[t]["events"].update((ev1, ev2))
+    for t in thresholds:
+        summary[t]["events"] = len(summary[t]["events"])
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Manage stored cross-correlation results and rebuild dt.cc")
+    parser.add_argument("--threshold", type=float, default=0.5,
+                        help="minimum correlation coefficient for dt.cc")
+    parser.add_argument("--store", default=DEFAULT_STORE)
+    parser.add_argument("--output", default=DEFAULT_DT_CC)
+    parser.add_argument("--import-cc-files", metavar="DIR",
+                        help="import a relocator cc_files/ directory")
+    parser.add_argument("--import-cc-results", metavar="JSON",
+                        help="import a relocator cross correlation results file")
+    parser.add_argument("--sweep", type=float, nargs="+", metavar="THRESHOLD",
+                        help="only report how many events each threshold links")
+    args = parser.parse_args(argv)
+
+    if args.import_cc_files or args.import_cc_results:
+        with CCResultStore(args.store) as store:
+            if args.import_cc_files:
+                n = import_cc_files(args.import_cc_files, store)
+                print(f"Imported {n} pairs from {args.import_cc_files}")
+            if args.import_cc_results:
+                n = import_cc_results(
+                    args.import_cc_results,
+                    os.path.join(WORKING_DIR, "working_files", "events.json"),
+                    os.path.join(WORKING_DIR, "input_files", "dt.ct"), store)
+                print(f"Imported {n} pairs from {args.import_cc_results}")
+
+    if args.sweep:
+        print("Threshold | dt lines | pairs | events")
+        for t, row in threshold_summary(args.sweep, args.store).items():
+            print(f"{t:9.2f} | {row['dt']:8d} | {row['pairs']:5d} | {row['events']:6d}")
+    else:
+        rebuild_dt_cc(args.threshold, args.store, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Cross-correlation sharded over several machines through a work queue on
+a shared filesystem.
+
+The coordinator splits the dt.ct event pairs that are not yet in the
+CCResultStore into units and exports them to a queue directory that
+every node mounts:
+
+    config.json          working directory, waveform directories, cc_params
+    units/u000042.json   the event pairs of one unit
+    leases/u000042       claim of a worker (created with O_EXCL)
+    results/u000042.txt  committed results, CCResultStore lines
+    attempts/            one file per failed attempt of a unit
+    finished             written once all results are merged
+
+Workers (python hypodd_cli.py cc-worker <queue_dir>, on any node) claim
+a unit by creating its lease file, which fails if another worker got
+there first, and correlate it (station-major, cc_scheduler.py). While
+they work they touch the lease every --heartbeat seconds. The results
+are written to a temporary file and renamed into results/, so a unit is
+either committed completely or not at all.
+
+The coordinator merges committed units into the store in unit order, so
+dt.cc keeps the dt.ct order, and requeues leases whose modification
+time has not changed for --lease-timeout seconds of its own clock.
+Clocks of different nodes are never compared. A worker that lost its
+lease (its heartbeat finds the file gone or taken over) drops the unit.
+A unit committed twice holds the same results, and pairs already in the
+store are skipped on merge. When every unit is merged, dt.cc is written
+from the store as by run_cc_pipeline.
+
+On one machine, --local-workers starts that many worker processes next
+to the coordinator:
+
+    python cc_workqueue.py export hypodd_working --unit-size 200
+    python cc_workqueue.py coordinate hypodd_working --local-workers 4
+    python hypodd_cli.py cc-worker hypodd_working/cc_queue   # on other nodes
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import argparse
+import threading
+import subprocess
+
+from cc_store import CCResultStore, format_pair, parse_pairs, iter_event_pairs
+
+WORKING_DIR = "hypodd_working"
+QUEUE_NAME = "cc_queue"
+
+
+# --- queue layout ----------------------------------------------------------
+
+class WorkQueue:
+    """
+    Paths and file operations of a queue directory
+    """
+
+    def __init__(self, queue_dir):
+        self.queue_dir = os.path.abspath(queue_dir)
+        self.units_dir = os.path.join(self.queue_dir, "units")
+        self.leases_dir = os.path.join(self.queue_dir, "leases")
+        self.results_dir = os.path.join(self.queue_dir, "results")
+        self.attempts_dir = os.path.join(self.queue_dir, "attempts")
+        self.config_file = os.path.join(self.queue_dir, "config.json")
+        self.finished_file = os.path.join(self.queue_dir, "finished")
+
+    def create(self):
+        for directory in (self.units_dir, self.leases_dir, self.results_dir,
+                          self.attempts_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    def exists(self):
+        return os.path.exists(self.config_file)
+
+    def config(self):
+        with open(self.config_file, "r") as f:
+            return json.load(f)
+
+    def units(self):
+        return sorted(name[:-5] for name in os.listdir(self.units_dir)
+                      if name.endswith(".json"))
+
+    def unit_pairs(self, unit):
+        with open(os.path.join(self.units_dir, unit + ".json"), "r") as f:
+            return [tuple(pair) for pair in json.load(f)]
+
+    def lease_file(self, unit):
+        return os.path.join(self.leases_dir, unit)
+
+    def result_file(self, unit):
+        return os.path.join(self.results_dir, unit + ".txt")
+
+    def is_committed(self, unit):
+        return os.path.exists(self.result_file(unit))
+
+    def attempts(self, unit):
+        prefix = unit + "."
+        return sum(1 for name in os.listdir(self.attempts_dir) if name.startswith(prefix))
+
+    def is_finished(self):
+        return os.path.exists(self.finished_file)
+
+    def status(self):
+        units = self.units()
+        committed = sum(1 for unit in units if self.is_committed(unit))
+        leased = len([name for name in os.listdir(self.leases_dir)
+                      if not name.startswith(".")])
+        return {"units": len(units), "committed": committed, "leased": leased,
+                "finished": self.is_finished()}
+
+
+def _write_atomic(filename, text):
+    tmp = f"{filename}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+def export_units(working_dir=WORKING_DIR, queue_dir=None, unit_size=200,
+                 waveform_dirs=("waveforms",), cc_params=None, max_attempts=3,
+                 event_pairs=None):
+    """
+    Split the dt.ct event pairs not yet in the store into units in
+    queue_dir; returns the queue. An exported queue is left as it is.
+    """
+    from cc_pipeline import DEFAULT_CC_PARAMS
+
+    working_dir = os.path.abspath(working_dir)
+    queue = WorkQueue(queue_dir or os.path.join(working_dir, QUEUE_NAME))
+    if queue.exists():
+        print(f"Queue {queue.queue_dir} already exported ({len(queue.units())} units)")
+        return queue
+    queue.create()
+    store_file = os.path.join(working_dir, "working_files", "cc_results.txt")
+    if event_pairs is None:
+        event_pairs = iter_event_pairs(os.path.join(working_dir, "input_files", "dt.ct"))
+    with CCResultStore(store_file) as store:
+        todo = [pair for pair in event_pairs if not store.is_done(*pair)]
+    n_units = 0
+    for start in range(0, len(todo), unit_size):
+        _write_atomic(os.path.join(queue.units_dir, f"u{n_units:06d}.json"),
+                      json.dumps(todo[start:start + unit_size]))
+        n_units += 1
+    # Written last: a queue without config.json is not ready
+    _write_atomic(queue.config_file, json.dumps({
+        "working_dir": working_dir,
+        "events_file": os.path.join(working_dir, "working_files", "events.json"),
+        "waveform_dirs": [os.path.abspath(d) for d in waveform_dirs],
+        "cc_params": dict(DEFAULT_CC_PARAMS, **(cc_params or {})),
+        "max_attempts": max_attempts,
+        "created": time.time(),
+    }, indent=1))
+    print(f"Exported {len(todo)} event pairs in {n_units} units to {queue.queue_dir}")
+    return queue
+
+
+# --- worker ----------------------------------------------------------------
+
+class Lease:
+    """
+    A claimed unit; a thread touches the lease file until release()
+    """
+
+    def __init__(self, queue, unit, worker_id, heartbeat):
+        self.queue = queue
+        self.unit = unit
+        self.filename = queue.lease_file(unit)
+        self.token = f"{worker_id} {uuid.uuid4().hex}"
+        self.heartbeat = heartbeat
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def claim(self):
+        try:
+            fd = os.open(self.filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(self.token + "\n")
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+        self._thread.start()
+        return True
+
+    def is_mine(self):
+        try:
+            with open(self.filename, "r") as f:
+                return f.read().strip() == self.token
+        except FileNotFoundError:
+            return False
+
+    def _beat(self):
+        while not self._stop.wait(self.heartbeat):
+            if not self.is_mine():
+                self.lost.set()
+                return
+            try:
+                os.utime(self.filename)
+            except FileNotFoundError:
+                self.lost.set()
+                return
+
+    def release(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.is_mine():
+            os.remove(self.filename)
+
+
+class _UnitResults:
+    """
+    The store interface the correlation functions write to, kept in memory
+    """
+
+    def __init__(self):
+        self.pairs = []
+
+    def is_done(self, event_1, event_2):
+        return False
+
+    def add_pair(self, event_1, event_2, records):
+        self.pairs.append((event_1, event_2, records))
+
+    def checkpoint(self):
+        pass
+
+
+def correlate_unit(pairs, events, waveform_index, cc_params):
+    """
+    Results of one unit as CCResultStore lines
+    """
+    from cc_scheduler import correlate_station_major
+    results = _UnitResults()
+    correlate_station_major(events, pairs, waveform_index, results, cc_params)
+    # Station-major finishes pairs out of order; write them in unit order
+    position = {pair: i for i, pair in enumerate(pairs)}
+    results.pairs.sort(key=lambda result: position[result[:2]])
+    return "".join(format_pair(ev1, ev2, records) for ev1, ev2, records in results.pairs)
+
+
+def run_worker(queue_dir, worker_id=None, heartbeat=10.0, poll=5.0, max_units=None):
+    """
+    Claim, correlate and commit units until the queue is finished or
+    max_units are done; returns the number of units committed
+    """
+    from waveform_index import WaveformIndex
+
+    queue = WorkQueue(queue_dir)
+    while not queue.exists():
+        print(f"Waiting for {queue.config_file}")
+        time.sleep(poll)
+    config = queue.config()
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    with open(config["events_file"], "r") as f:
+        events = json.load(f)
+    waveform_index = WaveformIndex()
+    for directory in config["waveform_dirs"]:
+        waveform_index.add_directory(directory)
+    rng = random.Random(worker_id)
+
+    n_committed = 0
+    while not queue.is_finished() and (max_units is None or n_committed < max_units):
+        open_units = [unit for unit in queue.units() if not queue.is_committed(unit)]
+        if not open_units:
+            break
+        candidates = [unit for unit in open_units
+                      if not os.path.exists(queue.lease_file(unit))]
+        if not candidates:
+            time.sleep(poll)
+            continue
+        # Different workers start at different units
+        rng.shuffle(candidates)
+        for unit in candidates:
+            if queue.attempts(unit) >= config["max_attempts"]:
+                continue
+            lease = Lease(queue, unit, worker_id, heartbeat)
+            if lease.claim():
+                break
+        else:
+            time.sleep(poll)
+            continue
+
+        t0 = time.perf_counter()
+        try:
+            if queue.is_committed(unit):
+                continue
+            text = correlate_unit(queue.unit_pairs(unit), events, waveform_index,
+                                  config["cc_params"])
+            if lease.lost.is_set():
+                print(f"{worker_id}: lost the lease of {unit}, dropped")
+                continue
+            _write_atomic(queue.result_file(unit), text)
+            n_committed += 1
+            print(f"{worker_id}: committed {unit} ({time.perf_counter() - t0:.1f} s)")
+        except Exception as e:
+            print(f"{worker_id}: {unit} failed ({e})")
+            _write_atomic(os.path.join(queue.attempts_dir, f"{unit}.{uuid.uuid4().hex}"),
+                          f"{worker_id}: {e}\n")
+        finally:
+            lease.release()
+    return n_committed
+
+
+# --- coordinator -----------------------------------------------------------
+
+def requeue_expired(queue, seen, lease_timeout, now=None):
+    """
+    Remove the leases whose modification time has not changed for
+    lease_timeout seconds. seen maps a unit to (mtime_ns, first seen),
+    both by this process, and is updated in place.
+    """
+    now = time.monotonic() if now is None else now
+    expired = []
+    for unit in os.listdir(queue.leases_dir):
+        try:
+            mtime = os.stat(queue.lease_file(unit)).st_mtime_ns
+        except FileNotFoundError:
+            seen.pop(unit, None)
+            continue
+        if unit not in seen or seen[unit][0] != mtime:
+            seen[unit] = (mtime, now)
+        elif now - seen[unit][1] > lease_timeout:
+            try:
+                os.remove(queue.lease_file(unit))
+            except FileNotFoundError:
+                pass
+            del seen[unit]
+            expired.append(unit)
+    for unit in list(seen):
+        if not os.path.exists(queue.lease_file(unit)):
+            del seen[unit]
+    return expired
+
+
+def merge_results(queue, store, merged, units, skip=()):
+    """
+    Add committed units to the store in unit order, so the store and
+    dt.cc keep the dt.ct order whichever worker finished first. Stops
+    at the first unit that is neither committed nor in skip; returns
+    the number of units merged.
+    """
+    n = 0
+    for unit in units:
+        if unit in merged or unit in skip:
+            continue
+        if not queue.is_committed(unit):
+            break
+        with open(queue.result_file(unit), "r") as f:
+            for ev1, ev2, records in parse_pairs(f):
+                if not store.is_done(ev1, ev2):
+                    store.add_pair(ev1, ev2, records)
+        merged.add(unit)
+        n += 1
+    if n:
+        store.checkpoint()
+    return n
+
+
+def start_local_workers(queue_dir, n_workers, heartbeat, poll):
+    """
+    Worker processes on this machine, standing in for other nodes
+    """
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hypodd_cli.py")
+    return [subprocess.Popen([sys.executable, cli, "cc-worker", queue_dir,
+                              "--worker-id", f"{socket.gethostname()}-local{i}",
+                              "--heartbeat", str(heartbeat), "--poll", str(poll)])
+            for i in range(n_workers)]
+
+
+def coordinate(working_dir=WORKING_DIR, queue_dir=None, lease_timeout=60.0,
+               poll=5.0, local_workers=0, heartbeat=10.0):
+    """
+    Merge committed units and requeue expired leases until every unit is
+    in the store, then write dt.cc; returns (pairs, lines) of dt.cc
+    """
+    working_dir = os.path.abspath(working_dir)
+    queue = WorkQueue(queue_dir or os.path.join(working_dir, QUEUE_NAME))
+    if not queue.exists():
+        raise RuntimeError(f"No queue in {queue.queue_dir}; export it first")
+    config = queue.config()
+    store_file = os.path.join(working_dir, "working_files", "cc_results.txt")
+    workers = start_local_workers(queue.queue_dir, local_workers, heartbeat, poll)
+    units = queue.units()
+    merged = set()
+    seen = {}
+    workers_exited = False
+    t0 = time.monotonic()
+    try:
+        with CCResultStore(store_file) as store:
+            while True:
+                given_up = {unit for unit in units if unit not in merged
+                            and not queue.is_committed(unit)
+                            and queue.attempts(unit) >= config["max_attempts"]}
+                merge_results(queue, store, merged, units, given_up)
+                for unit in requeue_expired(queue, seen, lease_timeout):
+                    print(f"Lease of {unit} expired, requeued")
+                if len(merged) + len(given_up) >= len(units):
+                    break
+                print(f"{len(merged)}/{len(units)} units merged, "
+                      f"{len(os.listdir(queue.leases_dir))} leased "
+                      f"({time.monotonic() - t0:.0f} s)")
+                if workers and all(w.poll() is not None for w in workers):
+                    # A unit committed after the merge above, just before
+                    # the last worker exited, is merged on one more pass
+                    if workers_exited:
+                        raise RuntimeError("All local workers exited before the queue was done")
+                    workers_exited = True
+                    continue
+                time.sleep(poll)
+            _write_atomic(queue.finished_file, f"{time.time()}\n")
+            for unit in sorted(given_up):
+                print(f"Unit {unit} failed {config['max_attempts']} times, left out")
+            n_pairs, n_lines = store.write_dt_cc(
+                os.path.join(working_dir, "input_files", "dt.cc"),
+                min_coeff=config["cc_params"]["cc_min_allowed_cross_corr_coeff"])
+    finally:
+        for worker in workers:
+            try:
+                worker.wait(timeout=2 * poll + heartbeat)
+            except subprocess.TimeoutExpired:
+                worker.terminate()
+                worker.wait()
+    print(f"Merged {len(merged)} units in {time.monotonic() - t0:.1f} s; "
+          f"dt.cc has {n_pairs} pairs, {n_lines} differential times")
+    return n_pairs, n_lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Cross-correlation work queue on a shared filesystem")
+    sub = parser.add_subparsers(dest="command", metavar="command")
+    sub.required = True
+
+    p = sub.add_parser("export", help="split the dt.ct pairs into units")
+    p.add_argument("working_dir", nargs="?", default=WORKING_DIR)
+    p.add_argument("--queue-dir", help=f"default: <working_dir>/{QUEUE_NAME}")
+    p.add_argument("--unit-size", type=int, default=200, help="event pairs per unit")
+    p.add_argument("--waveforms", nargs="+", default=["waveforms"],
+                   help="waveform directories, as every node sees them")
+    p.add_argument("--max-attempts", type=int, default=3)
+
+    p = sub.add_parser("coordinate", help="merge results and requeue expired leases")
+    p.add_argument("working_dir", nargs="?", default=WORKING_DIR)
+    p.add_argument("--queue-dir", help=f"default: <working_dir>/{QUEUE_NAME}")
+    p.add_argument("--lease-timeout", type=float, default=60.0)
+    p.add_argument("--poll", type=float, default=5.0)
+    p.add_argument("--local-workers", type=int, default=0,
+                   help="also start this many workers on this machine")
+    p.add_argument("--heartbeat", type=float, default=10.0,
+                   help="heartbeat of the local workers")
+
+    p = sub.add_parser("work", help="claim and correlate units (the cc-worker)")
+    p.add_argument("queue_dir")
+    p.add_argument("--worker-id")
+    p.add_argument("--heartbeat", type=float, default=10.0)
+    p.add_argument("--poll", type=float, default=5.0)
+    p.add_argument("--max-units", type=int)
+
+    p = sub.add_parser("status", help="units committed and leased")
+    p.add_argument("queue_dir")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export_units(args.working_dir, args.queue_dir, args.unit_size, args.waveforms,
+                     max_attempts=args.max_attempts)
+    elif args.command == "coordinate":
+        coordinate(args.working_dir, args.queue_dir, args.lease_timeout, args.poll,
+                   args.local_workers, args.heartbeat)
+    elif args.command == "work":
+        n = run_worker(args.queue_dir, args.worker_id, args.heartbeat, args.poll,
+                       args.max_units)
+        print(f"Committed {n} units")
+    else:
+        print(json.dumps(WorkQueue(args.queue_dir).status(), indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Match and compare earthquake catalogs: SEISAN hypsum.out summaries and
+HypoDD hypoDD.reloc / hypoDD.loc files.
+
+    python compare_catalogs.py Original_model/hypsum.out Velest_models/hypsum.out
+    python compare_catalogs.py Original_model/hypsum.out hypodd_working/hypoDD.reloc
+
+Both formats are fixed width, so each file is read into one NumPy byte
+array (lines x columns) and every field is converted with a single
+astype on its column slice instead of parsing line by line.
+
+Events are matched on a KD-tree over local east/north/depth coordinates
+plus origin time scaled to km (max_distance / max_dt), so one query finds
+the candidates near in space and time. Candidates are then checked
+against both limits exactly and paired one to one, closest first. The
+report gives the shift vectors, the change of the horizontal and vertical
+errors and the unmatched events of each catalog.
+"""
+import os
+import csv
+import argparse
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+KM_PER_DEGREE = 111.19
+
+# (name, start, end) of the hypsum.out fields, 0-based end exclusive
+HYPSUM_COLUMNS = [
+    ("date", 0, 6), ("hhmm", 7, 11), ("sec", 11, 17),
+    ("lat_deg", 17, 20), ("lat_hemi", 20, 21), ("lat_min", 21, 26),
+    ("lon_deg", 26, 30), ("lon_hemi", 30, 31), ("lon_min", 31, 36),
+    ("depth", 36, 43), ("mag", 43, 50), ("nobs", 50, 53), ("gap", 53, 57),
+    ("dmin", 57, 62), ("rms", 62, 67), ("erh", 67, 72), ("erz", 72, 77),
+    ("erx", 77, 82),
+]
+
+# hypoDD.reloc/.loc as written by hypoDD.f (i9,1x,f10.6,1x,f11.6,...)
+RELOC_COLUMNS = [
+    ("id", 0, 9), ("lat", 10, 20), ("lon", 21, 32), ("depth", 33, 42),
+    ("x", 43, 53), ("y", 54, 64), ("z", 65, 75),
+    ("ex", 76, 84), ("ey", 85, 93), ("ez", 94, 102),
+    ("year", 103, 107), ("month", 108, 110), ("day", 111, 113),
+    ("hour", 114, 116), ("minute", 117, 119), ("sec", 120, 126),
+    ("mag", 127, 131), ("nccp", 132, 137), ("nccs", 138, 143),
+    ("nctp", 144, 149), ("ncts", 150, 155), ("rcc", 156, 162),
+    ("rct", 163, 169), ("cid", 170, 173),
+]
+
+# hypoDD.loc, the starting locations (hypoDD.f: ...,f5.2,1x,f4.1,1x,i3),
+# has seconds to 0.01 s, then magnitude and cluster, no counts or rms
+LOC_COLUMNS = RELOC_COLUMNS[:15] + [
+    ("sec", 120, 125), ("mag", 126, 130), ("cid", 131, 134),
+]
+
+
+# --- fixed-width reading --------------------------------------------------
+
+def read_fixed_width(filename, skip_header=False):
+    """
+    File contents as a (lines, width) uint8 array, short lines padded
+    with blanks
+    """
+    with open(filename, "rb") as f:
+        lines = f.read().splitlines()
+    if skip_header and lines:
+        lines = lines[1:]
+    lines = [line for line in lines if line.strip()]
+    width = max((len(line) for line in lines), default=0)
+    if not lines:
+        return np.zeros((0, 0), dtype=np.uint8)
+    data = b"".join(line.ljust(width) for line in lines)
+    return np.frombuffer(data, dtype=np.uint8).reshape(len(lines), width)
+
+
+def column(block, start, end, dtype=float):
+    """
+    One fixed-width field of every line converted in one go. Blank or
+    overflowed (****) fields become NaN for floats and 0 for integers.
+    """
+    end = min(end, block.shape[1])
+    if block.shape[0] == 0 or start >= end:
+        return np.zeros(block.shape[0], dtype=dtype)
+    strings = np.ascontiguousarray(block[:, start:end]).view(f"S{end - start}").ravel()
+    try:
+        return strings.astype(float).astype(dtype)
+    except ValueError:
+        pass
+    # Rare: some fields are blank or unparsable, convert around them
+    stripped = np.char.strip(strings)
+    bad = (stripped == b"") | (np.char.find(stripped, b"*") >= 0)
+    values = np.where(bad, b"nan", stripped).astype(float)
+    if np.dtype(dtype).kind in "iu":
+        values = np.nan_to_num(values)
+    return values.astype(dtype)
+
+
+def epoch_seconds(year, month, day, hour, minute, sec):
+    """
+    Vectorized seconds since 1970 from date and time arrays
+    """
+    months = (year.astype(np.int64) - 1970) * 12 + (month.astype(np.int64) - 1)
+    days = (months.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64) +
+            day.astype(np.int64) - 1)
+    return days * 86400.0 + hour * 3600.0 + minute * 60.0 + sec
+
+
+def read_hypsum(filename):
+    """
+    SEISAN/HYPO71 hypsum.out as a dict of arrays
+    """
+    block = read_fixed_width(filename, skip_header=True)
+    # Keep only event lines (they start with the yymmdd date)
+    block = block[np.all((block[:, :6] >= ord("0")) & (block[:, :6] <= ord("9")), axis=1)]
+    f = {name: column(block, s, e) for name, s, e in HYPSUM_COLUMNS
+         if name not in ("lat_hemi", "lon_hemi")}
+    date = f["date"].astype(np.int64)
+    yy = date // 10000
+    year = np.where(yy < 50, 2000 + yy, 1900 + yy)
+    hhmm = f["hhmm"].astype(np.int64)
+    lat_sign = np.where(block[:, 20] == ord("S"), -1.0, 1.0)
+    lon_sign = np.where(block[:, 30] == ord("W"), -1.0, 1.0)
+    return {
+        "time": epoch_seconds(year, (date // 100) % 100, date % 100,
+                              hhmm // 100, hhmm % 100, f["sec"]),
+        "lat": lat_sign * (f["lat_deg"] + f["lat_min"] / 60.0),
+        "lon": lon_sign * (f["lon_deg"] + f["lon_min"] / 60.0),
+        "depth": f["depth"],
+        "mag": f["mag"],
+        "rms": f["rms"],
+        "erh": f["erh"],
+        "erz": f["erz"],
+        "id": np.arange(1, len(block) + 1),
+    }
+
+
+def read_reloc(filename, columns=None):
+    """
+    hypoDD.reloc or hypoDD.loc as a dict of arrays; the errors (m) are
+    turned into erh/erz in km like hypsum.out. The column layout is
+    chosen by the file name unless given; .loc files have no rms.
+    """
+    if columns is None:
+        loc = os.path.basename(filename).lower().endswith(".loc")
+        columns = LOC_COLUMNS if loc else RELOC_COLUMNS
+    block = read_fixed_width(filename)
+    f = {name: column(block, s, e) for name, s, e in columns}
+    return {
+        "time": epoch_seconds(f["year"], f["month"], f["day"],
+                              f["hour"], f["minute"], f["sec"]),
+        "lat": f["lat"],
+        "lon": f["lon"],
+        "depth": f["depth"],
+        "mag": f["mag"],
+        "rms": f["rct"] if "rct" in f else np.full(len(block), np.nan),
+        "erh": np.hypot(f["ex"], f["ey"]) / 1000.0,
+        "erz": f["ez"] / 1000.0,
+        "id": f["id"].astype(np.int64),
+    }
+
+
+def read_catalog(filename, fmt="auto"):
+    if fmt == "auto":
+        name = os.path.basename(filename).lower()
+        fmt = os.path.splitext(name)[1][1:]
+        if fmt not in ("reloc", "loc"):
+            fmt = "hypsum"
+    if fmt == "hypsum":
+        return read_hypsum(filename)
+    if fmt == "reloc":
+        return read_reloc(filename, RELOC_COLUMNS)
+    if fmt == "loc":
+        return read_reloc(filename, LOC_COLUMNS)
+    raise ValueError(f"Unknown catalog format: {fmt}")
+
+
+# --- matching --------------------------------------------------------------
+
+def local_coordinates(catalog, lat0, lon0):
+    """
+    East, north (km from lat0/lon0) and depth (km)
+    """
+    east = (catalog["lon"] - lon0) * KM_PER_DEGREE * np.cos(np.radians(lat0))
+    north = (catalog["lat"] - lat0) * KM_PER_DEGREE
+    return np.column_stack([east, north, catalog["depth"]])
+
+
+def match_catalogs(a, b, max_dt=3.0, max_distance=20.0, k=8):
+    """
+    One-to-one matches between two catalogs. Returns index arrays
+    (ia, ib) into a and b, closest pairs first.
+    """
+    valid_a = np.flatnonzero(np.isfinite(a["lat"]) & np.isfinite(a["lon"]) &
+                             np.isfinite(a["time"]))
+    valid_b = np.flatnonzero(np.isfinite(b["lat"]) & np.isfinite(b["lon"]) &
+                             np.isfinite(b["time"]))
+    if len(valid_a) == 0 or len(valid_b) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    lat0 = np.concatenate([a["lat"][valid_a], b["lat"][valid_b]]).mean()
+    lon0 = np.concatenate([a["lon"][valid_a], b["lon"][valid_b]]).mean()
+    t0 = min(a["time"][valid_a].min(), b["time"][valid_b].min())
+    scale = max_distance / max_dt
+
+    def points(catalog, valid):
+        xyz = np.nan_to_num(local_coordinates(catalog, lat0, lon0)[valid])
+        return np.column_stack([xyz, (catalog["time"][valid] - t0) * scale])
+
+    pa = points(a, valid_a)
+    pb = points(b, valid_b)
+    tree = cKDTree(pb)
+    k = min(k, len(pb))
+    dist, idx = tree.query(pa, k=k, distance_upper_bound=max_distance * np.sqrt(2.0))
+    dist = dist.reshape(len(pa), k)
+    idx = idx.reshape(len(pa), k)
+
+    found = np.isfinite(dist)
+    ia = np.repeat(np.arange(len(pa)), k)[found.ravel()]
+    ib = idx.ravel()[found.ravel()]
+    cost = dist.ravel()[found.ravel()]
+    # Exact limits on the candidates
+    dt = np.abs(pa[ia, 3] - pb[ib, 3]) / scale
+    dxyz = np.linalg.norm(pa[ia, :3] - pb[ib, :3], axis=1)
+    ok = (dt <= max_dt) & (dxyz <= max_distance)
+    ia, ib, cost = ia[ok], ib[ok], cost[ok]
+
+    order = np.argsort(cost, kind="stable")
+    used_a = np.zeros(len(pa), dtype=bool)
+    used_b = np.zeros(len(pb), dtype=bool)
+    match_a, match_b = [], []
+    for i, j in zip(ia[order], ib[order]):
+        if not used_a[i] and not used_b[j]:
+            used_a[i] = used_b[j] = True
+            match_a.append(i)
+            match_b.append(j)
+    return (valid_a[np.array(match_a, dtype=np.int64)],
+            valid_b[np.array(match_b, dtype=np.int64)])
+
+
+def compare(a, b, max_dt=3.0, max_distance=20.0):
+    """
+    Match two catalogs and return (matches, summary, unmatched_a,
+    unmatched_b). matches holds one array per column for the matched
+    pairs; shifts are b minus a.
+    """
+    ia, ib = match_catalogs(a, b, max_dt, max_distance)
+    lat0 = np.nanmean(np.concatenate([a["lat"], b["lat"]]))
+    lon0 = np.nanmean(np.concatenate([a["lon"], b["lon"]]))
+    shift = (local_coordinates(b, lat0, lon0)[ib] -
+             local_coordinates(a, lat0, lon0)[ia])
+    matches = {
+        "id_a": a["id"][ia], "id_b": b["id"][ib],
+        "time_a": a["time"][ia], "dt": b["time"][ib] - a["time"][ia],
+        "d_east": shift[:, 0], "d_north": shift[:, 1], "d_depth": shift[:, 2],
+        "d_horizontal": np.hypot(shift[:, 0], shift[:, 1]),
+        "erh_a": a["erh"][ia], "erh_b": b["erh"][ib],
+        "erz_a": a["erz"][ia], "erz_b": b["erz"][ib],
+    }
+    unmatched_a = np.setdiff1d(np.arange(len(a["time"])), ia)
+    unmatched_b = np.setdiff1d(np.arange(len(b["time"])), ib)
+
+    def stats(values):
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return None
+        return {"mean": float(values.mean()), "median": float(np.median(values)),
+                "p90": float(np.percentile(values, 90))}
+
+    summary = {
+        "events_a": len(a["time"]), "events_b": len(b["time"]),
+        "matched": len(ia),
+        "unmatched_a": len(unmatched_a), "unmatched_b": len(unmatched_b),
+        "mean_shift_east_km": float(np.nanmean(shift[:, 0])) if len(ia) else None,
+        "mean_shift_north_km": float(np.nanmean(shift[:, 1])) if len(ia) else None,
+        "mean_shift_depth_km": float(np.nanmean(shift[:, 2])) if len(ia) else None,
+        "horizontal_shift_km": stats(matches["d_horizontal"]),
+        "depth_shift_km": stats(np.abs(matches["d_depth"])),
+        "origin_time_shift_s": stats(np.abs(matches["dt"])),
+        "erh_change_km": stats(matches["erh_b"] - matches["erh_a"]),
+        "erz_change_km": stats(matches["erz_b"] - matches["erz_a"]),
+    }
+    return matches, summary, unmatched_a, unmatched_b
+
+
+def write_matches(matches, filename):
+    names = list(matches)
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        writer.writerows(zip(*(np.round(matches[n], 4).tolist() for n in names)))
+
+
+def print_summary(summary, name_a, name_b):
+    print(f"A: {name_a} ({summary['events_a']} events)")
+    print(f"B: {name_b} ({summary['events_b']} events)")
+    print(f"Matched: {summary['matched']}, unmatched in A: {summary['unmatched_a']}, "
+          f"unmatched in B: {summary['unmatched_b']}")
+    if not summary["matched"]:
+        return
+    print(f"Mean shift B - A: east {summary['mean_shift_east_km']:.2f} km, "
+          f"north {summary['mean_shift_north_km']:.2f} km, "
+          f"depth {summary['mean_shift_depth_km']:.2f} km")
+    print("                    mean   median      p90")
+    for key, label in (("horizontal_shift_km", "|dH| km"),
+                       ("depth_shift_km", "|dZ| km"),
+                       ("origin_time_shift_s", "|dT| s"),
+                       ("erh_change_km", "Erh B-A km"),
+                       ("erz_change_km", "Erz B-A km")):
+        s = summary[key]
+        if s:
+            print(f"  {label:14s} {s['mean']:8.2f} {s['median']:8.2f} {s['p90']:8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Match events of two catalogs (hypsum.out, hypoDD.reloc) "
+                    "and report location shifts")
+    parser.add_argument("catalog_a")
+    parser.add_argument("catalog_b")
+    parser.add_argument("--format-a", default="auto",
+                        choices=["auto", "hypsum", "reloc", "loc"])
+    parser.add_argument("--format-b", default="auto",
+                        choices=["auto", "hypsum", "reloc", "loc"])
+    parser.add_argument("--max-dt", type=float, default=3.0,
+                        help="maximum origin time difference (s)")
+    parser.add_argument("--max-distance", type=float, default=20.0,
+                        help="maximum hypocentre distance (km)")
+    parser.add_argument("--output", help="CSV with the matched pairs")
+    parser.add_argument("--unmatched", help="CSV with the unmatched events")
+    args = parser.parse_args(argv)
+
+    a = read_catalog(args.catalog_a, args.format_a)
+    b = read_catalog(args.catalog_b, args.format_b)
+    matches, summary, unmatched_a, unmatched_b = compare(
+        a, b, args.max_dt, args.max_distance)
+    print_summary(summary, args.catalog_a, args.catalog_b)
+    if args.output:
+        write_matches(matches, args.output)
+    if args.unmatched:
+        with open(args.unmatched, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["catalog", "id", "time", "lat", "lon", "depth"])
+            for label, catalog, rows in (("A", a, unmatched_a), ("B", b, unmatched_b)):
+                for i in rows:
+                    writer.writerow([label, int(catalog["id"][i]), catalog["time"][i],
+                                     catalog["lat"][i], catalog["lon"][i],
+                                     catalog["depth"][i]])
+
+
+if __name__ == "__main__":
+    main()
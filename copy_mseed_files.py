@@ -1,7 +1,17 @@
 import os
+import sys
+import json
 import shutil
 import glob
+import argparse
+from datetime import datetime
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from waveform_index import parse_seisan_filename
+
+SOURCE_BASE = r"C:\Seismo\WAV\SPRC1"
+MANIFEST_FILE = "waveform_manifest.json"
 
 def copy_mseed_files(years=None):
     """
@@ -11,7 +21,7 @@ def copy_mseed_files(years=None):
         years = [2016, 2017]
     
     # Source directory
-    source_base = r"C:\Seismo\WAV\SPRC1"
+    source_base = SOURCE_BASE
     
     # Destination directory (create if it doesn't exist)
     dest_dir = "waveforms"
@@ -75,7 +85,7 @@ def list_mseed_files(years=None):
     if years is None:
         years = [2016, 2017]
     
-    source_base = r"C:\Seismo\WAV\SPRC1"
+    source_base = SOURCE_BASE
     
     print("Scanning for mseed files...")
     
@@ -99,7 +109,194 @@ def list_mseed_files(years=None):
                     if len(mseed_files) > 3:
                         print(f"    ... and {len(mseed_files) - 3} more files")
 
-if __name__ == "__main__":
+def _collect_source_files(source_base, years, start=None, end=None):
+    """
+    Yield (path, start_time) for all archive files of the given years that
+    fall into [start, end]. Months outside the range are not listed at all.
+    """
+    for year in years:
+        year_path = os.path.join(source_base, str(year))
+        if not os.path.exists(year_path):
+            print(f"Year {year} directory not found: {year_path}")
+            continue
+        for month in range(1, 13):
+            if start and (year, month) < (start.year, start.month):
+                continue
+            if end and (year, month) > (end.year, end.month):
+                continue
+            month_path = os.path.join(year_path, f"{month:02d}")
+            if not os.path.exists(month_path):
+                continue
+            for file in os.listdir(month_path):
+                file_path = os.path.join(month_path, file)
+                if not os.path.isfile(file_path):
+                    continue
+                file_start = parse_seisan_filename(file)
+                if file_start is not None:
+                    if start and file_start < start:
+                        continue
+                    if end and file_start > end:
+                        continue
+                yield file_path, file_start
+
+def _is_up_to_date(source, dest):
+    """
+    True if dest already holds source (same size and modification time)
+    """
+    try:
+        src_stat = os.stat(source)
+        dst_stat = os.stat(dest)
+    except OSError:
+        return False
+    # Allow for the 2 s mtime resolution of FAT and some network shares
+    return (src_stat.st_size == dst_stat.st_size and
+            abs(src_stat.st_mtime - dst_stat.st_mtime) < 2.0)
+
+def _same_filesystem(source_base, dest_dir):
+    try:
+        return os.stat(source_base).st_dev == os.stat(dest_dir).st_dev
+    except OSError:
+        return False
+
+def _stage_file(source, dest, method):
+    """
+    Put source at dest using the given method ("copy", "hardlink" or
+    "symlink"). Returns the method that was actually used, "skipped" if
+    dest was already up to date.
+    """
+    if _is_up_to_date(source, dest):
+        return "skipped"
+    if os.path.lexists(dest):
+        os.remove(dest)
+    if method == "hardlink":
+        try:
+            os.link(source, dest)
+            return "hardlink"
+        except OSError:
+            method = "copy"
+    elif method == "symlink":
+        try:
+            os.symlink(os.path.abspath(source), dest)
+            return "symlink"
+        except OSError:
+            method = "copy"
+    shutil.copy2(source, dest)
+    return "copy"
+
+def stage_mseed_files(source_base=SOURCE_BASE, dest_dir="waveforms", years=None,
+                      start=None, end=None, link="auto", workers=8,
+                      manifest_file=MANIFEST_FILE):
+    """
+    Non-interactive, incremental version of copy_mseed_files.
+
+    Files whose size and modification time already match are skipped.
+    With link="auto" files are hard linked when source and destination
+    share a filesystem and copied otherwise; "copy", "hardlink" and
+    "symlink" force a method. Copies run in a thread pool. A JSON manifest
+    of all staged files is written for WaveformIndex.add_manifest.
+    """
+    if years is None:
+        first = start.year if start else 2016
+        last = end.year if end else max(first, 2017)
+        years = list(range(first, last + 1))
+
+    if not os.path.exists(dest_dir):
+        os.makedirs(dest_dir)
+        print(f"Created directory: {dest_dir}")
+
+    if link == "auto":
+        method = "hardlink" if _same_filesystem(source_base, dest_dir) else "copy"
+    else:
+        method = link
+
+    sources = list(_collect_source_files(source_base, years, start, end))
+    print(f"Files to stage: {len(sources)} (method: {method})")
+
+    jobs = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for source, file_start in sources:
+            dest = os.path.join(dest_dir, os.path.basename(source))
+            jobs.append((source, dest, file_start,
+                         executor.submit(_stage_file, source, dest, method)))
+
+    counts = {}
+    errors = 0
+    manifest = []
+    for source, dest, file_start, job in jobs:
+        try:
+            used = job.result()
+        except Exception as e:
+            errors += 1
+            print(f"  Error staging {os.path.basename(source)}: {e}")
+            continue
+        counts[used] = counts.get(used, 0) + 1
+        stat = os.stat(dest)
+        manifest.append({
+            "path": dest,
+            "source": source,
+            "start_time": file_start.isoformat() if file_start else None,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+        })
+
+    if manifest_file:
+        with open(manifest_file, "w") as f:
+            json.dump({
+                "source_base": source_base,
+                "dest_dir": os.path.abspath(dest_dir),
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "files": manifest,
+            }, f, indent=1)
+
+    print(f"\nSummary:")
+    print(f"Total files found: {len(sources)}")
+    for used in ("skipped", "hardlink", "symlink", "copy"):
+        if counts.get(used):
+            print(f"Files {used}: {counts[used]}")
+    print(f"Errors: {errors}")
+    print(f"Destination: {os.path.abspath(dest_dir)}")
+    if manifest_file:
+        print(f"Manifest: {manifest_file}")
+    return manifest
+
+def _parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d")
+
+def main(argv=None):
+    """
+    Command line staging mode (no prompts)
+    """
+    parser = argparse.ArgumentParser(
+        description="Stage SEISAN waveform files for HypoDD")
+    parser.add_argument("--source", default=SOURCE_BASE,
+                        help="SEISAN WAV/<BASE> directory")
+    parser.add_argument("--dest", default="waveforms",
+                        help="destination directory")
+    parser.add_argument("--years", type=int, nargs="+",
+                        help="years to stage")
+    parser.add_argument("--start", type=_parse_date,
+                        help="first day to stage (YYYY-MM-DD)")
+    parser.add_argument("--end", type=_parse_date,
+                        help="last day to stage (YYYY-MM-DD), inclusive")
+    parser.add_argument("--link", default="auto",
+                        choices=["auto", "copy", "hardlink", "symlink"])
+    parser.add_argument("--workers", type=int, default=8,
+                        help="number of copy threads")
+    parser.add_argument("--manifest", default=MANIFEST_FILE,
+                        help="manifest file to write ('' to disable)")
+    args = parser.parse_args(argv)
+
+    end = args.end
+    if end is not None:
+        end = end.replace(hour=23, minute=59, second=59)
+    stage_mseed_files(source_base=args.source, dest_dir=args.dest,
+                      years=args.years, start=args.start, end=end,
+                      link=args.link, workers=args.workers,
+                      manifest_file=args.manifest)
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    main()
+elif __name__ == "__main__":
     print("SEISAN to HypoDD mseed file copier")
     print("=" * 40)
     
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Compact binary differential time files for the bundled HypoDD.
+
+getdata.f reads dt.cc and dt.ct line by line with list-directed reads,
+which dominates the start-up of large runs. The bundled hypoDD
+(HYPODD/src/hypoDD/dtbin.f) also reads a binary form of both files: if
+a file named in hypoDD.inp starts with the bytes "HDDB" it is read as
+
+    header   "HDDB", version, kind (1 = cc, 2 = ct), records, stations
+    records  ev1, ev2, station index (int32), dt1, dt2, weight (float32),
+             phase (int32, 1 = P, 2 = S); 28 bytes each
+    stations 7-character labels, after the records
+
+all little endian. For dt.cc dt1 is the delay time and dt2 the origin
+time correction of the pair, for dt.ct the two travel times, so hypoDD
+forms dt1 - dt2 in single precision exactly like from the text. The
+values are the text values rounded to float32, which is what Fortran's
+list-directed read gives for the short decimals in these files, so both
+formats relocate bit-identically (checked by
+benchmarks/check_dt_binary.py). Text stays the default.
+
+    python dt_binary.py hypodd_working      # write dt.cc.bin, dt.ct.bin
+                                            # and point hypoDD.inp to them
+"""
+import os
+import argparse
+
+import numpy as np
+
+MAGIC = b"HDDB"
+VERSION = 1
+KIND_CC, KIND_CT = 1, 2
+HEADER = np.dtype([("magic", "S4"), ("version", "<i4"), ("kind", "<i4"),
+                   ("nrec", "<i4"), ("nsta", "<i4")])
+RECORD = np.dtype([("ev1", "<i4"), ("ev2", "<i4"), ("station", "<i4"),
+                   ("dt1", "<f4"), ("dt2", "<f4"), ("weight", "<f4"),
+                   ("phase", "<i4")])
+PHASES = {"P": 1, "S": 2}
+
+
+class DtBinaryWriter:
+    """
+    Streams records to a binary dt file; the station table and the
+    header are written on close
+    """
+
+    def __init__(self, filename, kind, chunk=65536):
+        self.filename = filename
+        self.kind = kind
+        self.stations = {}
+        self.nrec = 0
+        self._chunk = np.zeros(chunk, dtype=RECORD)
+        self._n = 0
+        self._file = open(filename, "wb")
+        self._file.write(bytes(HEADER.itemsize))
+
+    def _flush(self):
+        if self._n:
+            self._file.write(self._chunk[:self._n].tobytes())
+            self._n = 0
+
+    def add(self, ev1, ev2, station, dt1, dt2, weight, phase):
+        if self._n == len(self._chunk):
+            self._flush()
+        index = self.stations.setdefault(station, len(self.stations) + 1)
+        # Unknown phases are kept as 0; hypoDD stops on them like on text
+        self._chunk[self._n] = (ev1, ev2, index, dt1, dt2, weight,
+                                PHASES.get(phase, 0))
+        self._n += 1
+        self.nrec += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._flush()
+        for station in self.stations:
+            # Longer labels are cut like a list-directed read into a*7 does
+            self._file.write(station[:7].ljust(7).encode("ascii"))
+        header = np.array([(MAGIC, VERSION, self.kind, self.nrec, len(self.stations))],
+                          dtype=HEADER)
+        self._file.seek(0)
+        self._file.write(header.tobytes())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def convert_dt_file(text_file, binary_file, kind):
+    """
+    Write the binary form of a text dt.cc (KIND_CC) or dt.ct (KIND_CT);
+    returns the number of records
+    """
+    with open(text_file, "r") as f, DtBinaryWriter(binary_file, kind) as writer:
+        ev1 = ev2 = None
+        otc = 0.0
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == "#":
+                ev1, ev2 = int(parts[1]), int(parts[2])
+                otc = float(parts[3]) if kind == KIND_CC and len(parts) > 3 else 0.0
+            elif parts[0].startswith("#"):
+                # "#12 34" without a space
+                ev1, ev2 = int(parts[0][1:]), int(parts[1])
+                otc = float(parts[2]) if kind == KIND_CC and len(parts) > 2 else 0.0
+            elif kind == KIND_CC:
+                writer.add(ev1, ev2, parts[0], float(parts[1]), otc,
+                           float(parts[2]), parts[3])
+            else:
+                writer.add(ev1, ev2, parts[0], float(parts[1]), float(parts[2]),
+                           float(parts[3]), parts[4])
+        return writer.nrec
+
+
+def read_dt_binary(filename):
+    """
+    (kind, records, station labels) of a binary dt file
+    """
+    with open(filename, "rb") as f:
+        header = np.frombuffer(f.read(HEADER.itemsize), dtype=HEADER)[0]
+        if header["magic"] != MAGIC:
+            raise ValueError(f"{filename} is not a binary dt file")
+        records = np.frombuffer(f.read(RECORD.itemsize * int(header["nrec"])),
+                                dtype=RECORD)
+        labels = f.read(7 * int(header["nsta"])).decode("ascii")
+    stations = [labels[i:i + 7].strip() for i in range(0, len(labels), 7)]
+    return int(header["kind"]), records, stations
+
+
+def set_dt_files(inp_lines, cc_name, ct_name):
+    """
+    hypoDD.inp lines with other dt.cc and dt.ct file names (the first two
+    data lines)
+    """
+    from velocity_sweep import data_line_indices
+    data = data_line_indices(inp_lines)
+    lines = list(inp_lines)
+    lines[data[0]] = cc_name
+    lines[data[1]] = ct_name
+    return lines
+
+
+def convert_working_dir(working_dir, update_inp=True):
+    """
+    Write dt.cc.bin and dt.ct.bin next to the text files of a working
+    directory and, if update_inp, name them in its hypoDD.inp
+    """
+    from velocity_sweep import input_file_names
+    input_dir = os.path.join(working_dir, "input_files")
+    inp_file = os.path.join(input_dir, "hypoDD.inp")
+    with open(inp_file, "r") as f:
+        lines = f.read().splitlines()
+    cc_name, ct_name = input_file_names(lines)[:2]
+    names = []
+    for name, kind in ((cc_name, KIND_CC), (ct_name, KIND_CT)):
+        if name.endswith(".bin"):
+            names.append(name)
+            continue
+        n = convert_dt_file(os.path.join(input_dir, name),
+                            os.path.join(input_dir, name + ".bin"), kind)
+        print(f"{name}: {n} records -> {name}.bin")
+        names.append(name + ".bin")
+    if update_inp:
+        with open(inp_file, "w") as f:
+            f.write("\n".join(set_dt_files(lines, *names)) + "\n")
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert dt.cc/dt.ct to the binary format of the bundled hypoDD")
+    parser.add_argument("working_dir", nargs="?", default="hypodd_working")
+    parser.add_argument("--keep-inp", action="store_true",
+                        help="do not point hypoDD.inp to the binary files")
+    args = parser.parse_args(argv)
+    convert_working_dir(args.working_dir, update_inp=not args.keep_inp)
+
+
+if __name__ == "__main__":
+    main()
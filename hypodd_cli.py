@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+One command line entry point for the catalog and relocation scripts.
+
+    python hypodd_cli.py convert [hyp.out] [-o hypoDD_quakeml_fixed.xml]
+    python hypodd_cli.py stations [STATION0.hyp] [-o stations.xml]
+    python hypodd_cli.py velocity [STATION0.hyp]
+    python hypodd_cli.py stage-waveforms --years 2016 2017 ...
+    python hypodd_cli.py relocate
+    python hypodd_cli.py progress hypoDD hypoDD.inp --metrics metrics.jsonl
+    python hypodd_cli.py export [hypodd_working] --format csv -o relocated.csv
+    python hypodd_cli.py cc-queue export|coordinate|status ...
+    python hypodd_cli.py cc-worker hypodd_working/cc_queue
+    python hypodd_cli.py plots [hypodd_working] [--figures map links]
+    python hypodd_cli.py geometry [hypodd_working] [stations.xml] --maxdist 200
+    python hypodd_cli.py stats [hypoDD_quakeml_fixed.xml] [--detailed]
+
+Only argparse is imported at start-up. Every subcommand imports what it
+needs when it runs, so convert, velocity and stats never load ObsPy and
+can be called cheaply from cron jobs and shell loops. The start-up cost
+is measured by the cli_startup stage in benchmarks/run_benchmarks.py.
+"""
+import sys
+import argparse
+
+# Modules that must not be imported just to start the CLI
+HEAVY_MODULES = ("obspy", "scipy", "matplotlib", "numpy")
+
+
+def cmd_convert(args):
+    import nordic2quakeml
+    from fix_quakeml import fix_quakeml
+    raw_output = args.raw_output or args.output.replace("_fixed", "")
+    if raw_output == args.output:
+        raw_output = args.output + ".raw"
+    nordic2quakeml.main(args.input, raw_output)
+    fix_quakeml(raw_output, args.output)
+
+
+def cmd_stations(args):
+    from seisan2stationxml import convert_seisan_to_stationxml
+    inv = convert_seisan_to_stationxml(args.input, args.output)
+    print(f"Converted {len(inv.networks[0].stations)} stations to {args.output}")
+
+
+def cmd_velocity(args):
+    from setup_velocity_model import extract_velocity_model_from_station_hyp
+    layer_tops = extract_velocity_model_from_station_hyp(args.input)
+    print(f"Extracted {len(layer_tops)} layers:")
+    for depth, vp in layer_tops:
+        print(f"  Depth: {depth / 1000:.1f} km, Vp: {vp:.2f} km/s")
+    print(f"Vp/Vs ratio: {args.vp_vs_ratio}")
+
+
+def cmd_stage_waveforms(args):
+    from copy_mseed_files import main as stage_main
+    # Without options copy_mseed_files starts its interactive menu
+    stage_main(args.options or ["--help"])
+
+
+def cmd_relocate(args):
+    # run_hypodd sets up logging and the relocator when it is imported
+    import run_hypodd
+    run_hypodd.main()
+
+
+def cmd_progress(args):
+    from hypodd_progress import main as progress_main
+    sys.exit(progress_main(args.options or ["--help"]))
+
+
+def cmd_export(args):
+    from relocated_catalog import main as export_main
+    export_main(args.options)
+
+
+def cmd_cc_queue(args):
+    from cc_workqueue import main as queue_main
+    queue_main(args.options or ["--help"])
+
+
+def cmd_cc_worker(args):
+    from cc_workqueue import main as queue_main
+    queue_main(["work"] + args.options)
+
+
+def cmd_plots(args):
+    from hypodd_plots import main as plots_main
+    plots_main(args.options)
+
+
+def cmd_geometry(args):
+    from station_geometry import main as geometry_main
+    geometry_main(args.options)
+
+
+def quakeml_stats(quakeml_file):
+    """
+    Number of events and picks per phase hint, read with iterparse
+    """
+    import xml.etree.ElementTree as ET
+    from collections import Counter
+
+    n_events = 0
+    phases = Counter()
+    for _, elem in ET.iterparse(quakeml_file):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if tag == "pick":
+            hint = None
+            for child in elem:
+                if child.tag.rsplit("}", 1)[-1] == "phaseHint":
+                    hint = (child.text or "").strip()
+            phases[hint or "Other"] += 1
+            elem.clear()
+        elif tag == "event":
+            n_events += 1
+            elem.clear()
+    return n_events, phases
+
+
+def cmd_stats(args):
+    if args.detailed:
+        from count_picks import count_pick_types
+        count_pick_types(args.input)
+        return
+    n_events, phases = quakeml_stats(args.input)
+    print(f"Events: {n_events}")
+    print(f"Picks:  {sum(phases.values())}")
+    for phase, count in phases.most_common():
+        print(f"  {phase:6s} {count}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="hypodd_cli.py",
+        description="SEISAN to HypoDD catalog tools and relocation")
+    sub = parser.add_subparsers(dest="command", metavar="command")
+    sub.required = True
+
+    p = sub.add_parser("convert", help="Nordic hyp.out to (fixed) QuakeML")
+    p.add_argument("input", nargs="?", default="hyp.out")
+    p.add_argument("-o", "--output", default="hypoDD_quakeml_fixed.xml")
+    p.add_argument("--raw-output", help="QuakeML before fix_quakeml "
+                   "(default: output name without _fixed)")
+    p.set_defaults(func=cmd_convert)
+
+    p = sub.add_parser("stations", help="STATION0.hyp to StationXML")
+    p.add_argument("input", nargs="?", default="STATION0.hyp")
+    p.add_argument("-o", "--output", default="stations.xml")
+    p.set_defaults(func=cmd_stations)
+
+    p = sub.add_parser("velocity", help="show the velocity model of STATION0.hyp")
+    p.add_argument("input", nargs="?", default="STATION0.hyp")
+    p.add_argument("--vp-vs-ratio", type=float, default=1.73)
+    p.set_defaults(func=cmd_velocity)
+
+    p = sub.add_parser("stage-waveforms",
+                       help="stage MiniSEED files (options of copy_mseed_files.py)")
+    p.add_argument("options", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_stage_waveforms)
+
+    p = sub.add_parser("relocate", help="run the full relocation (run_hypodd.py)")
+    p.set_defaults(func=cmd_relocate)
+
+    p = sub.add_parser("progress",
+                       help="run ph2dt or hypoDD with live progress (hypodd_progress.py)")
+    p.add_argument("options", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_progress)
+
+    p = sub.add_parser("export",
+                       help="write the relocated catalog (relocated_catalog.py)")
+    p.add_argument("options", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("cc-queue",
+                       help="shared-filesystem correlation queue (cc_workqueue.py)")
+    p.add_argument("options", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_cc_queue)
+
+    p = sub.add_parser("cc-worker", help="claim and correlate queued units on this node")
+    p.add_argument("options", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_cc_worker)
+
+    p = sub.add_parser("plots", help="overview plots of a run (hypodd_plots.py)")
+    p.add_argument("options", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_plots)
+
+    p = sub.add_parser("geometry",
+                       help="event-station geometry and MAXDIST pick filter (station_geometry.py)")
+    p.add_argument("options", nargs=argparse.REMAINDER)
+    p.set_defaults(func=cmd_geometry)
+
+    p = sub.add_parser("stats", help="count events and picks in a QuakeML file")
+    p.add_argument("input", nargs="?", default="hypoDD_quakeml_fixed.xml")
+    p.add_argument("--detailed", action="store_true",
+                   help="per-event table through ObsPy (count_picks.py)")
+    p.set_defaults(func=cmd_stats)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
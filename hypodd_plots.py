@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Overview plots of a HypoDD run that stay fast for large catalogs.
+
+    map       epicentres before (hypoDD.loc) and after (hypoDD.reloc)
+    sections  longitude-depth and latitude-depth sections of the relocations
+    links     event pairs of dt.ct drawn between the relocations
+    shifts    horizontal and vertical shifts of the relocated events
+    cc        distribution of the dt.cc correlation coefficients
+
+Catalogs with more than --scatter-limit events are drawn as 2-D
+histograms (log colour scale) instead of one marker per event, and at
+most --max-links pair links are drawn as one rasterized LineCollection
+(a fixed random subset, the title gives the share), so the rendering
+time hardly depends on the catalog size.
+
+Every figure is rendered in its own process. A figure is skipped when
+its cache key (figure, options and a digest of every input file) is the
+one recorded in <plot_dir>/plot_cache.json and the image still exists,
+so re-running after an unchanged relocation costs only the digests.
+
+    python hypodd_plots.py hypodd_working
+    python hypodd_plots.py hypodd_working --figures map links --force
+"""
+import os
+import re
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+WORKING_DIR = "hypodd_working"
+FIGURES = ("map", "sections", "links", "shifts", "cc")
+CACHE_FILE = "plot_cache.json"
+# Part of every cache key; bump when the figures change
+PLOT_VERSION = 1
+KM_PER_DEGREE = 111.19
+
+
+# --- inputs and cache keys -------------------------------------------------
+
+def plot_inputs(working_dir=WORKING_DIR):
+    """
+    The files the figures are drawn from
+    """
+    temp_dir = os.path.join(working_dir, "hypodd_temp_dir")
+    input_dir = os.path.join(working_dir, "input_files")
+    return {
+        "loc": os.path.join(temp_dir, "hypoDD.loc"),
+        "reloc": os.path.join(temp_dir, "hypoDD.reloc"),
+        "dt_ct": os.path.join(input_dir, "dt.ct"),
+        "dt_cc": os.path.join(input_dir, "dt.cc"),
+    }
+
+
+# Inputs each figure is drawn from
+FIGURE_INPUTS = {
+    "map": ("loc", "reloc"),
+    "sections": ("reloc",),
+    "links": ("reloc", "dt_ct", "dt_cc"),
+    "shifts": ("loc", "reloc"),
+    "cc": ("dt_cc",),
+}
+
+
+def file_digest(filename, chunk_size=1 << 20):
+    """
+    SHA-1 of a file's contents, None if it does not exist
+    """
+    if not os.path.exists(filename):
+        return None
+    digest = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(figure, inputs, options, digests):
+    """
+    Key of one figure: the figure, its options and its input digests
+    """
+    key = {"figure": figure, "version": PLOT_VERSION, "options": options,
+           "inputs": {name: digests[inputs[name]] for name in FIGURE_INPUTS[figure]}}
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+# --- data ------------------------------------------------------------------
+
+def read_locations(filename):
+    from compare_catalogs import read_reloc
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        return None
+    return read_reloc(filename)
+
+
+def _iter_chunks(filename, chunk_size):
+    """
+    Blocks of whole lines of a file, nothing if it does not exist
+    """
+    if not os.path.exists(filename):
+        return
+    with open(filename, "rb") as f:
+        rest = b""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                if rest:
+                    yield rest
+                return
+            data = rest + chunk
+            cut = data.rfind(b"\n") + 1
+            rest = data[cut:]
+            yield data[:cut]
+
+
+def read_pairs(dt_file, chunk_size=1 << 25):
+    """
+    (n, 2) array of the event pairs of a dt.ct or dt.cc file. The "#"
+    lines are found with one regular expression per chunk instead of
+    looking at every line in Python.
+    """
+    import numpy as np
+
+    header = re.compile(rb"^#[ \t]*(\d+)[ \t]+(\d+)", re.M)
+    pairs = [np.zeros((0, 2), dtype=np.int64)]
+    for data in _iter_chunks(dt_file, chunk_size):
+        found = header.findall(data)
+        if found:
+            pairs.append(np.array(found, dtype="S20").astype(np.int64))
+    return np.concatenate(pairs)
+
+
+def cc_histogram(dt_cc, bins, chunk_size=1 << 25):
+    """
+    Histogram counts of the dt.cc coefficients (third column of the
+    observation lines), read in chunks
+    """
+    import numpy as np
+
+    coefficient = re.compile(rb"^[^#\s]\S*[ \t]+\S+[ \t]+(\S+)", re.M)
+    counts = np.zeros(len(bins) - 1, dtype=np.int64)
+    for data in _iter_chunks(dt_cc, chunk_size):
+        found = coefficient.findall(data)
+        if found:
+            counts += np.histogram(np.array(found, dtype="S20").astype(float), bins=bins)[0]
+    return counts
+
+
+# --- drawing ---------------------------------------------------------------
+
+def _points(ax, x, y, scatter_limit, bins, **kwargs):
+    """
+    Markers for small catalogs, a log-scaled 2-D histogram for large ones
+    """
+    import numpy as np
+    from matplotlib.colors import LogNorm
+
+    ok = np.isfinite(x) & np.isfinite(y)
+    x, y = x[ok], y[ok]
+    if len(x) <= scatter_limit:
+        ax.scatter(x, y, s=4, linewidths=0, rasterized=True, **kwargs)
+        return None
+    return ax.hist2d(x, y, bins=bins, norm=LogNorm(), cmap="viridis", cmin=1)[3]
+
+
+def _draw_map(fig, inputs, options):
+    loc = read_locations(inputs["loc"])
+    reloc = read_locations(inputs["reloc"])
+    axes = fig.subplots(1, 2, sharex=True, sharey=True)
+    for ax, catalog, title in ((axes[0], loc, "hypoDD.loc"), (axes[1], reloc, "hypoDD.reloc")):
+        n = 0 if catalog is None else len(catalog["id"])
+        ax.set_title(f"{title} ({n} events)")
+        ax.set_xlabel("Longitude")
+        if n:
+            image = _points(ax, catalog["lon"], catalog["lat"],
+                            options["scatter_limit"], options["bins"], color="k")
+            if image is not None:
+                fig.colorbar(image, ax=ax, label="events per bin")
+    axes[0].set_ylabel("Latitude")
+
+
+def _draw_sections(fig, inputs, options):
+    reloc = read_locations(inputs["reloc"])
+    axes = fig.subplots(1, 2, sharey=True)
+    for ax, key, label in ((axes[0], "lon", "Longitude"), (axes[1], "lat", "Latitude")):
+        ax.set_xlabel(label)
+        if reloc is not None:
+            image = _points(ax, reloc[key], reloc["depth"],
+                            options["scatter_limit"], options["bins"], color="k")
+            if image is not None:
+                fig.colorbar(image, ax=ax, label="events per bin")
+    axes[0].set_ylabel("Depth (km)")
+    axes[0].invert_yaxis()
+
+
+def _draw_links(fig, inputs, options):
+    import numpy as np
+    from matplotlib.collections import LineCollection
+
+    ax = fig.subplots()
+    ax.set_xlabel("Longitude")
+    ax.set_ylabel("Latitude")
+    reloc = read_locations(inputs["reloc"])
+    if reloc is None:
+        ax.set_title("No relocated events")
+        return
+    # The relocator correlates dt.ct pairs, so dt.cc adds no links
+    dt_file = inputs["dt_ct"] if os.path.exists(inputs["dt_ct"]) else inputs["dt_cc"]
+    pairs = read_pairs(dt_file)
+    # Links between relocated events only
+    position = np.full(int(max(reloc["id"].max(), pairs.max(initial=0))) + 1, -1)
+    position[reloc["id"]] = np.arange(len(reloc["id"]))
+    pairs = pairs[(position[pairs[:, 0]] >= 0) & (position[pairs[:, 1]] >= 0)]
+    n_links = len(pairs)
+    if n_links > options["max_links"]:
+        rng = np.random.default_rng(0)
+        pairs = pairs[rng.choice(n_links, options["max_links"], replace=False)]
+    i, j = position[pairs[:, 0]], position[pairs[:, 1]]
+    segments = np.stack([np.column_stack([reloc["lon"][i], reloc["lat"][i]]),
+                         np.column_stack([reloc["lon"][j], reloc["lat"][j]])], axis=1)
+    ax.add_collection(LineCollection(segments, linewidths=0.3, colors="tab:blue",
+                                     alpha=min(1.0, max(0.05, 2000.0 / max(len(pairs), 1))),
+                                     rasterized=True))
+    _points(ax, reloc["lon"], reloc["lat"], options["scatter_limit"], options["bins"],
+            color="k")
+    ax.autoscale_view()
+    shown = f"{len(pairs)} of {n_links}" if len(pairs) < n_links else f"{n_links}"
+    ax.set_title(f"Pair links between relocated events ({shown} drawn)")
+
+
+def _draw_shifts(fig, inputs, options):
+    import numpy as np
+
+    loc = read_locations(inputs["loc"])
+    reloc = read_locations(inputs["reloc"])
+    axes = fig.subplots(1, 2)
+    if loc is None or reloc is None:
+        axes[0].set_title("No relocated events")
+        return
+    ids, i, j = np.intersect1d(loc["id"], reloc["id"], return_indices=True)
+    east = ((reloc["lon"][j] - loc["lon"][i]) * KM_PER_DEGREE *
+            np.cos(np.radians(loc["lat"][i])))
+    north = (reloc["lat"][j] - loc["lat"][i]) * KM_PER_DEGREE
+    vertical = reloc["depth"][j] - loc["depth"][i]
+    axes[0].hist(np.hypot(east, north), bins=options["bins"] // 3)
+    axes[0].set_xlabel("Horizontal shift (km)")
+    axes[0].set_ylabel("Events")
+    axes[1].hist(vertical, bins=options["bins"] // 3)
+    axes[1].set_xlabel("Depth change (km)")
+    fig.suptitle(f"Shifts of {len(ids)} relocated events")
+
+
+def _draw_cc(fig, inputs, options):
+    import numpy as np
+
+    ax = fig.subplots()
+    bins = np.linspace(0.0, 1.0, 101)
+    counts = cc_histogram(inputs["dt_cc"], bins)
+    ax.stairs(counts, bins, fill=True)
+    ax.set_xlabel("Correlation coefficient")
+    ax.set_ylabel("Differential times")
+    ax.set_title(f"dt.cc ({counts.sum()} differential times)")
+
+
+DRAW = {"map": _draw_map, "sections": _draw_sections, "links": _draw_links,
+        "shifts": _draw_shifts, "cc": _draw_cc}
+
+
+def render_figure(figure, inputs, output, options):
+    """
+    Draw one figure to output; runs in a worker process
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(12, 6) if figure in ("map", "sections", "shifts") else (8, 8))
+    try:
+        DRAW[figure](fig, inputs, options)
+        fig.savefig(output, dpi=options["dpi"])
+    finally:
+        plt.close(fig)
+    return figure
+
+
+def create_plots(working_dir=WORKING_DIR, plot_dir=None, figures=FIGURES,
+                 scatter_limit=5000, max_links=20000, bins=300, dpi=120,
+                 processes=None, force=False, fmt="png"):
+    """
+    Render the figures whose inputs changed since the last call; returns
+    the names of the figures drawn
+    """
+    plot_dir = plot_dir or os.path.join(working_dir, "plots")
+    os.makedirs(plot_dir, exist_ok=True)
+    inputs = plot_inputs(working_dir)
+    options = {"scatter_limit": scatter_limit, "max_links": max_links,
+               "bins": bins, "dpi": dpi}
+    needed = {name for figure in figures for name in FIGURE_INPUTS[figure]}
+    digests = {inputs[name]: file_digest(inputs[name]) for name in needed}
+
+    cache_file = os.path.join(plot_dir, CACHE_FILE)
+    cache = {}
+    if os.path.exists(cache_file):
+        with open(cache_file, "r") as f:
+            cache = json.load(f)
+
+    todo = {}
+    for figure in figures:
+        output = os.path.join(plot_dir, f"{figure}.{fmt}")
+        key = cache_key(figure, inputs, options, digests)
+        if not force and cache.get(figure) == key and os.path.exists(output):
+            print(f"{figure}: unchanged, skipped")
+            continue
+        todo[figure] = (output, key)
+
+    drawn = []
+    if todo:
+        with ProcessPoolExecutor(max_workers=processes or min(len(todo), os.cpu_count())) as executor:
+            futures = {executor.submit(render_figure, figure, inputs, output, options): figure
+                       for figure, (output, _) in todo.items()}
+            for future in as_completed(futures):
+                figure = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"{figure}: failed ({e})")
+                    cache.pop(figure, None)
+                    continue
+                cache[figure] = todo[figure][1]
+                drawn.append(figure)
+                print(f"{figure}: {todo[figure][0]}")
+        with open(cache_file, "w") as f:
+            json.dump(cache, f, indent=1)
+    return drawn
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Overview plots of a HypoDD run, cached and fast for large catalogs")
+    parser.add_argument("working_dir", nargs="?", default=WORKING_DIR)
+    parser.add_argument("-o", "--plot-dir", help="default: <working_dir>/plots")
+    parser.add_argument("--figures", nargs="+", choices=FIGURES, default=list(FIGURES))
+    parser.add_argument("--scatter-limit", type=int, default=5000,
+                        help="draw 2-D histograms above this many events")
+    parser.add_argument("--max-links", type=int, default=20000,
+                        help="most pair links drawn")
+    parser.add_argument("--bins", type=int, default=300)
+    parser.add_argument("--dpi", type=int, default=120)
+    parser.add_argument("--format", default="png")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--force", action="store_true", help="redraw unchanged figures")
+    args = parser.parse_args(argv)
+    create_plots(args.working_dir, args.plot_dir, args.figures, args.scatter_limit,
+                 args.max_links, args.bins, args.dpi, args.processes, args.force,
+                 args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+"""
+Live progress, ETA and per-iteration metrics for ph2dt and hypoDD runs.
+
+hypoDD only reports in its iteration table on stdout and in hypoDD.log,
+and both are usually read after the run. Here the program is started
+with unbuffered stdout (GFORTRAN_UNBUFFERED_PRECONNECTED) and its output
+is parsed line by line while it runs:
+
+  - cluster sizes, the events and differential times of every cluster
+    and each row of the iteration table become JSON lines in a metrics
+    file (one record per cluster and per iteration, with the iteration
+    time, RMS residuals, shifts, condition number and the events and
+    data still used),
+  - a progress line shows the cluster, iteration, current step (from
+    hypoDD.log as it is written), RMS and an ETA weighted by cluster
+    size,
+  - optional limits stop a run that is too slow or diverges.
+
+For ph2dt the progress is the position of the last event pair written
+to dt.ct and its summary becomes one record.
+
+    python hypodd_progress.py hypodd_working/bin/hypoDD hypoDD.inp \\
+        --cwd hypodd_working/input_files --metrics hypodd_metrics.jsonl
+    python hypodd_progress.py ph2dt ph2dt.inp --cwd run_dir
+    python hypodd_progress.py hypoDD hypoDD.inp --max-rms-ms 500 --diverge 3
+"""
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import subprocess
+
+from velocity_sweep import data_line_indices
+
+# Widths of the columns of the hypoDD iteration table (hypoDD.f); the
+# RMS columns hold the value in ms and its change in %
+TABLE_WIDTHS = {"EV": 4, "CT": 4, "CC": 4, "RMSCT": 11, "RMSCC": 11,
+                "RMSST": 6, "RST": 6, "DX": 5, "DY": 5, "DZ": 5, "DT": 5,
+                "OS": 5, "AQ": 4, "CND": 5}
+TABLE_FIELDS = {"EV": "events_pct", "CT": "ct_pct", "CC": "cc_pct",
+                "RMSST": "rms_st_ms", "RST": "rms_st_ms", "DX": "dx_m",
+                "DY": "dy_m", "DZ": "dz_m", "DT": "dt_ms", "OS": "os_m",
+                "AQ": "airquakes", "CND": "cnd"}
+
+
+def _number(text, kind=int):
+    """
+    A table value, None for an empty or overflowed (****) field
+    """
+    text = text.strip()
+    if not text or "*" in text:
+        return None
+    try:
+        return kind(text)
+    except ValueError:
+        return None
+
+
+def parse_iteration_row(columns, line):
+    """
+    One row of the hypoDD iteration table as a dict. columns are the
+    names of the header line ("IT", "EV", "CT", ...).
+    """
+    row = {"iteration": _number(line[0:2]), "set_iteration": _number(line[2:5])}
+    pos = 5
+    for name in columns[1:]:
+        width = TABLE_WIDTHS.get(name)
+        if width is None:
+            break
+        field = line[pos:pos + width]
+        pos += width
+        if name in ("RMSCT", "RMSCC"):
+            key = "rms_ct" if name == "RMSCT" else "rms_cc"
+            row[key + "_ms"] = _number(field[:5])
+            row[key + "_change_pct"] = _number(field[5:], float)
+        else:
+            row[TABLE_FIELDS[name]] = _number(field)
+    return row
+
+
+def iteration_plan(inp_file):
+    """
+    (iterations per cluster, cluster to relocate or 0 for all) of a
+    hypoDD.inp
+    """
+    with open(inp_file, "r") as f:
+        lines = f.read().splitlines()
+    data = data_line_indices(lines)
+    niter = int(lines[data[11]].split()[2])
+    iterations = sum(int(lines[data[12 + i]].split()[0]) for i in range(niter))
+    cid = 0
+    if len(data) > 15 + niter and lines[data[15 + niter]].split():
+        cid = int(lines[data[15 + niter]].split()[0])
+    return iterations, cid
+
+
+def _count(line):
+    # "# catalog P dtimes =    6886" and "# cross corr P dtimes =  819 (...)"
+    return int(line.split("=", 1)[1].split()[0])
+
+
+class HypoDDMonitor:
+    """
+    Turns hypoDD stdout lines into metric records and keeps the state
+    for the progress line
+    """
+
+    def __init__(self, iterations, cid=0):
+        self.iterations = iterations
+        self.cid = cid
+        self.cluster_sizes = {}
+        self.n_clusters = None
+        self.cluster = None
+        self.last_cluster = 0
+        self.cluster_info = {}
+        # Counts of the first getdata, before clustering; hypoDD does not
+        # read the data again for a single cluster of all events
+        self.global_info = {}
+        self.columns = None
+        self.last_row = None
+        self.step = "starting"
+        self.done_work = 0.0
+        self.rising = 0
+        self.started = time.monotonic()
+        self.relocation_started = None
+        self.iteration_started = None
+
+    def _finish_cluster(self):
+        if self.cluster is not None:
+            self.done_work += self._cluster_work(self.cluster)
+        self.cluster = None
+
+    def _seed_cluster_info(self):
+        if "events" not in self.cluster_info:
+            self.cluster_info = dict(self.global_info, **self.cluster_info)
+
+    def _cluster_work(self, cluster):
+        return self.cluster_sizes.get(cluster) or self.cluster_info.get("events") or 1
+
+    def feed(self, line):
+        """
+        Records (dicts) for one line of stdout
+        """
+        now = time.monotonic()
+        text = line.strip()
+        records = []
+        if text.startswith("# clusters:"):
+            self.n_clusters = int(text.split(":")[1])
+        elif text.startswith("Cluster") and text.endswith("events") and ":" in text:
+            number, size = text[len("Cluster"):].split(":")
+            self.cluster_sizes[int(number)] = int(size.split()[0])
+        elif text.startswith("RELOCATION OF CLUSTER:"):
+            self._finish_cluster()
+            number = _number(text.split(":")[1].split()[0])
+            if number is None:
+                # i2 overflows from cluster 100 on
+                number = self.cid or self.last_cluster + 1
+            self.last_cluster = number
+            self.cluster = number
+            self.cluster_info = {"cluster": number}
+            self.columns = None
+            self.last_row = None
+            self.rising = 0
+            self.step = "reading data"
+            self.iteration_started = now
+            if self.relocation_started is None:
+                self.relocation_started = now
+        elif text.startswith("#"):
+            info = self.global_info if self.cluster is None else self.cluster_info
+            if text.startswith("# events after dtime match"):
+                info["events"] = _count(text)
+            elif text.startswith("# catalog P dtimes"):
+                info["ct_p"] = _count(text)
+            elif text.startswith("# catalog S dtimes"):
+                info["ct_s"] = _count(text)
+            elif text.startswith("# cross corr P dtimes"):
+                info["cc_p"] = _count(text)
+            elif text.startswith("# cross corr S dtimes"):
+                info["cc_s"] = _count(text)
+            elif text.startswith("# stations ="):
+                info["stations"] = _count(text)
+        elif text.startswith("Initial trial sources") and self.cluster is not None:
+            self._seed_cluster_info()
+            records.append(dict(self.cluster_info, type="cluster",
+                                elapsed=round(now - self.started, 3)))
+        elif text.startswith("IT "):
+            self.columns = text.split()
+        elif self.columns and text[:1].isdigit() and line[:2].strip().isdigit():
+            row = parse_iteration_row(self.columns, line.rstrip("\n"))
+            self._seed_cluster_info()
+            info = self.cluster_info
+            for pct, total in (("events_pct", info.get("events")),
+                               ("ct_pct", info.get("ct_p", 0) + info.get("ct_s", 0)),
+                               ("cc_pct", info.get("cc_p", 0) + info.get("cc_s", 0))):
+                if row.get(pct) is not None and total:
+                    row[pct[:-4]] = round(row[pct] * total / 100)
+            row["type"] = "iteration"
+            row["cluster"] = self.cluster
+            row["seconds"] = round(now - self.iteration_started, 3)
+            row["elapsed"] = round(now - self.started, 3)
+            self.iteration_started = now
+            rms = row.get("rms_cc_change_pct", row.get("rms_ct_change_pct"))
+            self.rising = self.rising + 1 if rms is not None and rms > 0 else 0
+            self.last_row = row
+            self.step = "iterating"
+            records.append(row)
+        elif "less than 2 events" in text or "skipping this cluster" in text:
+            if self.cluster is not None:
+                records.append({"type": "cluster_skipped", "cluster": self.cluster,
+                                "reason": text, "elapsed": round(now - self.started, 3)})
+                self._finish_cluster()
+        elif text.startswith("writing out results"):
+            self._finish_cluster()
+            self.step = "writing results"
+        return records
+
+    def log_line(self, line):
+        """
+        A new line of hypoDD.log; "~ ..." lines name the current step
+        """
+        if line.startswith("~ "):
+            self.step = line[2:].split("...")[0].strip()
+
+    def fraction(self):
+        """
+        Fraction of the work done, counting events x iterations
+        """
+        if self.cid:
+            total = self.cluster_sizes.get(self.cid) or self.cluster_info.get("events")
+        else:
+            total = sum(self.cluster_sizes.values())
+        if not total:
+            return None
+        done = self.done_work
+        if self.cluster is not None and self.last_row:
+            done += (self._cluster_work(self.cluster) *
+                     min(self.last_row["iteration"] or 0, self.iterations) /
+                     max(self.iterations, 1))
+        return min(done / total, 1.0)
+
+    def eta(self):
+        fraction = self.fraction()
+        if not fraction or self.relocation_started is None:
+            return None
+        elapsed = time.monotonic() - self.relocation_started
+        return elapsed * (1 - fraction) / fraction
+
+    def status(self):
+        parts = []
+        if self.cluster is not None:
+            n = self.n_clusters if not self.cid else 1
+            parts.append(f"cluster {self.cluster}" + (f"/{n}" if n else ""))
+            if self.last_row:
+                parts.append(f"it {self.last_row['iteration']}/{self.iterations}")
+                for key, label in (("rms_ct_ms", "RMSCT"), ("rms_cc_ms", "RMSCC")):
+                    if self.last_row.get(key) is not None:
+                        parts.append(f"{label} {self.last_row[key]} ms")
+        parts.append(self.step)
+        return "  ".join(parts)
+
+    def check_limits(self, max_rms_ms=None, max_iteration_seconds=None, diverge=None):
+        """
+        Reason to stop the run, or None
+        """
+        row = self.last_row
+        if max_rms_ms is not None and row:
+            for key in ("rms_ct_ms", "rms_cc_ms"):
+                if row.get(key) is not None and row[key] > max_rms_ms:
+                    return f"{key} {row[key]} > {max_rms_ms} in cluster {self.cluster}"
+        if diverge and self.rising >= diverge:
+            return (f"RMS rose in {self.rising} consecutive iterations "
+                    f"in cluster {self.cluster}")
+        if (max_iteration_seconds is not None and self.iteration_started is not None and
+                self.cluster is not None and
+                time.monotonic() - self.iteration_started > max_iteration_seconds):
+            return (f"iteration of cluster {self.cluster} running longer than "
+                    f"{max_iteration_seconds} s")
+        return None
+
+
+class Ph2dtMonitor:
+    """
+    ph2dt summary records; progress from the last pair written to dt.ct
+    """
+
+    def __init__(self, cwd, phase_file=None, dt_file="dt.ct"):
+        self.cwd = cwd
+        self.dt_file = os.path.join(cwd, dt_file)
+        self.summary = {}
+        self.step = "starting"
+        self.order = {}
+        self.phase_file = os.path.join(cwd, phase_file) if phase_file else None
+        self.started = time.monotonic()
+        self.forming_started = None
+
+    def _load_order(self):
+        # ph2dt forms the pairs of the events in phase file order
+        with open(self.phase_file, "r") as f:
+            for line in f:
+                if line.startswith("#"):
+                    self.order[line.split()[-1]] = len(self.order)
+
+    def feed(self, line):
+        text = line.strip()
+        records = []
+        if text.startswith("reading data"):
+            self.step = "reading data"
+        elif text.startswith("forming dtimes"):
+            self.step = "forming dtimes"
+            self.forming_started = time.monotonic()
+            if self.phase_file and os.path.exists(self.phase_file):
+                self._load_order()
+        elif text.startswith(">") and "=" in text:
+            key, value = text[1:].split("=", 1)
+            key = key.strip().replace(" ", "_").replace("(km)", "km").replace(".", "")
+            values = value.replace("(", " ").replace(")", " ").replace("%", " ").split()
+            try:
+                self.summary[key] = float(values[0]) if "." in values[0] else int(values[0])
+            except (ValueError, IndexError):
+                self.summary[key] = value.strip()
+        elif text.startswith("Done."):
+            self.step = "done"
+            records.append(dict(self.summary, type="ph2dt",
+                                elapsed=round(time.monotonic() - self.started, 3)))
+        return records
+
+    def log_line(self, line):
+        pass
+
+    def _last_event(self):
+        try:
+            with open(self.dt_file, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                f.seek(max(f.tell() - 4096, 0))
+                tail = f.read().decode("ascii", "replace")
+        except OSError:
+            return None
+        for line in reversed(tail.splitlines()):
+            if line.startswith("#"):
+                parts = line[1:].split()
+                return parts[0] if parts else None
+        return None
+
+    def fraction(self):
+        if self.step != "forming dtimes" or not self.order:
+            return 1.0 if self.step == "done" else None
+        event = self._last_event()
+        if event not in self.order:
+            return None
+        return (self.order[event] + 1) / len(self.order)
+
+    def eta(self):
+        fraction = self.fraction()
+        if not fraction or self.forming_started is None:
+            return None
+        elapsed = time.monotonic() - self.forming_started
+        return elapsed * (1 - fraction) / fraction
+
+    def status(self):
+        return self.step
+
+    def check_limits(self, **limits):
+        return None
+
+
+class LogTail:
+    """
+    Complete lines appended to a file since the last call
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.offset = 0
+        self.partial = b""
+
+    def read_lines(self):
+        try:
+            with open(self.filename, "rb") as f:
+                if os.fstat(f.fileno()).st_size < self.offset:
+                    self.offset = 0
+                f.seek(self.offset)
+                data = f.read()
+        except OSError:
+            return []
+        self.offset += len(data)
+        data = self.partial + data
+        lines = data.split(b"\n")
+        self.partial = lines.pop()
+        return [line.decode("ascii", "replace").rstrip("\r") for line in lines]
+
+
+def _clock(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def progress_line(monitor, elapsed, width=30):
+    fraction = monitor.fraction()
+    if fraction is None:
+        bar = "[" + "?" * width + "]    "
+    else:
+        filled = int(round(fraction * width))
+        bar = f"[{'#' * filled}{'.' * (width - filled)}] {fraction * 100:3.0f}%"
+    eta = monitor.eta()
+    return (f"{bar}  {_clock(elapsed)}  ETA {_clock(eta) if eta is not None else '?'}  "
+            f"{monitor.status()}")
+
+
+def _reader(pipe, lines):
+    for line in iter(pipe.readline, ""):
+        lines.put(line)
+    lines.put(None)
+
+
+def run_monitored(command, cwd, monitor, metrics_file=None, log_file=None,
+                  output_file=None, stream=sys.stderr, interval=0.5, report_every=10.0,
+                  **limits):
+    """
+    Run command in cwd, feed its stdout to monitor and write the records
+    to metrics_file (JSON lines). stdout is copied to output_file. The
+    progress line is redrawn every interval seconds on a terminal and
+    printed every report_every seconds otherwise.
+    limits go to monitor.check_limits; the run is stopped on the first
+    one reached. Returns (returncode, reason the run was stopped or None).
+    """
+    env = dict(os.environ, GFORTRAN_UNBUFFERED_PRECONNECTED="y")
+    metrics = open(metrics_file, "a") if metrics_file else None
+    output = open(output_file, "w") if output_file else None
+    tail = LogTail(log_file) if log_file else None
+    interactive = stream is not None and stream.isatty()
+    started = time.monotonic()
+
+    def emit(record):
+        if metrics:
+            metrics.write(json.dumps(record) + "\n")
+            metrics.flush()
+
+    emit({"type": "start", "command": command, "cwd": cwd, "time": time.time()})
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True, errors="replace")
+    lines = queue.Queue()
+    reader = threading.Thread(target=_reader, args=(process.stdout, lines), daemon=True)
+    reader.start()
+
+    stopped = None
+    finished = False
+    last_draw = started
+    try:
+        while not finished:
+            try:
+                line = lines.get(timeout=interval)
+            except queue.Empty:
+                line = ""
+            if line is None:
+                finished = True
+            elif line:
+                if output:
+                    output.write(line)
+                for record in monitor.feed(line):
+                    emit(record)
+            if tail:
+                for log_line in tail.read_lines():
+                    monitor.log_line(log_line)
+            reason = monitor.check_limits(**limits)
+            if reason and process.poll() is None:
+                stopped = reason
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                emit({"type": "stopped", "reason": reason,
+                      "elapsed": round(time.monotonic() - started, 3)})
+                break
+            now = time.monotonic()
+            if interactive and now - last_draw >= interval:
+                stream.write("\r\033[K" + progress_line(monitor, now - started))
+                stream.flush()
+                last_draw = now
+            elif stream is not None and not interactive and now - last_draw >= report_every:
+                # One line every report_every seconds into log files
+                stream.write(progress_line(monitor, now - started) + "\n")
+                stream.flush()
+                last_draw = now
+    finally:
+        returncode = process.wait()
+        elapsed = time.monotonic() - started
+        if interactive:
+            stream.write("\r\033[K" + progress_line(monitor, elapsed) + "\n")
+        elif stream is not None:
+            stream.write(progress_line(monitor, elapsed) + "\n")
+        emit({"type": "end", "returncode": returncode, "stopped": stopped,
+              "elapsed": round(elapsed, 3)})
+        if metrics:
+            metrics.close()
+        if output:
+            output.close()
+    return returncode, stopped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run ph2dt or hypoDD with live progress and JSONL metrics")
+    parser.add_argument("program", help="path of the hypoDD or ph2dt executable")
+    parser.add_argument("inp", help="its input file (hypoDD.inp or ph2dt.inp)")
+    parser.add_argument("--cwd", default=".", help="directory to run in")
+    parser.add_argument("--metrics", help="append JSON line records to this file")
+    parser.add_argument("--output", help="copy of stdout (default: <program>.out in --cwd)")
+    parser.add_argument("--max-rms-ms", type=float,
+                        help="stop hypoDD when an RMS residual exceeds this")
+    parser.add_argument("--max-iteration-seconds", type=float,
+                        help="stop hypoDD when one iteration takes longer")
+    parser.add_argument("--diverge", type=int, metavar="N",
+                        help="stop hypoDD when the RMS rises in N consecutive iterations")
+    args = parser.parse_args(argv)
+
+    name = os.path.basename(args.program).lower()
+    program = os.path.abspath(args.program) if os.sep in args.program else args.program
+    log_file = None
+    if name.startswith("ph2dt"):
+        with open(os.path.join(args.cwd, args.inp), "r") as f:
+            phase_file = [line.strip() for line in f
+                          if line.strip() and not line.startswith("*")][1]
+        monitor = Ph2dtMonitor(args.cwd, phase_file)
+        output = args.output or os.path.join(args.cwd, "ph2dt.out")
+    else:
+        monitor = HypoDDMonitor(*iteration_plan(os.path.join(args.cwd, args.inp)))
+        log_file = os.path.join(args.cwd, "hypoDD.log")
+        output = args.output or os.path.join(args.cwd, "hypoDD.out")
+
+    returncode, stopped = run_monitored(
+        [program, args.inp], args.cwd, monitor, metrics_file=args.metrics,
+        log_file=log_file, output_file=output, max_rms_ms=args.max_rms_ms,
+        max_iteration_seconds=args.max_iteration_seconds, diverge=args.diverge)
+    if stopped:
+        print(f"Stopped: {stopped}")
+        return 2
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -168,33 +168,47 @@ def parse_pick_line(line, event_date):
 
 
 
-def main():
+def main(input_file=INPUT_FILE, output_file=OUTPUT_FILE, start=None, end=None):
 
-    # Read file and split into events
+    # Only convert the events between start and end (datetimes), found
+    # through the byte-offset index instead of reading the whole file
+    if start is not None or end is not None:
 
-    with open(INPUT_FILE, 'r', encoding='utf-8') as f:
+        from nordic_index import NordicIndex
 
-        lines = f.readlines()
+        numbered = NordicIndex(input_file).read_between(start, end)
 
-    events = []
+        events = [ev for _, ev in numbered]
 
-    event = []
+    else:
 
-    for line in lines:
+        # Read file and split into events
 
-        if line.strip() == '' and event:
+        with open(input_file, 'r', encoding='utf-8') as f:
 
-            events.append(event)
+            lines = f.readlines()
+
+        events = []
+
+        event = []
+
+        for line in lines:
 
-            event = []
+            if line.strip() == '' and event:
 
-        else:
+                events.append(event)
 
-            event.append(line.rstrip('\n'))
+                event = []
 
-    if event:
+            else:
+
+                event.append(line.rstrip('\n'))
+
+        if event:
+
+            events.append(event)
 
-        events.append(event)
+        numbered = list(enumerate(events))
 
 
 
@@ -250,7 +264,7 @@ def main():
 
     
 
-    for i, ev in enumerate(events):
+    for i, ev in numbered:
 
         if not ev or not ev[0].strip():
 
@@ -399,7 +413,7 @@ def main():
 
     
 
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+    with open(output_file, 'w', encoding='utf-8') as f:
 
         f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
 
@@ -407,7 +421,7 @@ def main():
 
     
 
-    print(f'Wrote QuakeML to {OUTPUT_FILE}')
+    print(f'Wrote QuakeML to {output_file}')
 
     print(f'Events processed: {events_processed}')
 
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Byte-offset index of the events in a Nordic file (hyp.out).
+
+The index is kept in a small sidecar file (hyp.out.idx) with one line per
+event block:
+
+    position offset length id
+
+position is the block number as nordic2quakeml.py counts them, offset and
+length locate the block in the file and id is the 14-digit timestamp of
+the ID: line ("-" if there is none). When the Nordic file has only been
+appended to, the index is extended from where it stopped instead of being
+rebuilt. Time-window and ID queries then read just the matching blocks.
+
+    python nordic_index.py hyp.out --id 2017-03-23-1611
+    python nordic_index.py hyp.out --start 2017-03-01 --end 2017-04-01 -o march.out
+"""
+import os
+import re
+import sys
+import json
+import zlib
+import bisect
+import argparse
+from datetime import datetime
+
+INDEX_VERSION = 1
+ID_PATTERN = re.compile(rb'ID:(\d{14})')
+
+
+def _check_bytes(f, end, size=256):
+    """
+    CRC of the bytes just before end, used to notice rewritten files
+    """
+    start = max(0, end - size)
+    f.seek(start)
+    return zlib.crc32(f.read(end - start))
+
+
+class NordicIndex:
+    """
+    Event blocks of a Nordic file with their byte offsets
+    """
+
+    def __init__(self, filename, index_file=None, save=True):
+        self.filename = filename
+        self.index_file = index_file or filename + ".idx"
+        self.entries = []          # (position, offset, length, event id or None)
+        self.scanned_to = 0        # end of the last block closed by a blank line
+        self.size = 0
+        self._check = 0
+        self._times = None
+        self._load()
+        if self.update() and save:
+            self.save()
+
+    def _load(self):
+        if not os.path.exists(self.index_file):
+            return
+        with open(self.index_file, "r") as f:
+            try:
+                meta = json.loads(f.readline())
+            except ValueError:
+                return
+            if meta.get("version") != INDEX_VERSION:
+                return
+            entries = []
+            for line in f:
+                position, offset, length, event_id = line.split()
+                entries.append((int(position), int(offset), int(length),
+                                None if event_id == "-" else event_id))
+        self.entries = entries
+        self.scanned_to = meta["scanned_to"]
+        self.size = meta["size"]
+        self._check = meta["check"]
+
+    def save(self):
+        tmp = self.index_file + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps({"version": INDEX_VERSION,
+                                "size": self.size,
+                                "scanned_to": self.scanned_to,
+                                "check": self._check}) + "\n")
+            for position, offset, length, event_id in self.entries:
+                f.write(f"{position} {offset} {length} {event_id or '-'}\n")
+        os.replace(tmp, self.index_file)
+
+    def update(self):
+        """
+        Index new blocks. Returns True if the index changed.
+        """
+        size = os.path.getsize(self.filename)
+        with open(self.filename, "rb") as f:
+            appended = (size >= self.scanned_to and
+                        _check_bytes(f, self.scanned_to) == self._check)
+            if appended:
+                # The last block may not have been closed by a blank line
+                # yet; it is scanned again together with the new data.
+                entries = [e for e in self.entries if e[1] < self.scanned_to]
+                start = self.scanned_to
+            else:
+                entries = []
+                start = 0
+            if appended and size == self.size and self.entries:
+                return False
+            entries, scanned_to = self._scan(f, start, entries)
+            self._check = _check_bytes(f, scanned_to)
+        self.entries = entries
+        self.scanned_to = scanned_to
+        self.size = size
+        self._times = None
+        return True
+
+    @staticmethod
+    def _scan(f, start, entries):
+        """
+        Split the file from start into blocks the way nordic2quakeml.main
+        does: a blank line ends a non-empty block, any other line (or a
+        blank line at the start of a block) belongs to the current block
+        """
+        position = len(entries)
+        offset = start
+        block_start = None
+        block_id = None
+        scanned_to = start
+        f.seek(start)
+        for line in f:
+            if not line.strip() and block_start is not None:
+                entries.append((position, block_start, offset - block_start, block_id))
+                position += 1
+                block_start = None
+                block_id = None
+                offset += len(line)
+                scanned_to = offset
+                continue
+            if block_start is None:
+                block_start = offset
+            if block_id is None:
+                m = ID_PATTERN.search(line)
+                if m:
+                    block_id = m.group(1).decode()
+            offset += len(line)
+        if block_start is not None:
+            # Unterminated last block: indexed, but scanned again next time
+            entries.append((position, block_start, offset - block_start, block_id))
+        return entries, scanned_to
+
+    # --- queries ----------------------------------------------------------
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _sorted_times(self):
+        if self._times is None:
+            timed = sorted((e[3], i) for i, e in enumerate(self.entries) if e[3])
+            self._times = ([t for t, _ in timed], [i for _, i in timed])
+        return self._times
+
+    def between(self, start=None, end=None):
+        """
+        Entries whose ID time lies in [start, end], in file order
+        """
+        times, order = self._sorted_times()
+        lo = bisect.bisect_left(times, start.strftime("%Y%m%d%H%M%S")) if start else 0
+        hi = bisect.bisect_right(times, end.strftime("%Y%m%d%H%M%S")) if end else len(times)
+        return [self.entries[i] for i in sorted(order[lo:hi])]
+
+    def find(self, event_id):
+        """
+        Entries whose ID starts with the digits of event_id, so
+        "2017-03-23-1611" finds every event of that minute
+        """
+        digits = re.sub(r"\D", "", event_id)
+        times, order = self._sorted_times()
+        lo = bisect.bisect_left(times, digits)
+        hi = bisect.bisect_right(times, digits + "9" * (14 - len(digits)))
+        return [self.entries[i] for i in sorted(order[lo:hi])]
+
+    def read(self, entries):
+        """
+        [(position, lines)] of the given entries, lines as
+        nordic2quakeml.main reads them
+        """
+        result = []
+        with open(self.filename, "rb") as f:
+            for position, offset, length, _ in entries:
+                f.seek(offset)
+                text = f.read(length).decode("utf-8")
+                result.append((position, text.splitlines()))
+        return result
+
+    def read_between(self, start=None, end=None):
+        return self.read(self.between(start, end))
+
+    def copy(self, entries, output_file):
+        """
+        Write the raw blocks, each followed by a blank line, to a new
+        Nordic file
+        """
+        with open(self.filename, "rb") as f, open(output_file, "wb") as out:
+            for _, offset, length, _ in entries:
+                f.seek(offset)
+                block = f.read(length)
+                newline = b"\r\n" if block.endswith(b"\r\n") else b"\n"
+                out.write(block + " ".ljust(80).encode() + newline)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Index a Nordic file and extract events by time or ID")
+    parser.add_argument("nordic_file", nargs="?", default="hyp.out")
+    parser.add_argument("--start", type=datetime.fromisoformat)
+    parser.add_argument("--end", type=datetime.fromisoformat)
+    parser.add_argument("--id", help="event ID or prefix, e.g. 2017-03-23-1612")
+    parser.add_argument("-o", "--output", help="write the matching events to "
+                        "this Nordic file instead of printing them")
+    args = parser.parse_args(argv)
+
+    index = NordicIndex(args.nordic_file)
+    if args.id:
+        entries = index.find(args.id)
+    elif args.start or args.end:
+        entries = index.between(args.start, args.end)
+    else:
+        print(f"{args.nordic_file}: {len(index)} event blocks indexed in {index.index_file}")
+        return
+    if args.output:
+        index.copy(entries, args.output)
+        print(f"Wrote {len(entries)} events to {args.output}")
+    else:
+        for _, lines in index.read(entries):
+            sys.stdout.write("\n".join(lines) + "\n\n")
+
+
+if __name__ == "__main__":
+    main()
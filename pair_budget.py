@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Prioritized, capped selection of the event pairs to cross-correlate.
+
+ph2dt links every event to up to MAXNGH neighbours within MAXSEP, which in
+dense sequences gives far more pairs than are worth correlating. Here the
+dt.ct pairs are ranked by
+
+    score = shared stations / (1 + distance / distance_scale)
+                            / (1 + |magnitude difference| / magnitude_scale)
+
+and only the best pairs are kept: at most k pairs per event (a pair is taken
+while either of its events still has room), optionally capped by a total
+number of pairs or a time budget converted to pairs with the measured cost
+of a pick pair.
+
+With rounds > 1, select_and_correlate correlates the selection, looks in
+the result store for events with fewer than min_strong_pairs well linked
+pairs, and gives those events their next k candidates, until every event
+is linked, the candidates run out or the budget is spent.
+"""
+import os
+import json
+import math
+import argparse
+from collections import defaultdict
+
+from cc_pipeline import DEFAULT_CC_PARAMS, pair_jobs
+from cc_store import CCResultStore, iter_event_pairs
+
+KM_PER_DEGREE = 111.19
+
+
+def event_distance_km(event_1, event_2):
+    """
+    Hypocentral distance in km; origin_depth is in m as in events.json
+    """
+    lat_1, lat_2 = event_1["origin_latitude"], event_2["origin_latitude"]
+    dx = ((event_2["origin_longitude"] - event_1["origin_longitude"]) *
+          KM_PER_DEGREE * math.cos(math.radians((lat_1 + lat_2) / 2.0)))
+    dy = (lat_2 - lat_1) * KM_PER_DEGREE
+    dz = ((event_2.get("origin_depth") or 0.0) - (event_1.get("origin_depth") or 0.0)) / 1000.0
+    return math.sqrt(dx * dx + dy * dy + dz * dz)
+
+
+def score_pairs(events, event_pairs, cc_params=None, distance_scale=1.0,
+                magnitude_scale=0.5):
+    """
+    Return [(score, ev1, ev2, n_pick_pairs)] for all event pairs, best
+    first. Pairs without a common station and phase are left out.
+    """
+    cc_params = dict(DEFAULT_CC_PARAMS, **(cc_params or {}))
+    scored = []
+    for ev1, ev2 in event_pairs:
+        event_1 = events[ev1 - 1]
+        event_2 = events[ev2 - 1]
+        jobs = pair_jobs(event_1, event_2, cc_params)
+        if not jobs:
+            continue
+        n_jobs = len(jobs)
+        shared = len({pick_1["station_id"] for pick_1, _, _ in jobs})
+        distance = event_distance_km(event_1, event_2)
+        mag_1, mag_2 = event_1.get("magnitude"), event_2.get("magnitude")
+        dmag = abs(mag_1 - mag_2) if mag_1 is not None and mag_2 is not None else 0.0
+        score = (shared / (1.0 + distance / distance_scale) /
+                 (1.0 + dmag / magnitude_scale))
+        scored.append((score, ev1, ev2, n_jobs))
+    scored.sort(key=lambda s: (-s[0], s[1], s[2]))
+    return scored
+
+
+def pick_pair_cost(metrics_file):
+    """
+    Measured seconds per pick pair from a cc_pipeline metrics file,
+    None if there is none
+    """
+    if not metrics_file or not os.path.exists(metrics_file):
+        return None
+    with open(metrics_file, "r") as f:
+        metrics = json.load(f)
+    n = metrics.get("counts", {}).get("pick_pairs")
+    return metrics["elapsed_seconds"] / n if n else None
+
+
+class PairBudget:
+    """
+    Greedy top-k-per-event selection under an optional global budget
+    """
+
+    def __init__(self, scored, k=10, max_pairs=None, max_seconds=None,
+                 seconds_per_pick_pair=None):
+        if max_seconds is not None and not seconds_per_pick_pair:
+            raise ValueError("A time budget needs seconds_per_pick_pair")
+        self.scored = scored
+        self.k = k
+        self.max_pairs = max_pairs
+        self.max_seconds = max_seconds
+        self.seconds_per_pick_pair = seconds_per_pick_pair
+        self.selected = []
+        self.per_event = defaultdict(int)
+        self.estimated_seconds = 0.0
+        self._taken = set()
+
+    def exhausted(self):
+        if self.max_pairs is not None and len(self.selected) >= self.max_pairs:
+            return True
+        return (self.max_seconds is not None and
+                self.estimated_seconds >= self.max_seconds)
+
+    def _take(self, ev1, ev2, n_jobs):
+        self._taken.add((ev1, ev2))
+        self.selected.append((ev1, ev2))
+        self.per_event[ev1] += 1
+        self.per_event[ev2] += 1
+        if self.seconds_per_pick_pair:
+            self.estimated_seconds += n_jobs * self.seconds_per_pick_pair
+
+    def select(self):
+        """
+        First round: the best pairs while either event has fewer than k
+        """
+        for _, ev1, ev2, n_jobs in self.scored:
+            if self.exhausted():
+                break
+            if (ev1, ev2) in self._taken:
+                continue
+            if self.per_event[ev1] < self.k or self.per_event[ev2] < self.k:
+                self._take(ev1, ev2, n_jobs)
+        return list(self.selected)
+
+    def expand(self, weak_events):
+        """
+        Add up to k more candidates for each weakly linked event and
+        return the new pairs
+        """
+        added = defaultdict(int)
+        new = []
+        for _, ev1, ev2, n_jobs in self.scored:
+            if self.exhausted():
+                break
+            if (ev1, ev2) in self._taken:
+                continue
+            if ((ev1 in weak_events and added[ev1] < self.k) or
+                    (ev2 in weak_events and added[ev2] < self.k)):
+                self._take(ev1, ev2, n_jobs)
+                added[ev1] += 1
+                added[ev2] += 1
+                new.append((ev1, ev2))
+        return new
+
+
+def strong_links(store, min_coeff, min_links):
+    """
+    Number of stored pairs per event with at least min_links
+    differential times of coefficient >= min_coeff
+    """
+    links = defaultdict(int)
+    for ev1, ev2, records in store.iter_pairs():
+        if sum(1 for _, _, coeff, _ in records if coeff >= min_coeff) >= min_links:
+            links[ev1] += 1
+            links[ev2] += 1
+    return links
+
+
+def select_and_correlate(working_dir="hypodd_working", waveform_index=None,
+                         cc_params=None, k=10, max_pairs=None, max_seconds=None,
+                         rounds=1, min_strong_pairs=3, min_links=4,
+                         metrics_file=None, **pipeline_options):
+    """
+    Correlate a budgeted selection of the dt.ct pairs, expanding it for
+    weakly linked events for up to rounds rounds. Returns the selection.
+    """
+    from cc_pipeline import run_cc_pipeline
+
+    cc_params = dict(DEFAULT_CC_PARAMS, **(cc_params or {}))
+    with open(os.path.join(working_dir, "working_files", "events.json"), "r") as f:
+        events = json.load(f)
+    scored = score_pairs(events, iter_event_pairs(
+        os.path.join(working_dir, "input_files", "dt.ct")), cc_params)
+    budget = PairBudget(scored, k=k, max_pairs=max_pairs, max_seconds=max_seconds,
+                        seconds_per_pick_pair=pick_pair_cost(metrics_file))
+    pairs = budget.select()
+    print(f"Selected {len(pairs)} of {len(scored)} event pairs (k={k})")
+
+    store_file = os.path.join(working_dir, "working_files", "cc_results.txt")
+    for round_number in range(1, rounds + 1):
+        run_cc_pipeline(working_dir, waveform_index, cc_params,
+                        metrics_file=metrics_file, event_pairs=pairs,
+                        **pipeline_options)
+        if round_number == rounds or budget.exhausted():
+            break
+        with CCResultStore(store_file) as store:
+            links = strong_links(store, cc_params["cc_min_allowed_cross_corr_coeff"],
+                                 min_links)
+        candidates = {ev for _, ev1, ev2, _ in scored for ev in (ev1, ev2)}
+        weak = {ev for ev in candidates if links[ev] < min_strong_pairs}
+        pairs = budget.expand(weak)
+        print(f"Round {round_number + 1}: {len(weak)} weakly linked events, "
+              f"{len(pairs)} more pairs")
+        if not pairs:
+            break
+    return budget.selected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Cross-correlate a prioritized, capped selection of event pairs")
+    parser.add_argument("--working-dir", default="hypodd_working")
+    parser.add_argument("--waveforms", default="waveforms")
+    parser.add_argument("-k", type=int, default=10, help="pairs per event")
+    parser.add_argument("--max-pairs", type=int)
+    parser.add_argument("--max-seconds", type=float,
+                        help="time budget, needs a previous metrics file")
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--min-strong-pairs", type=int, default=3)
+    parser.add_argument("--metrics-file",
+                        default=os.path.join("hypodd_working", "cc_metrics.json"))
+    args = parser.parse_args(argv)
+
+    from waveform_index import WaveformIndex
+    waveform_index = WaveformIndex()
+    waveform_index.add_directory(args.waveforms)
+    select_and_correlate(args.working_dir, waveform_index, k=args.k,
+                         max_pairs=args.max_pairs, max_seconds=args.max_seconds,
+                         rounds=args.rounds, min_strong_pairs=args.min_strong_pairs,
+                         metrics_file=args.metrics_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Streamed event pairs and events for the cross-correlation.
+
+Loading events.json with every pick of every event and listing all dt.ct
+pairs up front makes the memory of the correlation grow with the size
+of the sequence. Here
+
+    EventIndex        stands in for the events list: a sidecar
+                      (events.json.idx) holds the byte offset and length
+                      of every event, which is parsed when it is used and
+                      kept in a small LRU cache
+    iter_pair_chunks  streams the "#" lines of dt.ct in chunks of at most
+                      chunk_size pairs, leaving out the pairs already in
+                      the result store
+
+With run_cc_pipeline(..., chunk_size=N) only one chunk of pairs and the
+events it touches are in memory at a time, whatever the number of pairs.
+
+    python pair_stream.py hypodd_working --chunk-size 5000
+"""
+import os
+import json
+import codecs
+import argparse
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from cc_store import iter_event_pairs
+
+INDEX_VERSION = 1
+
+
+def scan_events(events_file, chunk_size=1 << 20):
+    """
+    (offset, length) in bytes of every element of a JSON list, found in
+    one streaming pass
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    entries = []
+    with open(events_file, "rb") as f:
+        buffer = ""
+        position = 0
+        offset = 0             # byte offset of buffer[position]
+        started = False
+        eof = False
+        while True:
+            # Separators are ASCII, one byte per character
+            skip = position
+            while position < len(buffer) and buffer[position] in " \t\r\n,[":
+                if buffer[position] == "[":
+                    if started:
+                        break
+                    started = True
+                position += 1
+            offset += position - skip
+            if started and buffer.startswith("]", position):
+                return entries
+            try:
+                if not started or position >= len(buffer):
+                    raise ValueError("need more data")
+                _, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise ValueError(f"{events_file} is not a complete JSON list")
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + utf8.decode(chunk, final=eof)
+                position = 0
+                continue
+            length = len(buffer[position:end].encode("utf-8"))
+            entries.append((offset, length))
+            offset += length
+            position = end
+
+
+class EventIndex:
+    """
+    Read-only sequence of the events of an events.json, parsed on access.
+
+    events[i] is the event with HypoDD id i + 1, like the list json.load
+    returns. Picks whose id is in drop_picks are removed when an event is
+    read (see pick_prescreen.apply_prescreen).
+    """
+
+    def __init__(self, events_file, index_file=None, cache_size=2000, save=True,
+                 drop_picks=None):
+        self.events_file = events_file
+        self.index_file = index_file or events_file + ".idx"
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._drop_picks = drop_picks
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.offsets, self.lengths = self._load()
+        if self.offsets is None:
+            entries = scan_events(events_file)
+            self.offsets = np.array([e[0] for e in entries], dtype=np.int64)
+            self.lengths = np.array([e[1] for e in entries], dtype=np.int64)
+            if save:
+                self.save()
+
+    def _stamp(self):
+        stat = os.stat(self.events_file)
+        return {"version": INDEX_VERSION, "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns}
+
+    def _load(self):
+        if not os.path.exists(self.index_file):
+            return None, None
+        with open(self.index_file, "r") as f:
+            try:
+                meta = json.loads(f.readline())
+            except ValueError:
+                return None, None
+            if meta != self._stamp():
+                return None, None
+            table = np.array(f.read().split(), dtype=np.int64).reshape(-1, 2)
+        return table[:, 0].copy(), table[:, 1].copy()
+
+    def save(self):
+        tmp = self.index_file + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps(self._stamp()) + "\n")
+            f.write("".join(f"{o} {n}\n" for o, n in zip(self.offsets.tolist(),
+                                                        self.lengths.tolist())))
+        os.replace(tmp, self.index_file)
+
+    @property
+    def drop_picks(self):
+        return self._drop_picks
+
+    @drop_picks.setter
+    def drop_picks(self, rejected):
+        # Events already parsed still hold the dropped picks
+        with self._lock:
+            self._drop_picks = rejected
+            self._cache.clear()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _file(self):
+        # One handle per thread; the pipeline reads events from several
+        f = getattr(self._local, "file", None)
+        if f is None:
+            f = self._local.file = open(self.events_file, "rb")
+        return f
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"event index {i} out of range")
+        with self._lock:
+            event = self._cache.get(i)
+            if event is not None:
+                self._cache.move_to_end(i)
+                return event
+        f = self._file()
+        f.seek(int(self.offsets[i]))
+        event = json.loads(f.read(int(self.lengths[i])))
+        drop = self._drop_picks
+        if drop:
+            event["picks"] = [p for p in event["picks"] if p["id"] not in drop]
+        with self._lock:
+            self._cache[i] = event
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return event
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def iter_pair_chunks(dt_ct, chunk_size=5000, store=None, event_pairs=None):
+    """
+    Yield lists of at most chunk_size (event_1, event_2) pairs from the
+    "#" lines of dt_ct (or from event_pairs), without the pairs store
+    has done
+    """
+    chunk = []
+    for ev1, ev2 in (event_pairs if event_pairs is not None else iter_event_pairs(dt_ct)):
+        if store is not None and store.is_done(ev1, ev2):
+            continue
+        chunk.append((ev1, ev2))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Index events.json and count the dt.ct pair chunks")
+    parser.add_argument("working_dir", nargs="?", default="hypodd_working")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    events = EventIndex(os.path.join(args.working_dir, "working_files", "events.json"))
+    dt_ct = os.path.join(args.working_dir, "input_files", "dt.ct")
+    n_chunks = n_pairs = 0
+    for chunk in iter_pair_chunks(dt_ct, args.chunk_size):
+        n_chunks += 1
+        n_pairs += len(chunk)
+    print(f"{len(events)} events indexed in {events.index_file}; "
+          f"{n_pairs} pairs in {n_chunks} chunks of at most {args.chunk_size}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Data-quality prescreen of pick windows before cross-correlation.
+
+A pick whose window is noise dominated, gapped or clipped costs a full
+read, filter and correlation for every partner and still ends up below the
+coefficient threshold. Here every pick used by a dt.ct event pair is looked
+at once, per channel:
+
+    snr            RMS after the pick / RMS before it, on the filtered window
+    gap_fraction   share of raw samples in flat runs (zero-filled gaps,
+                   dead channels)
+    clip_fraction  share of raw samples at the window's minimum or maximum
+
+The statistics are computed for a whole batch of windows at once on the
+concatenated samples (cumulative sums and reduceat), not pick by pick. A
+pick is kept if at least one of its weighted channels passes all
+thresholds; the others are removed from every event pair before
+correlation.
+"""
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from obspy import UTCDateTime
+
+from cc_pipeline import (DEFAULT_CC_PARAMS, phase_weighting, pair_jobs,
+                         load_pick_window, filter_window)
+
+DEFAULT_THRESHOLDS = {
+    "min_snr": 2.0,
+    "max_gap_fraction": 0.05,
+    "max_clip_fraction": 0.01,
+    # Seconds of noise before the pick; defaults to cc_time_before
+    "noise_length": None,
+    # Flat runs shorter than this are not counted as gaps
+    "min_gap_samples": 10,
+}
+
+
+def window_statistics(entries, cc_params, noise_length=None, min_gap_samples=10):
+    """
+    SNR, gap and clipping statistics for a batch of windows.
+
+    entries is a list of (raw Trace, filtered Trace, pick time). Returns
+    three arrays with one value per entry.
+    """
+    n = len(entries)
+    if n == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    before = cc_params["cc_time_before"]
+    after = cc_params["cc_time_after"]
+    margin = cc_params["cc_maxlag"] / 2.0
+    noise_length = noise_length or before
+
+    # --- SNR on the filtered windows -----------------------------------
+    lengths = np.array([len(f.data) for _, f, _ in entries])
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    data = np.concatenate([np.asarray(f.data, dtype=np.float64) for _, f, _ in entries])
+    power = np.concatenate(([0.0], np.cumsum(data ** 2)))
+    rates = np.array([f.stats.sampling_rate for _, f, _ in entries])
+    pick_offsets = np.array([t - f.stats.starttime for _, f, t in entries])
+    pick_index = np.round(pick_offsets * rates).astype(np.int64)
+
+    def segment_rms(start, end):
+        start = offsets[:-1] + np.clip(start, 0, lengths)
+        end = offsets[:-1] + np.clip(end, 0, lengths)
+        count = np.maximum(end - start, 1)
+        return np.sqrt((power[end] - power[start]) / count)
+
+    # The noise window ends half a max lag before the pick, so an early
+    # onset within the pick uncertainty does not count as noise
+    noise_end = pick_index - np.round(margin * rates).astype(np.int64)
+    noise = segment_rms(noise_end - np.round(noise_length * rates).astype(np.int64),
+                        noise_end)
+    signal = segment_rms(pick_index, pick_index + np.round(after * rates).astype(np.int64))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        snr = np.where(noise > 0, signal / noise, np.where(signal > 0, np.inf, 0.0))
+
+    # --- gaps and clipping on the raw windows --------------------------
+    raw_lengths = np.array([len(r.data) for r, _, _ in entries])
+    raw_offsets = np.concatenate(([0], np.cumsum(raw_lengths)))
+    raw = np.concatenate([np.asarray(r.data, dtype=np.float64) for r, _, _ in entries])
+    trace_of_sample = np.repeat(np.arange(n), raw_lengths)
+
+    # Samples equal to their predecessor, never across two windows
+    same = np.zeros(len(raw), dtype=bool)
+    same[1:] = raw[1:] == raw[:-1]
+    same[raw_offsets[:-1]] = False
+    edges = np.diff(np.concatenate(([0], same.astype(np.int8), [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_samples = np.flatnonzero(edges == -1) - run_starts + 1
+    long_runs = run_samples >= min_gap_samples
+    gap_samples = np.zeros(n)
+    np.add.at(gap_samples, trace_of_sample[run_starts[long_runs]],
+              run_samples[long_runs])
+    gap_fraction = gap_samples / np.maximum(raw_lengths, 1)
+
+    nonempty = raw_lengths > 0
+    starts = raw_offsets[:-1][nonempty]
+    highest = np.full(n, np.nan)
+    lowest = np.full(n, np.nan)
+    highest[nonempty] = np.maximum.reduceat(raw, starts)
+    lowest[nonempty] = np.minimum.reduceat(raw, starts)
+    tolerance = 1e-3 * (highest - lowest)
+    at_limit = ((raw >= (highest - tolerance)[trace_of_sample]) |
+                (raw <= (lowest + tolerance)[trace_of_sample]))
+    # A flat window is a gap, not clipping
+    at_limit &= (highest > lowest)[trace_of_sample]
+    clip_fraction = np.bincount(trace_of_sample, weights=at_limit,
+                                minlength=n) / np.maximum(raw_lengths, 1)
+    return snr, gap_fraction, clip_fraction
+
+
+def _load(pick, waveform_index, cc_params):
+    weighting = phase_weighting(pick["phase"], cc_params) or {}
+    components = [c for c, w in weighting.items() if w]
+    raw = load_pick_window(pick, components, waveform_index, cc_params)
+    return pick, components, raw, filter_window(raw, cc_params)
+
+
+def screened_picks(events, event_pairs, cc_params):
+    """
+    The picks that take part in at least one pick pair, in event order
+    """
+    picks = {}
+    for ev1, ev2 in event_pairs:
+        for pick_1, pick_2, _ in pair_jobs(events[ev1 - 1], events[ev2 - 1], cc_params):
+            picks.setdefault(pick_1["id"], pick_1)
+            picks.setdefault(pick_2["id"], pick_2)
+    return list(picks.values())
+
+
+def prescreen_picks(events, event_pairs, waveform_index, cc_params=None,
+                    thresholds=None, io_threads=4, batch_size=2000,
+                    quality_file=None, windows=None):
+    """
+    Screen all picks of the given event pairs.
+
+    Returns (rejected pick ids, report) where the report counts the
+    screened picks and channels and the excluded picks by reason. With
+    quality_file the per-channel statistics are written to it as JSON.
+    If windows is a dict, the filtered windows of the picks that pass are
+    added to it by pick id, for the correlation to use.
+    """
+    cc_params = dict(DEFAULT_CC_PARAMS, **(cc_params or {}))
+    thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    picks = screened_picks(events, event_pairs, cc_params)
+
+    rejected = set()
+    report = {"picks": len(picks), "channels": 0, "excluded": 0,
+              "no_data": 0, "low_snr": 0, "gaps": 0, "clipped": 0}
+    quality = {}
+    with ThreadPoolExecutor(max_workers=io_threads) as executor:
+        for i in range(0, len(picks), batch_size):
+            loaded = list(executor.map(
+                lambda pick: _load(pick, waveform_index, cc_params),
+                picks[i:i + batch_size]))
+            entries = []
+            owners = []
+            for pick, components, raw, filtered in loaded:
+                for component in components:
+                    if component in raw and component in filtered:
+                        entries.append((raw[component], filtered[component],
+                                        UTCDateTime(pick["pick_time"])))
+                        owners.append((pick["id"], component))
+            snr, gaps, clips = window_statistics(
+                entries, cc_params, thresholds["noise_length"],
+                thresholds["min_gap_samples"])
+            report["channels"] += len(entries)
+
+            # A pick passes if any channel passes; otherwise it is
+            # reported under the reason of its first channel
+            passed = {}
+            for (pick_id, component), s, g, c in zip(owners, snr, gaps, clips):
+                quality.setdefault(pick_id, {})[component] = {
+                    "snr": float(s), "gap_fraction": float(g),
+                    "clip_fraction": float(c)}
+                if g > thresholds["max_gap_fraction"]:
+                    reason = "gaps"
+                elif c > thresholds["max_clip_fraction"]:
+                    reason = "clipped"
+                elif s < thresholds["min_snr"]:
+                    reason = "low_snr"
+                else:
+                    reason = None
+                if reason is None or pick_id not in passed:
+                    passed[pick_id] = reason
+            for pick, _, _, filtered in loaded:
+                reason = passed.get(pick["id"], "no_data")
+                if reason is not None:
+                    rejected.add(pick["id"])
+                    report[reason] += 1
+                    report["excluded"] += 1
+                elif windows is not None:
+                    windows[pick["id"]] = filtered
+
+    if quality_file:
+        with open(quality_file, "w") as f:
+            json.dump(quality, f)
+    return rejected, report
+
+
+def apply_prescreen(events, rejected):
+    """
+    Copy of events without the rejected picks; event positions, and so
+    the HypoDD event ids, are unchanged
+    """
+    return [dict(event, picks=[p for p in event["picks"] if p["id"] not in rejected])
+            for event in events]
+
+
+def print_report(report):
+    print(f"Prescreened {report['picks']} picks ({report['channels']} channels): "
+          f"excluded {report['excluded']} "
+          f"({report['no_data']} without data, {report['low_snr']} low SNR, "
+          f"{report['gaps']} gapped, {report['clipped']} clipped)")
+
+
+def main(argv=None):
+    import os
+    from cc_store import iter_event_pairs
+    from waveform_index import WaveformIndex
+
+    parser = argparse.ArgumentParser(
+        description="Report which picks a correlation prescreen would exclude")
+    parser.add_argument("--working-dir", default="hypodd_working")
+    parser.add_argument("--waveforms", default="waveforms")
+    parser.add_argument("--min-snr", type=float, default=DEFAULT_THRESHOLDS["min_snr"])
+    parser.add_argument("--max-gap-fraction", type=float,
+                        default=DEFAULT_THRESHOLDS["max_gap_fraction"])
+    parser.add_argument("--max-clip-fraction", type=float,
+                        default=DEFAULT_THRESHOLDS["max_clip_fraction"])
+    parser.add_argument("--quality-file", help="write per-channel statistics (JSON)")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(args.working_dir, "working_files", "events.json"), "r") as f:
+        events = json.load(f)
+    waveform_index = WaveformIndex()
+    waveform_index.add_directory(args.waveforms)
+    _, report = prescreen_picks(
+        events, iter_event_pairs(os.path.join(args.working_dir, "input_files", "dt.ct")),
+        waveform_index, thresholds={"min_snr": args.min_snr,
+                                    "max_gap_fraction": args.max_gap_fraction,
+                                    "max_clip_fraction": args.max_clip_fraction},
+        quality_file=args.quality_file)
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Write the relocated catalog by streaming hypoDD.reloc.
+
+Building an ObsPy Catalog of every event and serialising it at the end
+needs the whole catalog in memory at once. Here hypoDD.reloc is read
+line by line and joined against the event store of the working
+directory (working_files/events.json, HypoDD id = position) to get the
+event ids:
+
+    quakeml  the input QuakeML is streamed event by event (iterparse);
+             relocated events get a HypoDD origin, which becomes the
+             preferred one, and each event is written as soon as it
+             is complete
+    csv      one row per relocated event
+    geojson  a FeatureCollection of points (lon, lat, -depth in m)
+    parquet  the CSV columns, written in row groups (needs pyarrow)
+
+Only one event (QuakeML) or one row group (Parquet) is in memory at a
+time besides the id join tables.
+
+    python relocated_catalog.py hypodd_working -o relocated.xml
+    python relocated_catalog.py hypodd_working --format csv -o relocated.csv
+"""
+import os
+import re
+import csv
+import json
+import argparse
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+
+from compare_catalogs import RELOC_COLUMNS
+
+WORKING_DIR = "hypodd_working"
+FORMATS = ("quakeml", "csv", "geojson", "parquet")
+KM_PER_DEGREE = 111.19
+
+# CSV/Parquet columns after id, event_id and time
+RELOC_FIELDS = ["lat", "lon", "depth", "ex", "ey", "ez", "mag",
+                "nccp", "nccs", "nctp", "ncts", "rcc", "rct", "cid"]
+INT_FIELDS = {"id", "year", "month", "day", "hour", "minute",
+              "nccp", "nccs", "nctp", "ncts", "cid"}
+
+
+# --- input -----------------------------------------------------------------
+
+def parse_reloc_line(line):
+    """
+    One hypoDD.reloc line as a dict, with the origin time as "time"
+    (ISO string). Blank or overflowed (****) fields become NaN for
+    floats and 0 for integers.
+    """
+    row = {}
+    for name, start, end in RELOC_COLUMNS:
+        text = line[start:end].strip()
+        if "*" in text:
+            text = ""
+        if name in INT_FIELDS:
+            row[name] = int(text) if text else 0
+        else:
+            row[name] = float(text) if text else float("nan")
+    # Seconds can be 60.00 after rounding
+    time = (datetime(row.pop("year"), row.pop("month"), row.pop("day"),
+                     row.pop("hour"), row.pop("minute")) +
+            timedelta(seconds=row.pop("sec")))
+    row["time"] = time.isoformat(timespec="microseconds") + "Z"
+    return row
+
+
+def iter_reloc(filename):
+    """
+    Yield the rows of a hypoDD.reloc file
+    """
+    with open(filename, "r") as f:
+        for line in f:
+            if line.strip():
+                yield parse_reloc_line(line)
+
+
+def iter_events(events_file, chunk_size=1 << 20):
+    """
+    Yield the events of a JSON event list one at a time, without
+    loading the whole file
+    """
+    decoder = json.JSONDecoder()
+    separators = re.compile(r"[\s,]*")
+    with open(events_file, "r") as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{events_file} is not a JSON list")
+        position = 1
+        eof = False
+        while True:
+            position = separators.match(buffer, position).end()
+            if buffer.startswith("]", position):
+                return
+            try:
+                event, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            yield event
+
+
+def event_ids(events_file):
+    """
+    Event ids by HypoDD id (index 0 unused)
+    """
+    return [None] + [event["event_id"] for event in iter_events(events_file)]
+
+
+# --- tabular output -------------------------------------------------------------
+
+def _joined_rows(reloc_file, ids):
+    for row in iter_reloc(reloc_file):
+        row["event_id"] = ids[row["id"]] if 0 < row["id"] < len(ids) else None
+        yield row
+
+
+def write_csv(reloc_file, ids, output):
+    n = 0
+    with open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "event_id", "time"] + RELOC_FIELDS)
+        for row in _joined_rows(reloc_file, ids):
+            writer.writerow([row["id"], row["event_id"], row["time"]] +
+                            [row[k] for k in RELOC_FIELDS])
+            n += 1
+    return n
+
+
+def write_geojson(reloc_file, ids, output):
+    n = 0
+    with open(output, "w") as f:
+        f.write('{"type": "FeatureCollection", "features": [\n')
+        for row in _joined_rows(reloc_file, ids):
+            feature = {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [
+                    row["lon"], row["lat"], round(-row["depth"] * 1000.0, 1)]},
+                # NaN is not valid JSON
+                "properties": {k: None if row[k] != row[k] else row[k]
+                               for k in ["id", "event_id", "time"] + RELOC_FIELDS
+                               if k not in ("lat", "lon")},
+            }
+            f.write((",\n" if n else "") + json.dumps(feature))
+            n += 1
+        f.write("\n]}\n")
+    return n
+
+
+def write_parquet(reloc_file, ids, output, row_group_size=50000):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = ["id", "event_id", "time"] + RELOC_FIELDS
+    schema = pa.schema([(name, pa.int64() if name in INT_FIELDS else
+                         pa.string() if name in ("event_id", "time") else pa.float64())
+                        for name in columns])
+    n = 0
+    batch = {name: [] for name in columns}
+    with pq.ParquetWriter(output, schema) as writer:
+        for row in _joined_rows(reloc_file, ids):
+            for name in columns:
+                batch[name].append(row[name])
+            n += 1
+            if len(batch["id"]) >= row_group_size:
+                writer.write_table(pa.table(batch, schema=schema))
+                batch = {name: [] for name in columns}
+        if batch["id"] or not n:
+            writer.write_table(pa.table(batch, schema=schema))
+    return n
+
+
+# --- QuakeML output --------------------------------------------------------
+
+def _sub(parent, ns, tag, text=None):
+    element = ET.SubElement(parent, f"{{{ns}}}{tag}")
+    if text is not None:
+        element.text = text
+    return element
+
+
+def _quantity(parent, ns, tag, value, uncertainty=None):
+    element = _sub(parent, ns, tag)
+    _sub(element, ns, "value", repr(value) if isinstance(value, float) else str(value))
+    if uncertainty is not None and uncertainty == uncertainty:
+        _sub(element, ns, "uncertainty", repr(uncertainty))
+    return element
+
+
+def relocated_origin(row, ns):
+    """
+    QuakeML origin element of a hypoDD.reloc row. Uncertainties come from
+    the ex/ey/ez columns (m), which hypoDD only fills for SVD runs.
+    """
+    origin = ET.Element(f"{{{ns}}}origin", publicID=f"smi:local/origin/hypodd/{row['id']}")
+    _quantity(origin, ns, "time", row["time"])
+    lat_error = lon_error = depth_error = None
+    if row["ex"] or row["ey"] or row["ez"]:
+        lat_error = round(row["ey"] / 1000.0 / KM_PER_DEGREE, 8)
+        lon_error = round(row["ex"] / 1000.0 / KM_PER_DEGREE, 8)
+        depth_error = row["ez"]
+    _quantity(origin, ns, "latitude", row["lat"], lat_error)
+    _quantity(origin, ns, "longitude", row["lon"], lon_error)
+    _quantity(origin, ns, "depth", round(row["depth"] * 1000.0, 1), depth_error)
+    _sub(origin, ns, "depthType", "from location")
+    _sub(origin, ns, "methodID", "smi:local/hypoDD")
+    quality = _sub(origin, ns, "quality")
+    _sub(quality, ns, "usedPhaseCount",
+         str(row["nccp"] + row["nccs"] + row["nctp"] + row["ncts"]))
+    if row["rct"] == row["rct"] and row["rct"] >= 0:
+        # RMS of the catalog residuals, ms in hypoDD.reloc
+        _sub(quality, ns, "standardError", repr(row["rct"] / 1000.0))
+    _sub(origin, ns, "evaluationMode", "automatic")
+    comment = _sub(origin, ns, "comment")
+    _sub(comment, ns, "text", f"HypoDD cluster id: {row['cid']}")
+    return origin
+
+
+def add_relocated_origin(event, row):
+    """
+    Append the HypoDD origin after the existing origins of an event
+    element and make it the preferred one
+    """
+    ns = event.tag[1:].split("}")[0] if event.tag.startswith("{") else ""
+    origin = relocated_origin(row, ns)
+    children = list(event)
+    position = max((i + 1 for i, child in enumerate(children)
+                    if child.tag == f"{{{ns}}}origin"), default=len(children))
+    event.insert(position, origin)
+    preferred = event.find(f"{{{ns}}}preferredOriginID")
+    if preferred is None:
+        preferred = ET.Element(f"{{{ns}}}preferredOriginID")
+        event.insert(0, preferred)
+    preferred.text = origin.get("publicID")
+
+
+def _start_tag(element, default_ns):
+    ns, _, name = element.tag[1:].partition("}")
+    attributes = "".join(f' {k}="{v}"' for k, v in element.attrib.items()
+                         if not k.startswith("{"))
+    xmlns = f' xmlns="{ns}"' if ns != default_ns else ""
+    return f"<{name}{xmlns}{attributes}>"
+
+
+def _unqualify(element, ns):
+    """
+    Drop the namespace the output root declares as default from the tags
+    """
+    prefix = f"{{{ns}}}"
+    for child in element.iter():
+        if child.tag.startswith(prefix):
+            child.tag = child.tag[len(prefix):]
+
+
+def write_quakeml(input_quakeml, reloc_file, ids, output, only_relocated=False):
+    """
+    Stream input_quakeml to output, adding the HypoDD origin of every
+    relocated event. Returns (events written, events relocated).
+    """
+    by_event = {}
+    with open(reloc_file, "r") as f:
+        for line in f:
+            if line.strip():
+                hypodd_id = int(line[0:9])
+                if 0 < hypodd_id < len(ids):
+                    # Parsed when the event comes by
+                    by_event[ids[hypodd_id]] = line
+
+    n_written = n_relocated = 0
+    root_ns = None
+    parents = []
+    with open(output, "w", encoding="utf-8") as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        for action, element in ET.iterparse(input_quakeml, events=("start", "end")):
+            tag = element.tag.rsplit("}", 1)[-1]
+            if action == "start":
+                if not parents:
+                    root_ns = element.tag[1:].split("}")[0]
+                    out.write(_start_tag(element, None) + "\n")
+                elif tag == "eventParameters":
+                    out.write(_start_tag(element, root_ns) + "\n")
+                parents.append(element)
+                continue
+            parents.pop()
+            if tag != "event" or len(parents) != 2:
+                continue
+            line = by_event.get(element.get("publicID"))
+            if line is not None:
+                add_relocated_origin(element, parse_reloc_line(line))
+                n_relocated += 1
+            if line is not None or not only_relocated:
+                _unqualify(element, root_ns)
+                out.write(ET.tostring(element, encoding="unicode"))
+                out.write("\n")
+                n_written += 1
+            # Nothing of the event is kept once written
+            parents[-1].remove(element)
+        out.write("</eventParameters>\n</quakeml>\n")
+    return n_written, n_relocated
+
+
+def write_relocated_catalog(working_dir=WORKING_DIR, output=None, fmt="quakeml",
+                            input_quakeml="hypoDD_quakeml_fixed.xml", reloc_file=None,
+                            events_file=None, only_relocated=False):
+    """
+    Write the relocations of a working directory in one of FORMATS
+    """
+    reloc_file = reloc_file or os.path.join(working_dir, "hypodd_temp_dir", "hypoDD.reloc")
+    events_file = events_file or os.path.join(working_dir, "working_files", "events.json")
+    output = output or "relocated." + {"quakeml": "xml"}.get(fmt, fmt)
+    ids = event_ids(events_file)
+    if fmt == "quakeml":
+        n_written, n_relocated = write_quakeml(input_quakeml, reloc_file, ids, output,
+                                               only_relocated)
+        print(f"Wrote {n_written} events ({n_relocated} relocated) to {output}")
+        return n_relocated
+    writers = {"csv": write_csv, "geojson": write_geojson, "parquet": write_parquet}
+    n = writers[fmt](reloc_file, ids, output)
+    print(f"Wrote {n} relocated events to {output}")
+    return n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write hypoDD.reloc as QuakeML, CSV, GeoJSON or Parquet")
+    parser.add_argument("working_dir", nargs="?", default=WORKING_DIR)
+    parser.add_argument("-o", "--output")
+    parser.add_argument("--format", choices=FORMATS, default="quakeml")
+    parser.add_argument("--input-quakeml", default="hypoDD_quakeml_fixed.xml",
+                        help="catalog the relocator read (QuakeML output only)")
+    parser.add_argument("--reloc", help="default: <working_dir>/hypodd_temp_dir/hypoDD.reloc")
+    parser.add_argument("--events", help="default: <working_dir>/working_files/events.json")
+    parser.add_argument("--only-relocated", action="store_true",
+                        help="leave events without a relocation out of the QuakeML")
+    args = parser.parse_args(argv)
+    write_relocated_catalog(args.working_dir, args.output, args.format,
+                            args.input_quakeml, args.reloc, args.events,
+                            args.only_relocated)
+
+
+if __name__ == "__main__":
+    main()
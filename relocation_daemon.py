@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+"""
+Near-real-time relocation of new SEISAN events.
+
+Instead of running run_hypodd.py over the whole catalog for every new
+event, the daemon keeps a working directory of its own (same layout as
+the relocator's) and, every poll interval:
+
+    1. reads the event blocks appended to hyp.out (through NordicIndex)
+       and the Nordic files put into a drop directory
+    2. gives the new events the next HypoDD ids and builds the catalog
+       differential times of their pairs only, with the ph2dt.inp rules
+    3. correlates just those pairs (cc_pipeline with event_pairs) and
+       rewrites dt.cc from the result store
+    4. links the events like cluster1.f does (a pair is linked if it has
+       at least OBSCC + OBSCT observations of the data types in use) and
+       relocates only the clusters that contain a new event
+    5. merges the new locations into <live_dir>/hypoDD.reloc; every other
+       cluster keeps its previous solution
+
+New events are held back for --settle seconds so that their waveform
+files can reach the archive first.
+
+    python relocation_daemon.py --base hypodd_working --live hypodd_live \
+        --hyp-file hyp.out --archive WAV/BASE --interval 60
+"""
+import os
+import csv
+import json
+import math
+import time
+import shutil
+import argparse
+from datetime import datetime
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from nordic_index import NordicIndex
+from nordic2quakeml import parse_event_header, parse_pick_line
+from velocity_sweep import data_line_indices, read_reloc, run_variant
+
+KM_PER_DEGREE = 111.19
+# MINWGHT MAXDIST MAXSEP MAXNGH MINLNK MINOBS MAXOBS, as in ph2dt.inp
+DEFAULT_PH2DT = (0.0, 200.0, 10.0, 10, 8, 8, 50)
+STATE_FILE = "daemon_state.json"
+
+
+# --- catalog ----------------------------------------------------------------
+
+def event_from_block(lines, pick_prefix):
+    """
+    events.json dict of one Nordic event block, or None if it has no
+    ID line or no coordinates (the blocks nordic2quakeml skips). Pick ids
+    are <pick_prefix>p<n>, e.g. e12p3 as nordic2quakeml numbers them.
+    """
+    if not lines or not lines[0].strip():
+        return None
+    header = parse_event_header(lines)
+    if not header or header["lat"] is None or header["lon"] is None:
+        return None
+    picks = []
+    for line in lines:
+        pick = parse_pick_line(line, header["origin_time"])
+        if not pick:
+            continue
+        phase = pick["phase"]
+        if phase.upper() == "IP":
+            phase = "P"
+        elif phase.upper() == "ES":
+            phase = "S"
+        picks.append({
+            "id": f"smi:local/{pick_prefix}p{len(picks) + 1}",
+            "pick_time": pick["pick_time_str"],
+            "pick_time_error": None,
+            "station_id": "SI." + pick["station"],
+            "phase": phase,
+        })
+    return {
+        "event_id": f"smi:local/event/{header['public_id']}",
+        "magnitude": header["mag_ml"] or header["mag_md"] or 0.0,
+        "origin_time": header["origin_time"].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        "origin_time_error": 0.0,
+        "origin_latitude": header["lat"],
+        "origin_latitude_error": 0.0,
+        "origin_longitude": header["lon"],
+        "origin_longitude_error": 0.0,
+        "origin_depth": (header["depth"] or 0.0) * 1000.0,
+        "origin_depth_error": 0.0,
+        "picks": picks,
+    }
+
+
+def split_blocks(filename):
+    """
+    Event blocks of a Nordic file, split like nordic2quakeml.main
+    """
+    blocks = []
+    block = []
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip() == "" and block:
+                blocks.append(block)
+                block = []
+            else:
+                block.append(line.rstrip("\r\n"))
+    if block:
+        blocks.append(block)
+    return blocks
+
+
+def _time(value):
+    return datetime.strptime(value.rstrip("Z"), "%Y-%m-%dT%H:%M:%S.%f"
+                             if "." in value else "%Y-%m-%dT%H:%M:%S")
+
+
+def event_sel_line(event_id, event):
+    """
+    One line of event.sel (read list-directed by getdata.f)
+    """
+    t = _time(event["origin_time"])
+    hhmmsscc = (t.hour * 1000000 + t.minute * 10000 + t.second * 100 +
+                int(round(t.microsecond / 10000.0)))
+    return (f"{t:%Y%m%d}  {hhmmsscc:8d}  {event['origin_latitude']:8.4f}  "
+            f"{event['origin_longitude']:9.4f}  {event['origin_depth'] / 1000.0:9.3f}  "
+            f"{event['magnitude'] or 0.0:4.1f}    0.00    0.00   0.00  {event_id:9d}")
+
+
+def read_ph2dt_inp(filename):
+    if not os.path.exists(filename):
+        return DEFAULT_PH2DT
+    with open(filename, "r") as f:
+        for line in f:
+            # The station and phase file names come first
+            v = line.split()
+            if line.startswith("*") or len(v) < 7:
+                continue
+            try:
+                return (float(v[0]), float(v[1]), float(v[2]),
+                        int(v[3]), int(v[4]), int(v[5]), int(v[6]))
+            except ValueError:
+                continue
+    return DEFAULT_PH2DT
+
+
+def read_stations(filename):
+    """
+    {station: (lat, lon)} from station.dat/station.sel
+    """
+    stations = {}
+    with open(filename, "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 3:
+                stations[parts[0]] = (float(parts[1]), float(parts[2]))
+    return stations
+
+
+def _xyz(events, lat0):
+    scale = KM_PER_DEGREE * math.cos(math.radians(lat0))
+    return np.array([[e["origin_longitude"] * scale,
+                      e["origin_latitude"] * KM_PER_DEGREE,
+                      e["origin_depth"] / 1000.0] for e in events])
+
+
+def _arrivals(event, stations, maxdist):
+    """
+    {(station, phase): travel time} of the P and S picks of an event at
+    stations within maxdist km
+    """
+    origin = _time(event["origin_time"])
+    lat, lon = event["origin_latitude"], event["origin_longitude"]
+    arrivals = {}
+    for pick in event["picks"]:
+        if pick["phase"] not in ("P", "S") or pick["station_id"] not in stations:
+            continue
+        s_lat, s_lon = stations[pick["station_id"]]
+        dx = (s_lon - lon) * KM_PER_DEGREE * math.cos(math.radians(lat))
+        dist = math.hypot(dx, (s_lat - lat) * KM_PER_DEGREE)
+        if dist > maxdist:
+            continue
+        key = (pick["station_id"], pick["phase"])
+        if key not in arrivals:
+            tt = (_time(pick["pick_time"]) - origin).total_seconds()
+            arrivals[key] = (dist, tt)
+    return arrivals
+
+
+def catalog_pairs(events, new_ids, stations, ph2dt, known_pairs):
+    """
+    dt.ct blocks {(id_1, id_2): lines} of the new events with their
+    neighbours. As in ph2dt, neighbours are taken nearest first within
+    MAXSEP until MAXNGH of them share MINLNK observations; pairs with
+    at least MINOBS observations are kept, with at most MAXOBS of them
+    from the closest stations.
+    """
+    _, maxdist, maxsep, maxngh, minlnk, minobs, maxobs = ph2dt
+    ids = sorted(events)
+    lat0 = float(np.mean([events[i]["origin_latitude"] for i in ids]))
+    tree = cKDTree(_xyz([events[i] for i in ids], lat0))
+    arrivals = {}
+
+    def arrivals_of(event_id):
+        if event_id not in arrivals:
+            arrivals[event_id] = _arrivals(events[event_id], stations, maxdist)
+        return arrivals[event_id]
+
+    blocks = {}
+    for ev1 in new_ids:
+        point = _xyz([events[ev1]], lat0)[0]
+        candidates = tree.query_ball_point(point, maxsep)
+        distances = np.linalg.norm(tree.data[candidates] - point, axis=1)
+        neighbours = 0
+        for k in np.argsort(distances):
+            ev2 = ids[candidates[k]]
+            if ev2 == ev1 or (ev1, ev2) in known_pairs or (ev2, ev1) in known_pairs:
+                continue
+            a1, a2 = arrivals_of(ev1), arrivals_of(ev2)
+            shared = sorted((a1[key][0], key) for key in a1 if key in a2)[:maxobs]
+            if len(shared) >= minobs:
+                blocks[(ev1, ev2)] = [f"{sta}  {a1[(sta, pha)][1]:.3f} "
+                                      f"{a2[(sta, pha)][1]:.3f} 1.0000 {pha}"
+                                      for _, (sta, pha) in shared]
+                known_pairs.add((ev1, ev2))
+            if len(shared) >= minlnk:
+                neighbours += 1
+                if neighbours >= maxngh:
+                    break
+    return blocks
+
+
+# --- clusters -------------------------------------------------------------------
+
+def count_observations(dt_file):
+    """
+    {(id_1, id_2): number of observations} of a dt.ct or dt.cc file
+    """
+    counts = {}
+    if not os.path.exists(dt_file):
+        return counts
+    pair = None
+    with open(dt_file, "r") as f:
+        for line in f:
+            if line.startswith("#"):
+                ev1, ev2 = line[1:].split()[:2]
+                pair = (int(ev1), int(ev2))
+                counts.setdefault(pair, 0)
+            elif pair and line.strip():
+                counts[pair] += 1
+    return counts
+
+
+def clusters(pair_counts, min_obs):
+    """
+    Connected components of the events linked by pairs with at least
+    min_obs observations (the rule of cluster1.f); {event id: cluster}
+    """
+    parent = {}
+
+    def find(x):
+        root = x
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for (ev1, ev2), n in pair_counts.items():
+        if n >= min_obs:
+            r1, r2 = find(ev1), find(ev2)
+            if r1 != r2:
+                parent[r1] = r2
+    return {ev: find(ev) for ev in parent}
+
+
+def _write_subset(dt_file, output_file, members):
+    with open(dt_file, "r") as f, open(output_file, "w", buffering=1 << 20) as out:
+        keep = False
+        for line in f:
+            if line.startswith("#"):
+                ev1, ev2 = line[1:].split()[:2]
+                keep = int(ev1) in members and int(ev2) in members
+            if keep:
+                out.write(line)
+
+
+# --- daemon -----------------------------------------------------------------------
+
+class RelocationDaemon:
+    """
+    Incremental relocation in its own working directory (live_dir)
+    """
+
+    def __init__(self, live_dir="hypodd_live", base_dir="hypodd_working",
+                 hyp_file=None, drop_dir=None, waveform_dirs=(), archives=(),
+                 cc_params=None, settle=0.0, keep_runs=False):
+        self.live_dir = live_dir
+        self.hyp_file = hyp_file
+        self.drop_dir = drop_dir
+        self.waveform_dirs = list(waveform_dirs)
+        self.archives = list(archives)
+        self.cc_params = cc_params
+        self.settle = settle
+        self.keep_runs = keep_runs
+        self.input_dir = os.path.join(live_dir, "input_files")
+        self.events_file = os.path.join(live_dir, "working_files", "events.json")
+        self.reloc_file = os.path.join(live_dir, "hypoDD.reloc")
+        self._setup(base_dir)
+
+        with open(self.events_file, "r") as f:
+            self.events = {i + 1: ev for i, ev in enumerate(json.load(f))}
+        self.known = {ev["event_id"] for ev in self.events.values()}
+        with open(os.path.join(self.input_dir, "hypoDD.inp"), "r") as f:
+            self.inp_lines = f.read().splitlines()
+        self.ph2dt = read_ph2dt_inp(os.path.join(self.input_dir, "ph2dt.inp"))
+        self.stations = read_stations(os.path.join(self.input_dir, "station.sel"))
+        self.ct_counts = count_observations(os.path.join(self.input_dir, "dt.ct"))
+        self.state = {"hyp_position": 0, "drop_files": [], "cycles": 0}
+        state_file = os.path.join(live_dir, STATE_FILE)
+        if os.path.exists(state_file):
+            with open(state_file, "r") as f:
+                self.state.update(json.load(f))
+        self.first_seen = {}
+
+    def _setup(self, base_dir):
+        """
+        Create the live directory from a finished relocator working
+        directory the first time
+        """
+        if os.path.exists(self.events_file):
+            return
+        os.makedirs(self.input_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(self.events_file), exist_ok=True)
+        os.makedirs(os.path.join(self.live_dir, "bin"), exist_ok=True)
+        shutil.copy2(os.path.join(base_dir, "bin", "hypoDD"),
+                     os.path.join(self.live_dir, "bin", "hypoDD"))
+        for name in ("hypoDD.inp", "ph2dt.inp", "station.sel", "dt.ct", "dt.cc"):
+            source = os.path.join(base_dir, "input_files", name)
+            if name == "station.sel" and not os.path.exists(source):
+                source = os.path.join(base_dir, "input_files", "station.dat")
+            if os.path.exists(source):
+                shutil.copy2(source, os.path.join(self.input_dir, name))
+        base_events = os.path.join(base_dir, "working_files", "events.json")
+        if os.path.exists(base_events):
+            shutil.copy2(base_events, self.events_file)
+        else:
+            with open(self.events_file, "w") as f:
+                json.dump([], f)
+        base_store = os.path.join(base_dir, "working_files", "cc_results.txt")
+        live_store = os.path.join(self.live_dir, "working_files", "cc_results.txt")
+        if os.path.exists(base_store):
+            for suffix in ("", ".ckpt"):
+                if os.path.exists(base_store + suffix):
+                    shutil.copy2(base_store + suffix, live_store + suffix)
+        else:
+            # run_cc_pipeline rewrites dt.cc from the store, so the store
+            # must hold the base pairs too: from the relocator's cc_files,
+            # or else from the base dt.cc
+            from cc_store import CCResultStore, import_cc_files, import_dt_cc
+            cc_dir = os.path.join(base_dir, "working_files", "cc_files")
+            base_dt_cc = os.path.join(base_dir, "input_files", "dt.cc")
+            with CCResultStore(live_store) as store:
+                if os.path.isdir(cc_dir):
+                    import_cc_files(cc_dir, store)
+                elif os.path.exists(base_dt_cc):
+                    import_dt_cc(base_dt_cc, store)
+        base_reloc = os.path.join(base_dir, "hypodd_temp_dir", "hypoDD.reloc")
+        if os.path.exists(base_reloc) and os.path.getsize(base_reloc):
+            shutil.copy2(base_reloc, self.reloc_file)
+
+    def _save(self):
+        tmp = self.events_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump([self.events[i] for i in sorted(self.events)], f)
+        os.replace(tmp, self.events_file)
+        with open(os.path.join(self.live_dir, STATE_FILE), "w") as f:
+            json.dump(self.state, f, indent=2)
+
+    # --- ingest --------------------------------------------------------------
+
+    def _settled(self, key, now):
+        first = self.first_seen.setdefault(key, now)
+        return now - first >= self.settle
+
+    def poll(self):
+        """
+        New events that have settled, as a list of events.json dicts
+        """
+        now = time.time()
+        new = []
+        if self.hyp_file and os.path.exists(self.hyp_file):
+            index = NordicIndex(self.hyp_file)
+            entries = [e for e in index.entries if e[0] >= self.state["hyp_position"]]
+            for position, lines in index.read(entries):
+                event = event_from_block(lines, f"e{position + 1}")
+                if event is None or event["event_id"] in self.known:
+                    self.state["hyp_position"] = position + 1
+                    continue
+                if not self._settled(event["event_id"], now):
+                    break
+                new.append(event)
+                self.known.add(event["event_id"])
+                self.state["hyp_position"] = position + 1
+        if self.drop_dir and os.path.isdir(self.drop_dir):
+            processed = os.path.join(self.drop_dir, "processed")
+            for name in sorted(os.listdir(self.drop_dir)):
+                path = os.path.join(self.drop_dir, name)
+                if not os.path.isfile(path) or name in self.state["drop_files"]:
+                    continue
+                if now - os.path.getmtime(path) < self.settle:
+                    continue
+                for n, block in enumerate(split_blocks(path)):
+                    event = event_from_block(block, f"d{len(self.state['drop_files'])}e{n + 1}")
+                    if event and event["event_id"] not in self.known:
+                        new.append(event)
+                        self.known.add(event["event_id"])
+                os.makedirs(processed, exist_ok=True)
+                shutil.move(path, os.path.join(processed, name))
+                self.state["drop_files"].append(name)
+        return new
+
+    def _waveform_index(self):
+        from waveform_index import WaveformIndex
+        index = WaveformIndex()
+        for directory in self.waveform_dirs:
+            index.add_directory(directory)
+        for archive in self.archives:
+            index.add_archive(archive)
+        return index
+
+    # --- one cycle -------------------------------------------------------------
+
+    def _inp_value(self, data_line):
+        return self.inp_lines[data_line_indices(self.inp_lines)[data_line]].split()
+
+    def link_threshold(self):
+        """
+        (data types counted, minimum observations) as cluster1.f uses them
+        """
+        idata = int(self._inp_value(9)[0])
+        obscc, obsct = (int(v) for v in self._inp_value(10)[:2])
+        use_cc, use_ct = idata in (1, 3), idata in (2, 3)
+        return use_cc, use_ct, (obscc if use_cc else 0) + (obsct if use_ct else 0)
+
+    def relocate_clusters(self, members, tag):
+        """
+        Relocate the given events on their own and merge the result into
+        the live hypoDD.reloc
+        """
+        run_dir = os.path.join(self.live_dir, "runs", tag)
+        os.makedirs(run_dir, exist_ok=True)
+        data = data_line_indices(self.inp_lines)
+        lines = list(self.inp_lines)
+        # CID and the optional event id line follow the velocity model:
+        # relocate all clusters of the subset, no id list
+        cid = 15 + int(lines[data[11]].split()[2])
+        lines[data[cid]] = "0"
+        if len(data) > cid + 1:
+            lines[data[cid + 1]] = ""
+        with open(os.path.join(run_dir, "hypoDD.inp"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        names = [lines[i].strip() for i in data[:4]]
+        for source, name in (("dt.cc", names[0]), ("dt.ct", names[1])):
+            path = os.path.join(self.input_dir, source)
+            if os.path.exists(path):
+                _write_subset(path, os.path.join(run_dir, name), members)
+            else:
+                open(os.path.join(run_dir, name), "w").close()
+        with open(os.path.join(run_dir, names[2]), "w") as f:
+            for ev in sorted(members):
+                f.write(event_sel_line(ev, self.events[ev]) + "\n")
+        shutil.copy2(os.path.join(self.input_dir, "station.sel"),
+                     os.path.join(run_dir, names[3]))
+
+        returncode, seconds = run_variant(run_dir, os.path.join(self.live_dir, "bin", "hypoDD"))
+        relocated = read_reloc(os.path.join(run_dir, "hypoDD.reloc"))
+        with open(os.path.join(run_dir, "hypoDD.reloc"), "r") as f:
+            new_lines = {int(line.split()[0]): line for line in f if line.strip()}
+        # Events of the re-solved clusters that hypoDD dropped lose their
+        # old location too; everything else stays frozen
+        old_lines = {}
+        if os.path.exists(self.reloc_file):
+            with open(self.reloc_file, "r") as f:
+                old_lines = {int(line.split()[0]): line for line in f if line.strip()}
+        merged = {ev: line for ev, line in old_lines.items() if ev not in members}
+        merged.update(new_lines)
+        tmp = self.reloc_file + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(merged[ev] for ev in sorted(merged))
+        os.replace(tmp, self.reloc_file)
+        if not self.keep_runs:
+            shutil.rmtree(run_dir, ignore_errors=True)
+        return returncode, seconds, relocated
+
+    def cycle(self):
+        """
+        Ingest, correlate and relocate once; returns a summary dict or
+        None if nothing new arrived
+        """
+        t0 = time.perf_counter()
+        new_events = self.poll()
+        dirty = set()
+        if not os.path.exists(self.reloc_file) and self.events:
+            # No previous solution: the first cycle relocates everything
+            dirty = set(self.events)
+        if not new_events and not dirty:
+            self._save()
+            return None
+
+        new_ids = []
+        for event in new_events:
+            event_id = len(self.events) + 1
+            self.events[event_id] = event
+            new_ids.append(event_id)
+        self._save()
+
+        blocks = catalog_pairs(self.events, new_ids, self.stations,
+                               self.ph2dt, set(self.ct_counts)) if new_ids else {}
+        with open(os.path.join(self.input_dir, "dt.ct"), "a") as f:
+            for (ev1, ev2), lines in blocks.items():
+                f.write(f"# {ev1:9d} {ev2:9d}\n" + "\n".join(lines) + "\n")
+                self.ct_counts[(ev1, ev2)] = len(lines)
+        t_pairs = time.perf_counter()
+
+        if blocks and (self.waveform_dirs or self.archives):
+            from cc_pipeline import run_cc_pipeline
+            run_cc_pipeline(self.live_dir, self._waveform_index(), self.cc_params,
+                            event_pairs=list(blocks))
+        t_cc = time.perf_counter()
+
+        use_cc, use_ct, min_obs = self.link_threshold()
+        counts = {}
+        if use_cc:
+            counts = count_observations(os.path.join(self.input_dir, "dt.cc"))
+        if use_ct:
+            for pair, n in self.ct_counts.items():
+                counts[pair] = counts.get(pair, 0) + n
+        cluster_of = clusters(counts, min_obs)
+        touched = {cluster_of[ev] for ev in set(new_ids) | dirty if ev in cluster_of}
+        members = {ev for ev, c in cluster_of.items() if c in touched}
+
+        self.state["cycles"] += 1
+        summary = {"new_events": len(new_ids), "new_pairs": len(blocks),
+                   "clusters": len(touched), "cluster_events": len(members),
+                   "relocated": 0, "status": "no cluster"}
+        if members:
+            returncode, _, relocated = self.relocate_clusters(
+                members, f"cycle_{self.state['cycles']:05d}")
+            summary["relocated"] = len(relocated)
+            summary["status"] = "ok" if relocated else f"failed (exit {returncode})"
+        self._save()
+        t_end = time.perf_counter()
+        summary.update({"pair_seconds": round(t_pairs - t0, 2),
+                        "cc_seconds": round(t_cc - t_pairs, 2),
+                        "relocation_seconds": round(t_end - t_cc, 2),
+                        "latency_seconds": round(t_end - t0, 2)})
+        with open(os.path.join(self.live_dir, "daemon_log.csv"), "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["time"] + list(summary))
+            if f.tell() == 0:
+                writer.writeheader()
+            writer.writerow(dict(time=datetime.now().isoformat(timespec="seconds"),
+                                 **summary))
+        return summary
+
+    def run(self, interval=60.0, once=False):
+        while True:
+            summary = self.cycle()
+            if summary:
+                print(f"{summary['new_events']} new events, {summary['new_pairs']} pairs, "
+                      f"{summary['clusters']} clusters ({summary['cluster_events']} events) "
+                      f"re-solved: {summary['status']}, {summary['relocated']} relocated "
+                      f"in {summary['latency_seconds']:.1f} s")
+            if once:
+                return summary
+            time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Relocate new SEISAN events cluster by cluster as they arrive")
+    parser.add_argument("--live", default="hypodd_live", help="daemon working directory")
+    parser.add_argument("--base", default="hypodd_working",
+                        help="finished relocator working directory to start from")
+    parser.add_argument("--hyp-file", help="Nordic file to follow, e.g. hyp.out")
+    parser.add_argument("--drop-dir", help="directory receiving new Nordic files")
+    parser.add_argument("--waveforms", nargs="*", default=[], help="flat waveform directories")
+    parser.add_argument("--archive", nargs="*", default=[], help="WAV/<BASE> archive roots")
+    parser.add_argument("--settle", type=float, default=300.0,
+                        help="seconds to wait for the waveforms of a new event")
+    parser.add_argument("--interval", type=float, default=60.0, help="poll interval in seconds")
+    parser.add_argument("--once", action="store_true", help="run a single cycle and exit")
+    parser.add_argument("--keep-runs", action="store_true", help="keep the cluster run directories")
+    args = parser.parse_args(argv)
+
+    daemon = RelocationDaemon(args.live, args.base, args.hyp_file, args.drop_dir,
+                              args.waveforms, args.archive, settle=args.settle,
+                              keep_runs=args.keep_runs)
+    daemon.run(args.interval, args.once)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Bootstrap and jackknife uncertainty ensembles for HypoDD relocations.
+
+HypoDD's LSQR errors are not reliable and SVD only fits small clusters
+(MAXEVE0 in hypoDD.inc). Here the uncertainties come from relocating
+many perturbed copies of the differential times instead:
+
+    bootstrap      resample the observations of every event pair with
+                   replacement
+    residual       dt* = dt - res + res*, with res the final residual of
+                   an unperturbed run (hypoDD.res) and res* drawn from the
+                   residuals of the same data type
+    jackknife      one member per station, each without that station
+    drop-stations  every member without a random share of the stations
+
+The members run in a process pool, each in its own directory under
+<working_dir>/ensemble/, and are folded into per-event running means
+and covariances as soon as they finish, so nothing but the statistics is
+kept in memory. The result is a CSV with the mean location, standard
+deviations and 95 % confidence ellipsoid axes of every event.
+
+Works on a working directory after one relocator run (input_files with
+dt.ct, dt.cc, event.sel, station.sel and hypoDD.inp, and bin/hypoDD).
+"""
+import os
+import csv
+import math
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from velocity_sweep import data_line_indices, input_file_names, read_reloc, run_variant
+
+WORKING_DIR = "hypodd_working"
+KM_PER_DEGREE = 111.19
+METHODS = ("bootstrap", "residual", "jackknife", "drop-stations")
+# Square root of the 95 % quantile of chi-square with 3 degrees of freedom
+CHI2_3_95 = math.sqrt(7.814728)
+# hypoDD.res data types
+CC_P, CC_S, CT_P, CT_S = 1, 2, 3, 4
+
+
+# --- differential time files -------------------------------------------------
+
+def read_dt_blocks(filename):
+    """
+    [(header line, [observation lines])] of a dt.ct or dt.cc file
+    """
+    blocks = []
+    if not os.path.exists(filename):
+        return blocks
+    with open(filename, "r") as f:
+        for line in f:
+            if line.startswith("#"):
+                blocks.append((line.rstrip("\n"), []))
+            elif line.strip() and blocks:
+                blocks[-1][1].append(line.rstrip("\n"))
+    return blocks
+
+
+def write_dt_blocks(blocks, filename):
+    with open(filename, "w", buffering=1 << 20) as f:
+        for header, lines in blocks:
+            f.write(header + "\n")
+            if lines:
+                f.write("\n".join(lines) + "\n")
+
+
+def _pair(header):
+    parts = header[1:].split()
+    return int(parts[0]), int(parts[1])
+
+
+def resample_pairs(blocks, rng):
+    """
+    Bootstrap: the observations of every pair drawn with replacement
+    """
+    resampled = []
+    for header, lines in blocks:
+        if lines:
+            lines = [lines[i] for i in rng.integers(0, len(lines), len(lines))]
+        resampled.append((header, lines))
+    return resampled
+
+
+def drop_stations(blocks, stations):
+    stations = set(stations)
+    return [(header, [l for l in lines if l.split()[0] not in stations])
+            for header, lines in blocks]
+
+
+def read_residuals(filename):
+    """
+    {(station, ev1, ev2, data type): residual in s} from hypoDD.res
+    """
+    residuals = {}
+    with open(filename, "r") as f:
+        next(f, None)
+        for line in f:
+            parts = line.split()
+            if len(parts) < 7:
+                continue
+            residuals[(parts[0], int(parts[2]), int(parts[3]), int(parts[4]))] = \
+                float(parts[6]) / 1000.0
+    return residuals
+
+
+def resample_residuals(blocks, residuals, pools, kind, rng):
+    """
+    Residual bootstrap of a dt.ct (kind "ct") or dt.cc (kind "cc") file.
+    Observations without a final residual (e.g. removed as outliers) are
+    kept as they are.
+    """
+    resampled = []
+    for header, lines in blocks:
+        ev1, ev2 = _pair(header)
+        new_lines = []
+        for line in lines:
+            parts = line.split()
+            phase = parts[-1]
+            if kind == "ct":
+                data_type = CT_P if phase == "P" else CT_S
+            else:
+                data_type = CC_P if phase == "P" else CC_S
+            res = residuals.get((parts[0], ev1, ev2, data_type))
+            pool = pools.get(data_type)
+            if res is None or pool is None or len(pool) == 0:
+                new_lines.append(line)
+                continue
+            delta = pool[rng.integers(0, len(pool))] - res
+            if kind == "ct":
+                # STA TT1 TT2 WGHT PHA; dt = TT1 - TT2
+                new_lines.append(f"{parts[0]} {float(parts[1]) + delta:.4f} "
+                                 f"{parts[2]} {parts[3]} {phase}")
+            else:
+                # STA DT WGHT PHA
+                new_lines.append(f"{parts[0]} {float(parts[1]) + delta:.6f} "
+                                 f"{parts[2]} {phase}")
+        resampled.append((header, new_lines))
+    return resampled
+
+
+def stations_of(blocks):
+    return sorted({line.split()[0] for _, lines in blocks for line in lines})
+
+
+# --- members (run in worker processes) ------------------------------------------
+
+_base = {}
+
+
+def _init_worker(working_dir, residual_file):
+    input_dir = os.path.join(working_dir, "input_files")
+    with open(os.path.join(input_dir, "hypoDD.inp"), "r") as f:
+        _base["inp"] = f.read()
+    names = input_file_names(_base["inp"].splitlines())
+    _base["names"] = names
+    _base["cc"] = read_dt_blocks(os.path.join(input_dir, names[0]))
+    _base["ct"] = read_dt_blocks(os.path.join(input_dir, names[1]))
+    _base["working_dir"] = working_dir
+    if residual_file:
+        residuals = read_residuals(residual_file)
+        _base["residuals"] = residuals
+        pools = {}
+        for (_, _, _, data_type), res in residuals.items():
+            pools.setdefault(data_type, []).append(res)
+        _base["pools"] = {k: np.array(v) for k, v in pools.items()}
+
+
+def _run_member(member, method, seed, drop_fraction, keep):
+    """
+    Write one perturbed input set, relocate it and return
+    (member, status, locations)
+    """
+    rng = np.random.default_rng([seed, member])
+    cc, ct = _base["cc"], _base["ct"]
+    if method == "bootstrap":
+        cc, ct = resample_pairs(cc, rng), resample_pairs(ct, rng)
+    elif method == "residual":
+        cc = resample_residuals(cc, _base["residuals"], _base["pools"], "cc", rng)
+        ct = resample_residuals(ct, _base["residuals"], _base["pools"], "ct", rng)
+    elif method == "jackknife":
+        station = stations_of(ct + cc)[member]
+        cc, ct = drop_stations(cc, [station]), drop_stations(ct, [station])
+    elif method == "drop-stations":
+        stations = stations_of(ct + cc)
+        n_drop = max(1, int(round(drop_fraction * len(stations))))
+        dropped = rng.choice(stations, n_drop, replace=False)
+        cc, ct = drop_stations(cc, dropped), drop_stations(ct, dropped)
+
+    working_dir = _base["working_dir"]
+    run_dir = os.path.join(working_dir, "ensemble", f"member_{member:04d}")
+    os.makedirs(run_dir, exist_ok=True)
+    names = _base["names"]
+    write_dt_blocks(cc, os.path.join(run_dir, names[0]))
+    write_dt_blocks(ct, os.path.join(run_dir, names[1]))
+    for name in names[2:4]:
+        shutil.copyfile(os.path.join(working_dir, "input_files", name),
+                        os.path.join(run_dir, name))
+    with open(os.path.join(run_dir, "hypoDD.inp"), "w") as f:
+        f.write(_base["inp"])
+    returncode, _ = run_variant(run_dir, os.path.join(working_dir, "bin", "hypoDD"))
+    locations = read_reloc(os.path.join(run_dir, "hypoDD.reloc"))
+    if not keep:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    status = "ok" if returncode == 0 and locations else "failed"
+    return member, status, locations
+
+
+# --- streaming statistics ---------------------------------------------------------
+
+class EnsembleStatistics:
+    """
+    Running mean and covariance (Welford) of every event's location in
+    local east/north/depth km
+    """
+
+    def __init__(self, reference=None):
+        # event id -> (lat0, lon0) of the local frame
+        self.reference = dict(reference or {})
+        self.count = {}
+        self.mean = {}
+        self.m2 = {}
+
+    def _local(self, event_id, lat, lon, depth):
+        lat0, lon0 = self.reference.setdefault(event_id, (lat, lon))
+        east = (lon - lon0) * KM_PER_DEGREE * math.cos(math.radians(lat0))
+        north = (lat - lat0) * KM_PER_DEGREE
+        return np.array([east, north, depth])
+
+    def add(self, locations):
+        for event_id, (lat, lon, depth) in ((ev, loc[:3]) for ev, loc in locations.items()):
+            x = self._local(event_id, lat, lon, depth)
+            n = self.count.get(event_id, 0) + 1
+            self.count[event_id] = n
+            if n == 1:
+                self.mean[event_id] = x
+                self.m2[event_id] = np.zeros((3, 3))
+                continue
+            delta = x - self.mean[event_id]
+            self.mean[event_id] = self.mean[event_id] + delta / n
+            self.m2[event_id] += np.outer(delta, x - self.mean[event_id])
+
+    def covariance(self, event_id, jackknife=False):
+        n = self.count[event_id]
+        if n < 2:
+            return None
+        cov = self.m2[event_id] / (n - 1)
+        if jackknife:
+            # Jackknife variance is (n-1)/n times the sum of squares
+            cov = cov * (n - 1) ** 2 / n
+        return cov
+
+    def rows(self, jackknife=False):
+        for event_id in sorted(self.count):
+            lat0, lon0 = self.reference[event_id]
+            east, north, depth = self.mean[event_id]
+            row = {
+                "event_id": event_id, "members": self.count[event_id],
+                "lat": lat0 + north / KM_PER_DEGREE,
+                "lon": lon0 + east / (KM_PER_DEGREE * math.cos(math.radians(lat0))),
+                "depth": depth,
+            }
+            cov = self.covariance(event_id, jackknife)
+            if cov is not None:
+                values, vectors = np.linalg.eigh(cov)
+                values = np.clip(values, 0.0, None)
+                major = vectors[:, 2] * (1 if vectors[2, 2] >= 0 else -1)
+                row.update({
+                    "sd_east_km": math.sqrt(cov[0, 0]),
+                    "sd_north_km": math.sqrt(cov[1, 1]),
+                    "sd_depth_km": math.sqrt(cov[2, 2]),
+                    # 95 % ellipsoid semi-axes, largest first, and the
+                    # direction of the largest one
+                    "axis1_km": CHI2_3_95 * math.sqrt(values[2]),
+                    "axis2_km": CHI2_3_95 * math.sqrt(values[1]),
+                    "axis3_km": CHI2_3_95 * math.sqrt(values[0]),
+                    "axis1_azimuth": math.degrees(math.atan2(major[0], major[1])) % 360.0,
+                    "axis1_plunge": math.degrees(math.asin(min(1.0, abs(major[2])))),
+                })
+            yield row
+
+
+# --- driver ---------------------------------------------------------------------
+
+def _run_base(working_dir):
+    """
+    Unperturbed run; gives the residuals and the reference locations
+    """
+    run_dir = os.path.join(working_dir, "ensemble", "base")
+    os.makedirs(run_dir, exist_ok=True)
+    input_dir = os.path.join(working_dir, "input_files")
+    with open(os.path.join(input_dir, "hypoDD.inp"), "r") as f:
+        inp = f.read()
+    for name in input_file_names(inp.splitlines()):
+        shutil.copyfile(os.path.join(input_dir, name), os.path.join(run_dir, name))
+    with open(os.path.join(run_dir, "hypoDD.inp"), "w") as f:
+        f.write(inp)
+    run_variant(run_dir, os.path.join(working_dir, "bin", "hypoDD"))
+    lines = inp.splitlines()
+    # The eighth file name of hypoDD.inp is the residual output
+    res_name = lines[data_line_indices(lines)[7]].strip()
+    res_file = os.path.join(run_dir, res_name) if res_name else ""
+    return read_reloc(os.path.join(run_dir, "hypoDD.reloc")), res_file
+
+
+def run_ensemble(working_dir=WORKING_DIR, members=50, method="bootstrap",
+                 processes=None, seed=0, drop_fraction=0.1, keep=False,
+                 output_file=None):
+    """
+    Relocate an ensemble of perturbed input sets and return the
+    per-event statistics rows
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}")
+    base_locations, res_file = _run_base(working_dir)
+    if method == "residual" and not os.path.exists(res_file):
+        raise RuntimeError("The unperturbed run wrote no hypoDD.res; check that "
+                           "hypoDD.inp names a residual file")
+    if method == "jackknife":
+        input_dir = os.path.join(working_dir, "input_files")
+        with open(os.path.join(input_dir, "hypoDD.inp"), "r") as f:
+            names = input_file_names(f.read().splitlines())
+        members = len(stations_of(read_dt_blocks(os.path.join(input_dir, names[0])) +
+                                  read_dt_blocks(os.path.join(input_dir, names[1]))))
+
+    stats = EnsembleStatistics({ev: loc[:2] for ev, loc in base_locations.items()})
+    failed = 0
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count(),
+                             initializer=_init_worker,
+                             initargs=(working_dir,
+                                       res_file if method == "residual" else None)) as executor:
+        futures = [executor.submit(_run_member, m, method, seed, drop_fraction, keep)
+                   for m in range(members)]
+        for done, future in enumerate(as_completed(futures), 1):
+            member, status, locations = future.result()
+            if status == "ok":
+                stats.add(locations)
+            else:
+                failed += 1
+            print(f"Member {member} {status} ({done}/{members}, "
+                  f"{len(locations)} events)")
+
+    rows = list(stats.rows(jackknife=(method == "jackknife")))
+    print(f"{method}: {members - failed} of {members} members relocated, "
+          f"{len(rows)} events with statistics")
+    if output_file:
+        fields = ["event_id", "members", "lat", "lon", "depth", "sd_east_km",
+                  "sd_north_km", "sd_depth_km", "axis1_km", "axis2_km", "axis3_km",
+                  "axis1_azimuth", "axis1_plunge"]
+        with open(output_file, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Relocation uncertainties from bootstrap/jackknife ensembles")
+    parser.add_argument("--working-dir", default=WORKING_DIR)
+    parser.add_argument("--method", choices=METHODS, default="bootstrap")
+    parser.add_argument("--members", type=int, default=50,
+                        help="ensemble size (jackknife: one per station)")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--drop-fraction", type=float, default=0.1,
+                        help="share of stations removed per drop-stations member")
+    parser.add_argument("--keep", action="store_true", help="keep member directories")
+    parser.add_argument("--output", default="relocation_ensemble.csv")
+    args = parser.parse_args(argv)
+    run_ensemble(args.working_dir, args.members, args.method, args.processes,
+                 args.seed, args.drop_fraction, args.keep, args.output)
+
+
+if __name__ == "__main__":
+    main()
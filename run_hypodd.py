@@ -1,6 +1,7 @@
 import os
 import sys
 from setup_velocity_model import setup_hypodd_velocity_model
+from waveform_index import WaveformIndex, read_quakeml_pick_times
 import os, logging, logging.handlers, pathlib
 import builtins
 import warnings
@@ -72,12 +73,23 @@ def main():
     relocator.add_station_files("stations.xml")
     
     # Add waveform files (mseed)
+    # Only pass on files whose SEISAN start time puts them near a pick,
+    # so the relocator does not scan every header in the archive.
     print("Adding waveform files...")
-    waveform_files = []
-    if os.path.exists("waveforms"):
-        for file in os.listdir("waveforms"):
-            waveform_files.append(os.path.join("waveforms", file))
-    
+    waveform_index = WaveformIndex()
+    if os.path.exists("waveform_manifest.json"):
+        # Written by copy_mseed_files.py when staging the archive
+        waveform_index.add_manifest("waveform_manifest.json")
+    elif os.path.exists("waveforms"):
+        waveform_index.add_directory("waveforms")
+    pick_times = read_quakeml_pick_times("hypoDD_quakeml_fixed.xml")
+    waveform_files = waveform_index.files_for_picks(
+        pick_times, time_before=2.0, time_after=2.0)
+    # Files that do not follow the SEISAN naming are passed on unfiltered
+    waveform_files += waveform_index.unparsed_files
+    print(f"Waveform files near picks: {len(waveform_files)} of "
+          f"{len(waveform_index) + len(waveform_index.unparsed_files)}")
+
     if waveform_files:
         relocator.add_waveform_files(waveform_files)
         print("Number of waveform files:", len(relocator.waveform_files))
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Event-station geometry of a relocator working directory, computed once.
+
+For every event of working_files/events.json and every station of the
+StationXML files (seisan2stationxml.py output) three (events x stations)
+float32 matrices are computed with numpy in blocks of events:
+
+    distance_km  great-circle epicentral distance
+    azimuth      from the event to the station, degrees from north
+    vertical_km  event depth below the station, with the station
+                 elevations shifted like shift_stations=True does (the
+                 lowest station at 0) unless shift_stations is False
+
+The matrices are cached in working_files/station_geometry.npz, stamped
+with the size and mtime of events.json and of the station files, so the
+stages after it (the MAXDIST pick filter here, run_cc_pipeline with
+maxdist) look distances up instead of recomputing them pick by pick.
+
+    python station_geometry.py hypodd_working stations.xml --maxdist 200
+
+reports the picks beyond MAXDIST or at stations without coordinates;
+with --apply they are removed from events.json, before the relocator
+writes phase.dat and ph2dt reads it.
+"""
+import os
+import json
+import argparse
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from relocated_catalog import iter_events
+
+CACHE_FILE = "station_geometry.npz"
+GEOMETRY_VERSION = 1
+EARTH_RADIUS_KM = 6371.0
+
+
+def read_station_coordinates(station_files):
+    """
+    {"NET.STA": (latitude, longitude, elevation in m)} of StationXML
+    files, read with iterparse
+    """
+    stations = {}
+    for filename in station_files:
+        network = None
+        for event, elem in ET.iterparse(filename, events=("start", "end")):
+            tag = elem.tag.rsplit("}", 1)[-1]
+            if event == "start":
+                if tag == "Network":
+                    network = elem.get("code")
+                continue
+            if tag == "Station":
+                values = {child.tag.rsplit("}", 1)[-1]: child.text for child in elem}
+                stations[f"{network}.{elem.get('code')}"] = (
+                    float(values["Latitude"]), float(values["Longitude"]),
+                    float(values.get("Elevation") or 0.0))
+                elem.clear()
+    return stations
+
+
+def geometry_matrix(lat, lon, depth_km, s_lat, s_lon, s_elev_km, datum_km=0.0):
+    """
+    (distance_km, azimuth, vertical_km) of events x stations as float32
+    """
+    lat1 = np.radians(np.asarray(lat, dtype=np.float64))[:, None]
+    lon1 = np.radians(np.asarray(lon, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(s_lat, dtype=np.float64))[None, :]
+    dlon = np.radians(np.asarray(s_lon, dtype=np.float64))[None, :] - lon1
+    # Haversine, stable for short distances
+    h = (np.sin((lat2 - lat1) / 2.0) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2.0) ** 2)
+    distance = 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+    azimuth = np.degrees(np.arctan2(
+        np.sin(dlon) * np.cos(lat2),
+        np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon))) % 360.0
+    vertical = (np.asarray(depth_km, dtype=np.float64)[:, None] +
+                np.asarray(s_elev_km, dtype=np.float64)[None, :] - datum_km)
+    return (distance.astype(np.float32), azimuth.astype(np.float32),
+            vertical.astype(np.float32))
+
+
+class StationGeometry:
+    """
+    Event-station geometry matrices; rows are the events in events.json
+    order (HypoDD id - 1), columns the stations in self.stations
+    """
+
+    def __init__(self, stations, distance_km, azimuth, vertical_km):
+        self.stations = list(stations)
+        self.columns = {station: i for i, station in enumerate(self.stations)}
+        self.distance_km = distance_km
+        self.azimuth = azimuth
+        self.vertical_km = vertical_km
+
+    @classmethod
+    def compute(cls, events, coordinates, shift_stations=True, block_size=10000):
+        """
+        Geometry of an iterable of events.json events and
+        read_station_coordinates output
+        """
+        stations = sorted(coordinates)
+        s_lat, s_lon, s_elev = (np.array([coordinates[s][k] for s in stations])
+                                for k in range(3))
+        s_elev_km = s_elev / 1000.0
+        datum_km = float(s_elev_km.min()) if shift_stations and len(stations) else 0.0
+        origins = np.array([(e["origin_latitude"], e["origin_longitude"],
+                             (e["origin_depth"] or 0.0) / 1000.0) for e in events],
+                           dtype=np.float64).reshape(-1, 3)
+        shape = (len(origins), len(stations))
+        distance = np.empty(shape, dtype=np.float32)
+        azimuth = np.empty(shape, dtype=np.float32)
+        vertical = np.empty(shape, dtype=np.float32)
+        for i in range(0, len(origins), block_size):
+            block = origins[i:i + block_size]
+            (distance[i:i + block_size], azimuth[i:i + block_size],
+             vertical[i:i + block_size]) = geometry_matrix(
+                block[:, 0], block[:, 1], block[:, 2], s_lat, s_lon, s_elev_km, datum_km)
+        return cls(stations, distance, azimuth, vertical)
+
+    def __len__(self):
+        return len(self.distance_km)
+
+    def hypocentral_km(self):
+        return np.hypot(self.distance_km, self.vertical_km)
+
+    def lookup(self, event_index, station_id):
+        """
+        (distance_km, azimuth, vertical_km) of one event and station, or
+        None for a station without coordinates
+        """
+        j = self.columns.get(station_id)
+        if j is None:
+            return None
+        return (float(self.distance_km[event_index, j]),
+                float(self.azimuth[event_index, j]),
+                float(self.vertical_km[event_index, j]))
+
+    def save(self, filename, stamp):
+        tmp = filename + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, stamp=np.array(json.dumps(stamp)),
+                     stations=np.array(self.stations, dtype=str),
+                     distance_km=self.distance_km, azimuth=self.azimuth,
+                     vertical_km=self.vertical_km)
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename, stamp):
+        """
+        The cached geometry, or None if it is missing or stale
+        """
+        if not os.path.exists(filename):
+            return None
+        with np.load(filename, allow_pickle=False) as data:
+            if json.loads(str(data["stamp"])) != stamp:
+                return None
+            return cls(data["stations"].tolist(), data["distance_km"],
+                       data["azimuth"], data["vertical_km"])
+
+
+def _stamp(events_file, station_files, shift_stations):
+    def file_stamp(filename):
+        stat = os.stat(filename)
+        return [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns]
+
+    return {"version": GEOMETRY_VERSION, "shift_stations": shift_stations,
+            "events": file_stamp(events_file)[1:],
+            "stations": [file_stamp(f) for f in station_files]}
+
+
+def load_geometry(working_dir, station_files, shift_stations=True):
+    """
+    Geometry of the events of a working directory, from the cache if it
+    is up to date, otherwise computed and cached
+    """
+    if isinstance(station_files, str):
+        station_files = [station_files]
+    events_file = os.path.join(working_dir, "working_files", "events.json")
+    cache_file = os.path.join(working_dir, "working_files", CACHE_FILE)
+    stamp = _stamp(events_file, station_files, shift_stations)
+    geometry = StationGeometry.load(cache_file, stamp)
+    if geometry is None:
+        geometry = StationGeometry.compute(iter_events(events_file),
+                                           read_station_coordinates(station_files),
+                                           shift_stations)
+        geometry.save(cache_file, stamp)
+    return geometry
+
+
+def out_of_range_picks(events, geometry, maxdist):
+    """
+    (pick ids, report) of the picks of events (in events.json order)
+    beyond maxdist km or at stations without coordinates
+    """
+    rejected = set()
+    report = {"picks": 0, "beyond_maxdist": 0, "unknown_station": 0}
+    for i, event in enumerate(events):
+        distances = geometry.distance_km[i]
+        for pick in event["picks"]:
+            report["picks"] += 1
+            j = geometry.columns.get(pick["station_id"])
+            if j is None:
+                report["unknown_station"] += 1
+            elif distances[j] > maxdist:
+                report["beyond_maxdist"] += 1
+            else:
+                continue
+            rejected.add(pick["id"])
+    return rejected, report
+
+
+def drop_picks(working_dir, rejected, station_files, shift_stations=True):
+    """
+    Rewrite events.json without the rejected picks. Event positions are
+    unchanged, so the geometry is re-stamped rather than recomputed.
+    """
+    from pick_prescreen import apply_prescreen
+
+    events_file = os.path.join(working_dir, "working_files", "events.json")
+    geometry = load_geometry(working_dir, station_files, shift_stations)
+    with open(events_file, "r") as f:
+        events = apply_prescreen(json.load(f), rejected)
+    tmp = events_file + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(events, f)
+    os.replace(tmp, events_file)
+    geometry.save(os.path.join(working_dir, "working_files", CACHE_FILE),
+                  _stamp(events_file, station_files, shift_stations))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Event-station geometry and the MAXDIST pick filter")
+    parser.add_argument("working_dir", nargs="?", default="hypodd_working")
+    parser.add_argument("station_files", nargs="*", default=["stations.xml"])
+    parser.add_argument("--maxdist", type=float, default=200.0,
+                        help="MAXDIST of ph2dt.inp in km")
+    parser.add_argument("--no-shift-stations", dest="shift_stations",
+                        action="store_false")
+    parser.add_argument("--apply", action="store_true",
+                        help="remove the out-of-range picks from events.json")
+    args = parser.parse_args(argv)
+
+    geometry = load_geometry(args.working_dir, args.station_files, args.shift_stations)
+    print(f"Geometry of {len(geometry)} events x {len(geometry.stations)} stations "
+          f"in {os.path.join(args.working_dir, 'working_files', CACHE_FILE)}")
+    events_file = os.path.join(args.working_dir, "working_files", "events.json")
+    rejected, report = out_of_range_picks(iter_events(events_file), geometry, args.maxdist)
+    print(f"{report['picks']} picks: {report['beyond_maxdist']} beyond "
+          f"{args.maxdist:g} km, {report['unknown_station']} at stations "
+          f"without coordinates")
+    if args.apply and rejected:
+        drop_picks(args.working_dir, rejected, args.station_files, args.shift_stations)
+        print(f"Removed {len(rejected)} picks from {events_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Relocate with several velocity models or weighting schemes from one set
+of differential times.
+
+Reading events, ph2dt and cross-correlation do not depend on the velocity
+model, so after one normal run (run_hypodd.py) the sweep reuses the
+input_files of the working directory. Every variant gets its own
+directory under <working_dir>/sweep/<name>/ with links to dt.cc, dt.ct,
+event.sel and station.sel and its own hypoDD.inp, which is the base one
+with the model and/or the iteration weighting lines replaced. The hypoDD
+runs are started in parallel and their hypoDD.reloc files are gathered
+into one comparison table.
+
+Variants are given as a JSON list, e.g.
+
+    [{"name": "original", "station_file": "STATION0.hyp"},
+     {"name": "velest", "station_file": "Velest_models/STATION0.hyp",
+      "vp_vs_ratio": 1.75},
+     {"name": "cc_heavy", "weighting": [
+         "4 1.0 0.5 -999 -999 0.01 0.005 -999 -999 30",
+         "4 1.0 0.5 6 -999 0.01 0.005 6 -999 30"]}]
+
+station_file models are converted as in setup_velocity_model.py; "layers"
+gives [layer top, vp] pairs in the same units directly.
+"""
+import os
+import re
+import csv
+import json
+import math
+import time
+import shutil
+import argparse
+import subprocess
+from statistics import median
+from concurrent.futures import ThreadPoolExecutor
+
+from setup_velocity_model import extract_velocity_model_from_station_hyp
+
+WORKING_DIR = "hypodd_working"
+KM_PER_DEGREE = 111.19
+
+
+# --- hypoDD.inp -----------------------------------------------------------
+
+def data_line_indices(lines):
+    """
+    Positions of the non-comment lines, which getinp.f counts
+    """
+    return [i for i, line in enumerate(lines)
+            if not (line[:1] == "*" or line[1:2] == "*")]
+
+
+def _model_position(lines):
+    data = data_line_indices(lines)
+    # Line 12: ISTART ISOLV NITER, followed by NITER weighting lines
+    niter = int(lines[data[11]].split()[2])
+    return data, niter
+
+
+def set_weighting(lines, weighting):
+    """
+    Replace the iteration weighting lines and their count
+    """
+    data, niter = _model_position(lines)
+    lines = list(lines)
+    istart, isolv = lines[data[11]].split()[:2]
+    lines[data[11]] = f"{istart} {isolv} {len(weighting)}"
+    first = data[12]
+    last = data[11 + niter] if niter else data[11]
+    lines[first:last + 1] = list(weighting)
+    return lines
+
+
+def set_velocity_model(lines, layer_tops, vp_vs_ratio):
+    """
+    Replace the layered model. layer_tops are (top, vp) tuples as
+    returned by extract_velocity_model_from_station_hyp; they are written
+    sorted like setup_hypodd_velocity_model hands them to the relocator.
+    """
+    data, niter = _model_position(lines)
+    layer_tops = sorted(layer_tops, key=lambda x: x[0])
+    lines = list(lines)
+    lines[data[12 + niter]] = f"{len(layer_tops)} {vp_vs_ratio}"
+    lines[data[13 + niter]] = " ".join(str(float(top)) for top, _ in layer_tops)
+    lines[data[14 + niter]] = " ".join(str(float(vp)) for _, vp in layer_tops)
+    return lines
+
+
+def input_file_names(lines):
+    """
+    dt.cc, dt.ct, event and station file names of a hypoDD.inp
+    """
+    data = data_line_indices(lines)
+    return [lines[i].strip() for i in data[:4]]
+
+
+# --- running ----------------------------------------------------------------
+
+def _safe_name(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+def _link(source, dest):
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.symlink(os.path.abspath(source), dest)
+    except OSError:
+        shutil.copy2(source, dest)
+
+
+def prepare_variant(variant, base_lines, working_dir=WORKING_DIR):
+    """
+    Create the run directory of one variant and return its path
+    """
+    lines = base_lines
+    if variant.get("inp_file"):
+        with open(variant["inp_file"], "r") as f:
+            lines = f.read().splitlines()
+    vp_vs_ratio = variant.get("vp_vs_ratio")
+    layer_tops = variant.get("layers")
+    if variant.get("station_file"):
+        layer_tops = extract_velocity_model_from_station_hyp(variant["station_file"])
+        if not layer_tops:
+            raise ValueError(f"No velocity model in {variant['station_file']}")
+    if layer_tops or vp_vs_ratio:
+        data, niter = _model_position(lines)
+        if not layer_tops:
+            tops = lines[data[13 + niter]].split()
+            vps = lines[data[14 + niter]].split()
+            layer_tops = list(zip(map(float, tops), map(float, vps)))
+        if not vp_vs_ratio:
+            vp_vs_ratio = float(lines[data[12 + niter]].split()[1])
+        lines = set_velocity_model(lines, layer_tops, vp_vs_ratio)
+    if variant.get("weighting"):
+        lines = set_weighting(lines, variant["weighting"])
+
+    run_dir = os.path.join(working_dir, "sweep", _safe_name(variant["name"]))
+    os.makedirs(run_dir, exist_ok=True)
+    for name in input_file_names(lines):
+        source = os.path.join(working_dir, "input_files", name)
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"{source} is missing; run the relocator once first")
+        _link(source, os.path.join(run_dir, name))
+    with open(os.path.join(run_dir, "hypoDD.inp"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return run_dir
+
+
+def run_variant(run_dir, hypodd_bin):
+    """
+    Run hypoDD in a variant directory; returns (returncode, seconds)
+    """
+    t0 = time.perf_counter()
+    with open(os.path.join(run_dir, "hypoDD.out"), "w") as out:
+        result = subprocess.run([os.path.abspath(hypodd_bin), "hypoDD.inp"],
+                                cwd=run_dir, stdout=out, stderr=subprocess.STDOUT)
+    return result.returncode, time.perf_counter() - t0
+
+
+# --- comparison ---------------------------------------------------------------
+
+def _float(value):
+    # Fortran writes ****** for values that overflow their field
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def read_reloc(filename):
+    """
+    {event id: (lat, lon, depth, rms_cc, rms_ct)} from a hypoDD.reloc
+    """
+    locations = {}
+    if not os.path.exists(filename):
+        return locations
+    with open(filename, "r") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 23:
+                continue
+            locations[int(parts[0])] = (float(parts[1]), float(parts[2]),
+                                        float(parts[3]), _float(parts[21]),
+                                        _float(parts[22]))
+    return locations
+
+
+def location_shift(a, b):
+    """
+    Horizontal and vertical distance in km between two (lat, lon, depth)
+    """
+    dx = (b[1] - a[1]) * KM_PER_DEGREE * math.cos(math.radians((a[0] + b[0]) / 2.0))
+    dy = (b[0] - a[0]) * KM_PER_DEGREE
+    return math.hypot(dx, dy), b[2] - a[2]
+
+
+def compare_relocations(results, reference):
+    """
+    Summary row per variant; shifts are medians over the events also
+    relocated by the reference variant
+    """
+    ref = results[reference]["locations"]
+    rows = []
+    for name, result in results.items():
+        locations = result["locations"]
+        common = [ev for ev in locations if ev in ref]
+        shifts = [location_shift(ref[ev], locations[ev]) for ev in common]
+        rms_cc = [loc[3] for loc in locations.values() if loc[3] > -9]
+        rms_ct = [loc[4] for loc in locations.values() if loc[4] > -9]
+        rows.append({
+            "variant": name,
+            "status": result["status"],
+            "seconds": round(result["seconds"], 2),
+            "relocated": len(locations),
+            "median_rms_cc": median(rms_cc) if rms_cc else None,
+            "median_rms_ct": median(rms_ct) if rms_ct else None,
+            "median_horizontal_shift_km": median(s[0] for s in shifts) if shifts else None,
+            "median_depth_shift_km": median(s[1] for s in shifts) if shifts else None,
+        })
+    return rows
+
+
+def write_event_table(results, filename):
+    """
+    One row per event with the location of every variant
+    """
+    names = list(results)
+    events = sorted({ev for r in results.values() for ev in r["locations"]})
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["event_id"] + [f"{n}_{c}" for n in names
+                                        for c in ("lat", "lon", "depth")])
+        for ev in events:
+            row = [ev]
+            for name in names:
+                loc = results[name]["locations"].get(ev)
+                row += list(loc[:3]) if loc else ["", "", ""]
+            writer.writerow(row)
+
+
+def run_sweep(variants, working_dir=WORKING_DIR, jobs=None, table_file=None):
+    """
+    Relocate every variant in parallel and return the summary rows; the
+    first variant is the reference for the location shifts
+    """
+    with open(os.path.join(working_dir, "input_files", "hypoDD.inp"), "r") as f:
+        base_lines = f.read().splitlines()
+    hypodd_bin = os.path.join(working_dir, "bin", "hypoDD")
+    if not os.path.exists(hypodd_bin):
+        raise FileNotFoundError(f"{hypodd_bin} not found; run the relocator once first")
+
+    run_dirs = {v["name"]: prepare_variant(v, base_lines, working_dir) for v in variants}
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        futures = {name: executor.submit(run_variant, run_dir, hypodd_bin)
+                   for name, run_dir in run_dirs.items()}
+        results = {}
+        for name, future in futures.items():
+            returncode, seconds = future.result()
+            locations = read_reloc(os.path.join(run_dirs[name], "hypoDD.reloc"))
+            # hypoDD stops with status 0 on most input errors
+            if returncode:
+                status = f"exit {returncode}"
+            else:
+                status = "ok" if locations else "failed"
+            results[name] = {"status": status, "seconds": seconds,
+                             "locations": locations}
+
+    rows = compare_relocations(results, variants[0]["name"])
+    if table_file:
+        write_event_table(results, table_file)
+    return rows
+
+
+def print_summary(rows):
+    print("Variant          | status | time s | reloc | rms cc | rms ct | dH km | dZ km")
+    for r in rows:
+        def fmt(value, spec):
+            return format(value, spec) if value is not None else "-".rjust(6)
+        print(f"{r['variant'][:16]:16s} | {r['status']:6s} | {r['seconds']:6.1f} | "
+              f"{r['relocated']:5d} | {fmt(r['median_rms_cc'], '6.3f')} | "
+              f"{fmt(r['median_rms_ct'], '6.3f')} | "
+              f"{fmt(r['median_horizontal_shift_km'], '5.2f')} | "
+              f"{fmt(r['median_depth_shift_km'], '5.2f')}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Relocate with several velocity models from one dt.ct/dt.cc")
+    parser.add_argument("config", help="JSON list of variants")
+    parser.add_argument("--working-dir", default=WORKING_DIR)
+    parser.add_argument("--jobs", type=int, help="parallel hypoDD runs")
+    parser.add_argument("--table", default="velocity_sweep.csv",
+                        help="per-event comparison table (CSV)")
+    parser.add_argument("--summary", help="also write the summary rows as JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.config, "r") as f:
+        variants = json.load(f)
+    rows = run_sweep(variants, args.working_dir, args.jobs, args.table)
+    print_summary(rows)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
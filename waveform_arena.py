@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Shared-memory store of filtered pick windows for multi-process correlation.
+
+The parent reads and filters every pick window once and packs all samples
+into one multiprocessing.shared_memory block, with an offset index keyed by
+(pick id, component). Worker processes attach to the block and correlate
+through NumPy views on it, so no window is copied or re-read per worker
+and total memory stays close to one copy of the windows regardless of the
+number of workers.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from obspy import Trace, UTCDateTime
+
+from cc_pipeline import (DEFAULT_CC_PARAMS, pair_jobs, load_windows,
+                         correlate_pick_pair, differential_time)
+
+DTYPE = np.float64
+
+
+class WaveformArena:
+    """
+    Filtered windows in one shared memory block.
+
+    index maps (pick_id, component) to (offset, npts, sampling_rate,
+    starttime timestamp, trace id); offsets are in samples.
+    """
+
+    def __init__(self, shm, index, owner):
+        self.shm = shm
+        self.index = index
+        self.owner = owner
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def nbytes(self):
+        return self.shm.size
+
+    @classmethod
+    def create(cls, windows):
+        """
+        Pack {pick_id: {component: Trace}} into a new shared memory block
+        """
+        index = {}
+        offset = 0
+        for pick_id, window in windows.items():
+            for component, tr in window.items():
+                index[(pick_id, component)] = (
+                    offset, tr.stats.npts, tr.stats.sampling_rate,
+                    tr.stats.starttime.timestamp, tr.id)
+                offset += tr.stats.npts
+        size = max(offset, 1) * np.dtype(DTYPE).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        data = np.ndarray((max(offset, 1),), dtype=DTYPE, buffer=shm.buf)
+        for pick_id, window in windows.items():
+            for component, tr in window.items():
+                start, npts = index[(pick_id, component)][:2]
+                data[start:start + npts] = tr.data
+        del data
+        return cls(shm, index, owner=True)
+
+    @classmethod
+    def attach(cls, name, index):
+        """
+        Attach to an arena created by another process
+        """
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13; pool workers share the parent's resource
+            # tracker, so registering the block again is harmless.
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, index, owner=False)
+
+    def view(self, pick_id, component):
+        """
+        Zero-copy NumPy view of one window, None if it is not stored
+        """
+        entry = self.index.get((pick_id, component))
+        if entry is None:
+            return None
+        offset, npts = entry[:2]
+        return np.ndarray((npts,), dtype=DTYPE, buffer=self.shm.buf,
+                          offset=offset * np.dtype(DTYPE).itemsize)
+
+    def window(self, pick_id, components):
+        """
+        {component: Trace} for a pick, the Trace data being arena views
+        """
+        window = {}
+        for component in components:
+            entry = self.index.get((pick_id, component))
+            if entry is None:
+                continue
+            _, _, sampling_rate, starttime, trace_id = entry
+            network, station, location, channel = trace_id.split(".")
+            window[component] = Trace(data=self.view(pick_id, component), header={
+                "network": network, "station": station, "location": location,
+                "channel": channel, "sampling_rate": sampling_rate,
+                "starttime": UTCDateTime(starttime)})
+        return window
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# --- worker side ---------------------------------------------------------
+
+_worker = {}
+
+
+def _init_worker(name, index, cc_params):
+    _worker["arena"] = WaveformArena.attach(name, index)
+    _worker["cc_params"] = cc_params
+
+
+def _correlate_pairs(chunk):
+    """
+    Correlate a chunk of event pairs inside a worker process.
+
+    chunk holds (ev1, ev2, event_1, event_2, jobs) with only the fields
+    needed for the differential times.
+    """
+    arena = _worker["arena"]
+    cc_params = _worker["cc_params"]
+    results = []
+    for ev1, ev2, event_1, event_2, jobs in chunk:
+        records = []
+        failed = 0
+        for pick_1, pick_2, weighting in jobs:
+            components = [c for c, w in weighting.items() if w]
+            result = correlate_pick_pair(
+                pick_1, arena.window(pick_1["id"], components),
+                pick_2, arena.window(pick_2["id"], components),
+                weighting, cc_params)
+            if result is None:
+                failed += 1
+                continue
+            correction, coeff = result
+            dt = differential_time(event_1, pick_1, event_2, pick_2, correction)
+            records.append((pick_1["station_id"], dt, coeff, pick_1["phase"]))
+        results.append((ev1, ev2, records, len(jobs), failed))
+    return results
+
+
+# --- parent side ---------------------------------------------------------
+
+def _slim_event(event):
+    return {"origin_time": event["origin_time"]}
+
+
+def correlate_with_processes(events, event_pairs, waveform_index, store,
+                             cc_params=None, processes=None, chunk_size=50,
+                             io_threads=4, loaded_windows=None):
+    """
+    Correlate all event pairs not yet in the store with a process pool
+    sharing one WaveformArena, and return metrics. Windows in
+    loaded_windows are not read again.
+    """
+    cc_params = dict(DEFAULT_CC_PARAMS, **(cc_params or {}))
+    processes = processes or os.cpu_count()
+    t_start = time.perf_counter()
+
+    todo = []
+    picks = {}
+    for ev1, ev2 in event_pairs:
+        if store.is_done(ev1, ev2):
+            continue
+        jobs = pair_jobs(events[ev1 - 1], events[ev2 - 1], cc_params)
+        for pick_1, pick_2, _ in jobs:
+            picks[pick_1["id"]] = pick_1
+            picks[pick_2["id"]] = pick_2
+        todo.append((ev1, ev2, _slim_event(events[ev1 - 1]),
+                     _slim_event(events[ev2 - 1]), jobs))
+
+    windows = load_windows(list(picks.values()), waveform_index, cc_params,
+                           io_threads=io_threads, loaded_windows=loaded_windows)
+    t_loaded = time.perf_counter()
+    arena = WaveformArena.create(windows)
+    del windows
+
+    counts = {"pairs": 0, "pick_pairs": 0, "failed_pick_pairs": 0}
+    try:
+        chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(arena.name, arena.index, cc_params)) as executor:
+            for results in executor.map(_correlate_pairs, chunks):
+                for ev1, ev2, records, n_jobs, failed in results:
+                    store.add_pair(ev1, ev2, records)
+                    counts["pairs"] += 1
+                    counts["pick_pairs"] += n_jobs
+                    counts["failed_pick_pairs"] += failed
+        store.checkpoint()
+        arena_mb = arena.nbytes / 2**20
+    finally:
+        arena.close()
+
+    elapsed = time.perf_counter() - t_start
+    return {
+        "elapsed_seconds": elapsed,
+        "load_seconds": t_loaded - t_start,
+        "pairs_per_second": counts["pairs"] / elapsed if elapsed else None,
+        "processes": processes,
+        "picks": len(picks),
+        "arena_mb": arena_mb,
+        "counts": counts,
+    }
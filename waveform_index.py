@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Coarse time index of a SEISAN waveform archive built from file names only.
+
+SEISAN names its waveform files after their start time, e.g.
+2016-08-15-1124-26M.arct__039, and stores them as WAV/<BASE>/<YYYY>/<MM>/.
+The index below uses just that information, so no file is opened until a
+pick actually needs it.
+"""
+import os
+import re
+import bisect
+import json
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+
+# 2016-08-15-1124-26M.arct__039  ->  2016-08-15 11:24:26
+SEISAN_NAME_PATTERN = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})-(\d{2})(\d{2})-(\d{2})[A-Z]?\.')
+
+# SEISAN event waveform files are a few minutes long; this is the longest
+# file we expect, used to decide how far back a file may start and still
+# cover a pick.
+DEFAULT_MAX_FILE_LENGTH = 600.0
+
+
+def parse_seisan_filename(filename):
+    """
+    Return the start time encoded in a SEISAN waveform file name,
+    or None if the name does not follow the SEISAN convention
+    """
+    m = SEISAN_NAME_PATTERN.match(os.path.basename(filename))
+    if not m:
+        return None
+    yr, mo, dy, hr, mi, sec = map(int, m.groups())
+    try:
+        return datetime(yr, mo, dy, hr, mi, sec)
+    except ValueError:
+        return None
+
+
+def parse_time(value):
+    """
+    Parse the ISO-like time strings written by nordic2quakeml.py
+    (which may look like 2016-08-03T07:36:5.5Z)
+    """
+    m = re.match(r'(\d{4})-(\d{2})-(\d{2})T(\d{1,2}):(\d{1,2}):(\d{1,2}(?:\.\d*)?)',
+                 value.strip())
+    if not m:
+        raise ValueError(f"Cannot parse time: {value}")
+    yr, mo, dy, hr, mi = map(int, m.groups()[:5])
+    sec = float(m.group(6))
+    return datetime(yr, mo, dy, hr, mi) + timedelta(seconds=sec)
+
+
+def _month_range(start, end):
+    """
+    Yield (year, month) for every month touched by [start, end]
+    """
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield year, month
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+
+class WaveformIndex:
+    """
+    Start-time index over SEISAN waveform files.
+
+    Files can come from flat directories (like waveforms/) or from a
+    WAV/<BASE>/<YYYY>/<MM>/ archive. Archive months are only listed the
+    first time a query touches them.
+    """
+
+    def __init__(self, max_file_length=DEFAULT_MAX_FILE_LENGTH):
+        self.max_file_length = timedelta(seconds=max_file_length)
+        self._starts = []
+        self._files = []
+        self._month_dirs = {}
+        self._loaded_months = set()
+        self.unparsed_files = []
+
+    def __len__(self):
+        return len(self._files)
+
+    def _extend(self, entries):
+        """
+        Add many (start, path) entries at once and keep the index sorted
+        """
+        merged = sorted(list(zip(self._starts, self._files)) + list(entries))
+        self._starts = [s for s, _ in merged]
+        self._files = [f for _, f in merged]
+
+    def add_files(self, filenames):
+        """
+        Add individual waveform files to the index
+        """
+        entries = []
+        for filename in filenames:
+            start = parse_seisan_filename(filename)
+            if start is None:
+                self.unparsed_files.append(filename)
+            else:
+                entries.append((start, filename))
+        self._extend(entries)
+
+    def add_directory(self, directory):
+        """
+        Add every file of a flat directory (e.g. the staged waveforms/ folder)
+        """
+        filenames = [os.path.join(directory, f) for f in os.listdir(directory)]
+        self.add_files(f for f in filenames if os.path.isfile(f))
+
+    def add_archive(self, archive_root):
+        """
+        Register a SEISAN WAV/<BASE> directory laid out as <YYYY>/<MM>/.
+        Only the directory names are read here; the files of a month are
+        listed when a query first needs that month.
+        """
+        for year in os.listdir(archive_root):
+            year_path = os.path.join(archive_root, year)
+            if not (year.isdigit() and len(year) == 4 and os.path.isdir(year_path)):
+                continue
+            for month in os.listdir(year_path):
+                month_path = os.path.join(year_path, month)
+                if month.isdigit() and os.path.isdir(month_path):
+                    key = (int(year), int(month))
+                    self._month_dirs.setdefault(key, []).append(month_path)
+
+    def add_manifest(self, manifest_file):
+        """
+        Add the files listed in a staging manifest written by
+        copy_mseed_files.stage_mseed_files
+        """
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+        entries = []
+        for entry in manifest['files']:
+            if entry.get('start_time'):
+                entries.append((parse_time(entry['start_time']), entry['path']))
+            else:
+                self.unparsed_files.append(entry['path'])
+        self._extend(entries)
+
+    def _load_months(self, start, end):
+        entries = []
+        for key in _month_range(start, end):
+            if key in self._loaded_months or key not in self._month_dirs:
+                continue
+            self._loaded_months.add(key)
+            for month_path in self._month_dirs[key]:
+                for f in os.listdir(month_path):
+                    path = os.path.join(month_path, f)
+                    file_start = parse_seisan_filename(f)
+                    if file_start is not None:
+                        entries.append((file_start, path))
+        if entries:
+            self._extend(entries)
+
+    def files_between(self, start, end):
+        """
+        Return all files that may contain data between start and end,
+        i.e. files starting in [start - max_file_length, end]
+        """
+        earliest = start - self.max_file_length
+        if self._month_dirs:
+            self._load_months(earliest, end)
+        lo = bisect.bisect_left(self._starts, earliest)
+        hi = bisect.bisect_right(self._starts, end)
+        return self._files[lo:hi]
+
+    def files_for_pick(self, pick_time, time_before, time_after):
+        """
+        Return the candidate files for the window around a single pick
+        """
+        return self.files_between(pick_time - timedelta(seconds=time_before),
+                                  pick_time + timedelta(seconds=time_after))
+
+    def files_for_picks(self, pick_times, time_before, time_after):
+        """
+        Return the sorted union of candidate files for many picks
+        """
+        selected = set()
+        for pick_time in pick_times:
+            selected.update(self.files_for_pick(pick_time, time_before, time_after))
+        return sorted(selected)
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def read_quakeml_pick_times(quakeml_file):
+    """
+    Read all pick times from a QuakeML file without going through ObsPy.
+    Works for both the namespaced and the fixed (fix_quakeml.py) files.
+    """
+    pick_times = []
+    for _, elem in ET.iterparse(quakeml_file):
+        tag = _local_name(elem.tag)
+        if tag == 'pick':
+            for child in elem:
+                if _local_name(child.tag) != 'time':
+                    continue
+                for value in child:
+                    if _local_name(value.tag) == 'value' and value.text:
+                        pick_times.append(parse_time(value.text))
+            elem.clear()
+        elif tag == 'event':
+            elem.clear()
+    return pick_times
+
+
+if __name__ == '__main__':
+    index = WaveformIndex()
+    if os.path.exists('waveforms'):
+        index.add_directory('waveforms')
+    print(f"Indexed files: {len(index)}")
+    print(f"Files without a SEISAN start time: {len(index.unparsed_files)}")
+    pick_times = read_quakeml_pick_times('hypoDD_quakeml_fixed.xml')
+    selected = index.files_for_picks(pick_times, 2.0, 2.0)
+    print(f"Picks: {len(pick_times)}")
+    print(f"Files within a pick window: {len(selected)}")